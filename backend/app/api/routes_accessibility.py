@@ -5,14 +5,17 @@ from app.schemas.accessibility_schema import (
     CheckTemplateRequest, CheckTemplateResponse
 )
 from app.services.accessibility_service import add_alt_text, check_color, check_template
+from app.services.llm_gateway import LLMTimeoutError
 
 router = APIRouter(prefix="/accessibility", tags=["Accessibility & Compliance"])
 
 @router.post("/add-alt-text", response_model=AddAltTextResponse)
-def add_alt_text_endpoint(req: AddAltTextRequest):
+async def add_alt_text_endpoint(req: AddAltTextRequest):
     try:
-        alt = add_alt_text(req)
+        alt = await add_alt_text(req)
         return {"alt_text": alt}
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
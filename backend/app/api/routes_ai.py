@@ -3,22 +3,46 @@ from app.schemas.ai_schema import (
     GenerateLatexRequest, GenerateLatexResponse,
     ExplainLatexRequest, ExplainLatexResponse
 )
-from app.services.ai_service import generate_latex, explain_latex
+from app.services.ai_service import generate_latex, explain_latex, stream_generate_latex, stream_explain_latex
+from app.services.llm_gateway import LLMTimeoutError
+from app.core.sse import sse_response, sse_json_response
+from app.schemas.batch_schema import BatchRequest
+from app.services.batch_service import run_batch
 
 router = APIRouter(prefix="/ai", tags=["AI"])
 
 @router.post("/generate-latex", response_model=GenerateLatexResponse)
-def generate_latex_endpoint(request: GenerateLatexRequest):
+async def generate_latex_endpoint(request: GenerateLatexRequest):
     try:
-        result = generate_latex(request)
+        result = await generate_latex(request)
         return {"latex": result}
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/explain-latex", response_model=ExplainLatexResponse)
-def explain_latex_endpoint(request: ExplainLatexRequest):
+async def explain_latex_endpoint(request: ExplainLatexRequest):
     try:
-        result = explain_latex(request)
+        result = await explain_latex(request)
         return {"explanation": result}
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/generate-latex/stream")
+async def generate_latex_stream_endpoint(request: GenerateLatexRequest):
+    return sse_response(stream_generate_latex(request))
+
+@router.post("/explain-latex/stream")
+async def explain_latex_stream_endpoint(request: ExplainLatexRequest):
+    return sse_response(stream_explain_latex(request))
+
+@router.post("/batch")
+async def batch_endpoint(request: BatchRequest):
+    """
+    Run many AI tasks in one request. Results are streamed as Server-Sent Events
+    in completion order, one `data:` event per task (see BatchItemResult).
+    """
+    return sse_json_response(run_batch(request))
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Request
 from fastapi.responses import RedirectResponse
-from supabase import create_client, Client
 import os
+from functools import lru_cache
 from app.db import crud
 from app.core.config import settings
 
@@ -12,13 +12,17 @@ SUPABASE_KEY = settings.SUPABASE_ANON_KEY
 FRONTEND_URL = os.getenv("FRONTEND_URL", "https://ai-latex-editor.vercel.app")
 BACKEND_URL = os.getenv("BACKEND_URL", "https://ai-latex-editor.onrender.com")
 
-supabase: Client = create_client(supabase_url=SUPABASE_URL, supabase_key=SUPABASE_KEY)
+@lru_cache(maxsize=1)
+def get_supabase():
+    """Supabase client, created on first sign-in (the SDK is slow to import)."""
+    from supabase import create_client
+    return create_client(supabase_url=SUPABASE_URL, supabase_key=SUPABASE_KEY)
 
 @router.get("/signin/{provider}")
 def signin(provider: str, request: Request):
     # Always redirect back to backend callback
     redirect_to = f"{BACKEND_URL}/auth/callback"
-    res = supabase.auth.sign_in_with_oauth({
+    res = get_supabase().auth.sign_in_with_oauth({
         "provider": provider,
         "options": {
             "redirect_to": redirect_to,
@@ -34,7 +38,7 @@ def callback(request: Request):
         return {"error": "No auth code provided"}
 
     # Exchange code for session
-    res = supabase.auth.exchange_code_for_session({"auth_code": code})
+    res = get_supabase().auth.exchange_code_for_session({"auth_code": code})
     session = res.session
     user = session.user
 
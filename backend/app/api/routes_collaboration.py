@@ -1,38 +1,93 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Literal, Optional
 from app.schemas.collaboration_schema import (
     DiffRequest, DiffResponse,
     MergeRequest, MergeResponse,
     SummarizeChangesRequest, SummarizeChangesResponse,
+    RevisionInfo, RevisionDiffResponse, RevisionSummaryResponse,
     CommentRequest, CommentResponse
 )
 from app.services.collaboration_service import (
-    generate_diff, merge_versions, summarize_changes,
-    add_comment, get_comments_for_doc, delete_comment_by_id
+    generate_diff, merge_versions, summarize_changes, stream_summarize_changes,
+    get_revisions_for_doc, diff_revisions, summarize_revisions,
+    add_comment, get_comments_for_doc, count_comments_for_docs, delete_comment_by_id
 )
+from app.services.llm_gateway import LLMTimeoutError
+from app.core.sse import sse_response
 
 router = APIRouter(prefix="/collaboration", tags=["Collaboration"])
 
 @router.post("/diff", response_model=DiffResponse)
 def diff_endpoint(req: DiffRequest):
     try:
-        diff = generate_diff(req)
-        return {"diff": diff}
+        return generate_diff(req)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/merge", response_model=MergeResponse)
-def merge_endpoint(req: MergeRequest):
+async def merge_endpoint(req: MergeRequest):
     try:
-        merged, conflicts = merge_versions(req)
+        merged, conflicts = await merge_versions(req)
         return {"merged_text": merged, "conflicts": conflicts}
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/summarize-changes", response_model=SummarizeChangesResponse)
-def summarize_changes_endpoint(req: SummarizeChangesRequest):
+async def summarize_changes_endpoint(req: SummarizeChangesRequest):
     try:
-        summary = summarize_changes(req)
+        summary = await summarize_changes(req)
         return {"summary": summary}
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/summarize-changes/stream")
+async def summarize_changes_stream_endpoint(req: SummarizeChangesRequest):
+    return sse_response(stream_summarize_changes(req))
+
+@router.get("/documents/{doc_id}/revisions", response_model=List[RevisionInfo])
+def revisions_endpoint(doc_id: int, supabase_uid: str):
+    try:
+        return get_revisions_for_doc(doc_id, supabase_uid)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/documents/{doc_id}/diff", response_model=RevisionDiffResponse)
+def revision_diff_endpoint(
+    doc_id: int,
+    supabase_uid: str,
+    from_revision: int,
+    to_revision: Optional[int] = None,
+    granularity: Literal["line", "word", "latex"] = "line",
+    algorithm: Literal["histogram", "patience", "myers"] = "histogram",
+    format: Literal["unified", "json"] = "unified",
+    context: int = Query(3, ge=0, le=100),
+    time_budget_ms: Optional[int] = Query(500, ge=1),
+):
+    try:
+        return diff_revisions(
+            doc_id, supabase_uid, from_revision, to_revision,
+            granularity=granularity, algorithm=algorithm, format=format,
+            context=context, time_budget_ms=time_budget_ms,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/documents/{doc_id}/summarize-changes", response_model=RevisionSummaryResponse)
+async def revision_summary_endpoint(
+    doc_id: int, supabase_uid: str, from_revision: int, to_revision: Optional[int] = None
+):
+    try:
+        return await summarize_revisions(doc_id, supabase_uid, from_revision, to_revision)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -45,10 +100,26 @@ def comment_endpoint(req: CommentRequest):
         raise HTTPException(status_code=404, detail=str(e))
 
 @router.get("/comments/{document_id}")
-def get_comments_endpoint(document_id: int):
+def get_comments_endpoint(
+    document_id: int,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+):
+    try:
+        comments, next_cursor = get_comments_for_doc(document_id, start_line, end_line, cursor, limit)
+        return {"document_id": document_id, "comments": comments, "next_cursor": next_cursor}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/comment-counts")
+def comment_counts_endpoint(document_ids: List[int] = Query(...)):
     try:
-        comments = get_comments_for_doc(document_id)
-        return {"document_id": document_id, "comments": comments}
+        counts = count_comments_for_docs(document_ids)
+        return {"counts": counts}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -5,6 +5,7 @@ from app.schemas.compile_schema import (
 )
 from app.services.compile_service import compile_latex
 from app.services.error_service import fix_errors
+from app.services.llm_gateway import LLMTimeoutError
 
 router = APIRouter(prefix="/compile", tags=["Compile"])
 
@@ -17,9 +18,11 @@ def compile_document(request: CompileRequest):
         return {"pdf_base64": None, "error_log": error_log}
 
 @router.post("/fix-errors", response_model=FixErrorResponse)
-def fix_document_errors(request: FixErrorRequest):
+async def fix_document_errors(request: FixErrorRequest):
     try:
-        result = fix_errors(request)
+        result = await fix_errors(request)
         return result
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
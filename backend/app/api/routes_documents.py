@@ -1,33 +1,91 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+import hashlib
+from fastapi import APIRouter, HTTPException, Depends, Header, Response
+from typing import List, Optional
 from app.schemas.document_schema import Document, DocumentCreate, DocumentUpdate
 from app.db import crud
 from app.core.auth import verify_token  # use JWT to get user info
 
 router = APIRouter(prefix="/documents", tags=["Documents"])
 
+def _etag(version: int) -> str:
+    return f'"v{version}"'
+
+def _list_etag(versions: List[tuple]) -> str:
+    digest = hashlib.sha1(
+        ",".join(f"{doc_id}:{version}" for doc_id, version in versions).encode()
+    ).hexdigest()
+    return f'"l{digest[:16]}"'
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    """
+    Check an If-None-Match header value against an ETag (weak comparison).
+    Handles "*", comma-separated lists and weak (W/) validators.
+    """
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
 @router.post("/", response_model=Document)
-def create_doc(doc: DocumentCreate):
+def create_doc(doc: DocumentCreate, response: Response):
     doc_id = crud.create_document(doc.title, doc.content, doc.supabase_uid)
-    return {"id": doc_id, "title": doc.title, "content": doc.content, "supabase_uid": doc.supabase_uid}
+    response.headers["ETag"] = _etag(1)
+    return {"id": doc_id, "title": doc.title, "content": doc.content, "supabase_uid": doc.supabase_uid, "version": 1}
 
 @router.get("/{doc_id}", response_model=Document)
-def read_doc(doc_id: int, supabase_uid: str):
+def read_doc(doc_id: int, supabase_uid: str, response: Response, if_none_match: Optional[str] = Header(None)):
+    if if_none_match:
+        # Cheap version lookup first: most conditional reads end here with a 304
+        version = crud.get_document_version(doc_id, supabase_uid)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Document not found or access denied")
+        if _etag_matches(if_none_match, _etag(version)):
+            return Response(status_code=304, headers={"ETag": _etag(version)})
+
     document = crud.get_document(doc_id,supabase_uid)
     if not document:
         raise HTTPException(status_code=404, detail="Document not found or access denied")
+    response.headers["ETag"] = _etag(document["version"])
     return document
 
 @router.get("/", response_model=List[Document])
-def read_all_docs(supabase_uid: str):
+def read_all_docs(supabase_uid: str, response: Response, if_none_match: Optional[str] = Header(None)):
+    etag = _list_etag(crud.get_document_versions(supabase_uid))
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return crud.get_all_documents(supabase_uid)
 
 @router.put("/{doc_id}", response_model=Document)
-def update_doc(doc_id: int, doc: DocumentUpdate, supabase_uid: str):
-    success = crud.update_document(doc_id, supabase_uid, doc.title, doc.content)
+def update_doc(doc_id: int, doc: DocumentUpdate, supabase_uid: str, response: Response, if_match: Optional[str] = Header(None)):
+    expected_version = None
+    if if_match and if_match.strip() != "*":
+        # Optimistic concurrency: only accept a single ETag we issued
+        tag = if_match.strip()
+        if tag.startswith("W/"):
+            # If-Match uses strong comparison (RFC 9110 13.1.1): weak validators never match
+            raise HTTPException(status_code=412, detail="Precondition failed: weak ETags cannot be used with If-Match")
+        tag = tag.strip('"')
+        if not tag.startswith("v") or not tag[1:].isdigit():
+            raise HTTPException(status_code=412, detail="Precondition failed: unrecognised If-Match value")
+        expected_version = int(tag[1:])
+
+    try:
+        success = crud.update_document(doc_id, supabase_uid, doc.title, doc.content, expected_version)
+    except crud.VersionConflictError as e:
+        raise HTTPException(
+            status_code=412,
+            detail=str(e),
+            headers={"ETag": _etag(e.current_version)},
+        )
     if not success:
         raise HTTPException(status_code=404, detail="Document not found or access denied")
-    return crud.get_document(doc_id, supabase_uid)
+    document = crud.get_document(doc_id, supabase_uid)
+    response.headers["ETag"] = _etag(document["version"])
+    return document
 
 @router.delete("/{doc_id}")
 def delete_doc(doc_id: int, supabase_uid: str):
@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException
+import codecs
+import csv
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import ValidationError
 from app.schemas.figure_schema import (
-    GenerateTableRequest, GenerateTableResponse,
+    TableOptions, GenerateTableRequest, GenerateTableResponse,
     GeneratePlotRequest, GeneratePlotResponse,
     GenerateDiagramRequest, GenerateDiagramResponse
 )
-from app.services.figure_service import generate_table, generate_plot, generate_diagram
+from app.services.figure_service import (
+    generate_table, iter_table, read_csv, generate_plot,
+    generate_diagram, generate_validated_diagram, stream_diagram
+)
+from app.services.artifact_store import artifact_path
+from app.services.llm_gateway import LLMTimeoutError
+from app.core.sse import sse_response
 
 router = APIRouter(prefix="/figures", tags=["Figures & Tables"])
 
@@ -16,18 +26,65 @@ def generate_table_endpoint(req: GenerateTableRequest):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/generate-table/upload")
+def generate_table_upload_endpoint(file: UploadFile = File(...), options: str = Form("{}")):
+    """
+    Stream a LaTeX table from an uploaded CSV file. `options` is a JSON object
+    with the fields of GenerateTableRequest other than csv.
+    """
+    try:
+        opts = TableOptions.model_validate_json(options)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+
+    lines = iter_table(read_csv(codecs.iterdecode(file.file, "utf-8-sig"), opts.delimiter), opts)
+    try:
+        # Reads the header (and validates column selection) before the response starts
+        first = next(lines)
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def body():
+        # Sent in chunks of about 64 KB rather than one per row
+        chunk, size = [first], len(first)
+        for line in lines:
+            chunk.append(line)
+            size += len(line)
+            if size >= 65536:
+                yield "\n".join(chunk) + "\n"
+                chunk, size = [], 0
+        yield "\n".join(chunk) + "\n"
+
+    return StreamingResponse(body(), media_type="text/plain; charset=utf-8")
+
 @router.post("/generate-plot", response_model=GeneratePlotResponse)
 def generate_plot_endpoint(req: GeneratePlotRequest):
     try:
-        latex = generate_plot(req)
-        return {"latex": latex}
+        return generate_plot(req)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/artifacts/{name}")
+def get_artifact_endpoint(name: str):
+    """Download a generated data file, e.g. to bundle it with an exported project."""
+    path = artifact_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    # Content-addressed: a name always refers to the same bytes
+    return FileResponse(path, media_type="text/plain", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
 @router.post("/generate-diagram", response_model=GenerateDiagramResponse)
-def generate_diagram_endpoint(req: GenerateDiagramRequest):
+async def generate_diagram_endpoint(req: GenerateDiagramRequest):
     try:
-        latex = generate_diagram(req)
+        if req.validate_compile:
+            return await generate_validated_diagram(req)
+        latex = await generate_diagram(req)
         return {"latex": latex}
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/generate-diagram/stream")
+async def generate_diagram_stream_endpoint(req: GenerateDiagramRequest):
+    return sse_response(stream_diagram(req))
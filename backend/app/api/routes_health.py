@@ -1,7 +1,36 @@
 from fastapi import APIRouter
+from app.services.llm_gateway import gateway, llm_cache
+from app.services.realtime_service import realtime
+from app.services.math_service import math_pool
+from app.services.compile_service import figure_stats
+from app.services.reference_service import bibtex_cache
 
 router = APIRouter()
 
 @router.get("/health")
 async def health_check():
     return {"status": "ok"}
+
+@router.get("/health/llm-cache")
+def llm_cache_stats():
+    return llm_cache.stats()
+
+@router.get("/health/llm-gateway")
+def llm_gateway_stats():
+    return gateway.stats()
+
+@router.get("/health/realtime")
+def realtime_stats():
+    return realtime.stats()
+
+@router.get("/health/math-workers")
+def math_worker_stats():
+    return math_pool.stats()
+
+@router.get("/health/figure-cache")
+def figure_cache_stats():
+    return figure_stats
+
+@router.get("/health/bibtex-cache")
+def bibtex_cache_stats():
+    return bibtex_cache.stats()
@@ -2,9 +2,11 @@ from fastapi import APIRouter, HTTPException
 from app.schemas.math_schema import (
     VerifyEquationRequest, VerifyEquationResponse,
     DeriveEquationRequest, DeriveEquationResponse,
-    CheckUnitsRequest, CheckUnitsResponse
+    CheckUnitsRequest, CheckUnitsResponse,
+    VerifyDocumentRequest, VerifyDocumentResponse
 )
-from app.services.math_service import verify_equation, derive_equation, check_units
+from app.services.math_service import verify_equation, derive_equation, check_units, verify_document
+from app.services.llm_gateway import LLMTimeoutError
 
 router = APIRouter(prefix="/math", tags=["Math Intelligence"])
 
@@ -12,10 +14,23 @@ router = APIRouter(prefix="/math", tags=["Math Intelligence"])
 def verify_equation_endpoint(request: VerifyEquationRequest):
     return verify_equation(request)
 
+@router.post("/verify-document", response_model=VerifyDocumentResponse)
+async def verify_document_endpoint(request: VerifyDocumentRequest):
+    try:
+        return await verify_document(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/derive-equation", response_model=DeriveEquationResponse)
-def derive_equation_endpoint(request: DeriveEquationRequest):
+async def derive_equation_endpoint(request: DeriveEquationRequest):
     try:
-        return derive_equation(request)
+        return await derive_equation(request)
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,60 @@
+import asyncio
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from app.services.realtime_service import realtime, parse_ops, StaleRevisionError
+
+router = APIRouter(tags=["Realtime"])
+
+@router.websocket("/ws/documents/{doc_id}")
+async def document_socket(websocket: WebSocket, doc_id: int, supabase_uid: str):
+    """
+    Live editing of a document.
+
+    Server -> client: {"type": "snapshot", "content", "revision", "client_id"} on join,
+    then {"type": "op", "revision", "ops", "client_id"} for other clients' edits,
+    {"type": "ack", "revision"} for the client's own edits and {"type": "error", "detail"}
+    (also sent when the document was changed elsewhere and live edits can no longer be saved).
+    A "snapshot" is sent again if the client falls too far behind.
+    Client -> server: {"type": "op", "revision": <revision the ops are based on>, "ops": [...]}.
+    """
+    session, client_id = await realtime.join(doc_id, supabase_uid)
+    if session is None:
+        await websocket.close(code=4404, reason="Document not found or access denied")
+        return
+    await websocket.accept()
+
+    # Peers' edits are queued and sent by a writer task, so a slow client never blocks the others
+    outbox: asyncio.Queue = asyncio.Queue()
+    unsubscribe = realtime.broker.subscribe(
+        session.channel, lambda message: message["client_id"] != client_id and outbox.put_nowait(message)
+    )
+
+    async def send_outbox():
+        while True:
+            await websocket.send_json(await outbox.get())
+
+    def snapshot():
+        return {"type": "snapshot", "content": session.content, "revision": session.revision, "client_id": client_id}
+
+    writer = asyncio.create_task(send_outbox())
+    try:
+        outbox.put_nowait(snapshot())
+        if session.conflict:
+            outbox.put_nowait({"type": "error", "detail": "Document was changed elsewhere; live edits are not saved"})
+        while True:
+            message = await websocket.receive_json()
+            if message.get("type") != "op":
+                outbox.put_nowait({"type": "error", "detail": f"Unknown message type: {message.get('type')}"})
+                continue
+            try:
+                revision = await realtime.apply(session, client_id, message.get("revision"), parse_ops(message.get("ops")))
+                outbox.put_nowait({"type": "ack", "revision": revision})
+            except StaleRevisionError:
+                outbox.put_nowait(snapshot())
+            except (TypeError, ValueError) as e:
+                outbox.put_nowait({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        unsubscribe()
+        writer.cancel()
+        await realtime.leave(session, client_id)
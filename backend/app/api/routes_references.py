@@ -1,19 +1,28 @@
 from fastapi import APIRouter, HTTPException
 from app.schemas.reference_schema import (
     FetchBibtexRequest, FetchBibtexResponse,
+    FetchBibtexBatchRequest, FetchBibtexBatchResponse,
     CheckBibtexRequest, CheckBibtexResponse
 )
-from app.services.reference_service import fetch_bibtex, check_bibtex
+from app.services.reference_service import (
+    BibtexNotFoundError, fetch_bibtex, fetch_bibtex_batch, check_bibtex
+)
 
 router = APIRouter(prefix="/references", tags=["References"])
 
 @router.post("/fetch-bibtex", response_model=FetchBibtexResponse)
-def fetch_bibtex_endpoint(request: FetchBibtexRequest):
+async def fetch_bibtex_endpoint(request: FetchBibtexRequest):
     try:
-        bibtex = fetch_bibtex(request)
-        return {"bibtex": bibtex}
-    except Exception as e:
+        bibtex, cached = await fetch_bibtex(request)
+        return {"bibtex": bibtex, "cached": cached}
+    except (ValueError, BibtexNotFoundError) as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Reference lookup failed: {e}")
+
+@router.post("/fetch-bibtex/batch", response_model=FetchBibtexBatchResponse)
+async def fetch_bibtex_batch_endpoint(request: FetchBibtexBatchRequest):
+    return await fetch_bibtex_batch(request)
 
 @router.post("/check-bibtex", response_model=CheckBibtexResponse)
 def check_bibtex_endpoint(request: CheckBibtexRequest):
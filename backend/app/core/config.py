@@ -1,4 +1,5 @@
 # backend/app/core/config.py
+from typing import Dict, List
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -8,6 +9,64 @@ class Settings(BaseSettings):
     APP_PORT: int = 8000
     GEMINI_API_KEY: str = ""
 
+    # LLM gateway: "gemini" or "stub" (offline backend for development / load tests)
+    LLM_BACKEND: str = "gemini"
+    LLM_STUB_LATENCY_MS: int = 500
+    LLM_MAX_CONCURRENCY: int = 32                   # concurrent upstream calls, all endpoints
+    LLM_DEFAULT_ENDPOINT_CONCURRENCY: int = 8       # concurrent upstream calls per endpoint
+    LLM_ENDPOINT_CONCURRENCY: Dict[str, int] = {}   # per-endpoint overrides
+    LLM_TIMEOUT_SECONDS: float = 60.0               # deadline per call, including queueing
+
+    # Gemini response cache (in-memory LRU over a SQLite file)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_PATH: str = "llm_cache.db"
+    LLM_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    LLM_CACHE_MEMORY_ENTRIES: int = 512
+    LLM_CACHE_MAX_DISK_MB: int = 256
+    LLM_CACHE_DISABLED_ENDPOINTS: List[str] = []   # e.g. ["collaboration.merge"]
+
+    # Number of stored revisions kept per document (older ones are pruned)
+    DOCUMENT_REVISION_LIMIT: int = 50
+    # Live-editing saves closer together than this are merged into one revision
+    DOCUMENT_REVISION_MERGE_SECONDS: int = 300
+
+    # Real-time editing: persist live documents every N ops or T seconds
+    REALTIME_FLUSH_OPS: int = 50
+    REALTIME_FLUSH_SECONDS: float = 2.0
+    REALTIME_HISTORY_LIMIT: int = 1000   # ops kept per document for transforming late edits
+
+    # Symbolic math: worker processes, per-simplification time budget, memo size
+    MATH_WORKERS: int = 2
+    MATH_TIMEOUT_SECONDS: float = 5.0
+    MATH_CACHE_SIZE: int = 1024
+    MATH_RESULT_CACHE_PATH: str = "math_cache.db"  # per-equation results of /math/verify-document
+
+    # Generated tables with more rows than this use longtable/xltabular to break across pages
+    TABLE_LONG_ROWS: int = 40
+    # Plot series are downsampled to this many points per pt of plot width
+    PLOT_POINTS_PER_PT: float = 2.0
+    PLOT_DATA_DIR: str = "plot_data"   # content-addressed plot data files, on TEXINPUTS when compiling
+    PLOT_DATA_MAX_MB: int = 256        # least recently used data files are dropped beyond this
+    PLOT_DATA_MAX_AGE_DAYS: int = 90   # data files unused for longer are dropped
+
+    # Compile: tikzpictures are built once into cached PDFs (keyed by figure + preamble)
+    FIGURE_EXTERNALIZE: bool = True
+    FIGURE_CACHE_DIR: str = "figure_cache"
+    FIGURE_BUILD_WORKERS: int = 0      # parallel figure builds; 0 → one per CPU
+    FIGURE_CACHE_MAX_MB: int = 512     # least recently used figures are dropped beyond this
+    FIGURE_CACHE_MAX_AGE_DAYS: int = 30  # figures unused for longer are dropped
+    FIGURE_FAILURE_TTL_SECONDS: int = 300  # a figure that failed to build is not retried for this long
+
+    # BibTeX lookups: source URLs (overridable, e.g. for a local stub server), pooling and caching
+    BIBTEX_DOI_URL: str = "https://doi.org/"
+    BIBTEX_ARXIV_URL: str = "https://arxiv.org/bibtex/"
+    BIBTEX_CONCURRENCY: int = 8            # concurrent requests per batch, and pooled connections
+    BIBTEX_TIMEOUT_SECONDS: float = 10.0
+    BIBTEX_POOL_TIMEOUT_SECONDS: float = 30.0   # waiting for a free pooled connection
+    BIBTEX_CACHE_PATH: str = "bibtex_cache.db"
+    BIBTEX_CACHE_TTL_SECONDS: int = 30 * 24 * 3600
+    BIBTEX_NEGATIVE_TTL_SECONDS: int = 24 * 3600   # unknown identifiers are retried after this
+
     # ✅ Add Supabase + OAuth keys
     SUPABASE_URL: str
     SUPABASE_ANON_KEY: str
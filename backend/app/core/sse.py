@@ -0,0 +1,43 @@
+import json
+from typing import AsyncIterator
+from fastapi.responses import StreamingResponse
+
+
+def _event(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+async def _sse_events(events: AsyncIterator[dict]) -> AsyncIterator[str]:
+    try:
+        async for data in events:
+            yield _event(data)
+    except Exception as e:
+        # Headers are already sent, so errors are reported in-band
+        yield _event({"detail": str(e)}, event="error")
+        return
+    yield _event({}, event="done")
+
+
+async def _deltas(chunks: AsyncIterator[str]) -> AsyncIterator[dict]:
+    async for chunk in chunks:
+        yield {"delta": chunk}
+
+
+def sse_json_response(events: AsyncIterator[dict]) -> StreamingResponse:
+    """
+    Send a stream of JSON objects as Server-Sent Events (`data: {...}`).
+    The stream ends with a `done` event, or an `error` event carrying {"detail": ...}.
+    """
+    return StreamingResponse(
+        _sse_events(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def sse_response(chunks: AsyncIterator[str]) -> StreamingResponse:
+    """
+    Wrap a stream of text chunks as Server-Sent Events, each sent as `data: {"delta": "..."}`.
+    """
+    return sse_json_response(_deltas(chunks))
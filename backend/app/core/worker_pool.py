@@ -0,0 +1,117 @@
+import multiprocessing
+import queue
+import threading
+from typing import Callable, Optional
+
+
+class WorkerTimeoutError(TimeoutError):
+    """Raised when a task does not finish within its time budget."""
+
+
+def _worker_main(conn):
+    while True:
+        try:
+            fn, args = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            result = (True, fn(*args))
+        except Exception as e:
+            result = (False, e)
+        try:
+            conn.send(result)
+        except Exception as e:
+            # The result or exception could not be pickled
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    Fixed-size pool of worker processes for CPU-heavy tasks that may not
+    terminate in reasonable time. Unlike concurrent.futures, a task that
+    exceeds its time budget has its worker killed and replaced, so runaway
+    work never keeps running in the background.
+
+    Workers are started on first use. Tasks must be picklable module-level
+    functions; run() blocks the calling thread.
+    """
+
+    def __init__(self, size: int = 2, start_method: str = "spawn"):
+        self.size = size
+        self._ctx = multiprocessing.get_context(start_method)
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self.timeouts = 0
+        self.restarts = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            while len(self._workers) < self.size:
+                worker = _Worker(self._ctx)
+                self._workers.append(worker)
+                self._idle.put(worker)
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        replacement = _Worker(self._ctx)
+        with self._lock:
+            self._workers[self._workers.index(worker)] = replacement
+        self.restarts += 1
+        return replacement
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        """
+        Run fn(*args) in a worker process and return its result, re-raising
+        its exception. Raises WorkerTimeoutError if no worker becomes free
+        within `timeout` seconds, or if the task does not finish within
+        `timeout` seconds of starting.
+        """
+        self._ensure_started()
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            self.timeouts += 1
+            raise WorkerTimeoutError(f"No worker became free within {timeout:g}s")
+        finished = True
+        try:
+            worker.conn.send((fn, args))
+            finished = worker.conn.poll(timeout)
+            if finished:
+                ok, value = worker.conn.recv()
+        except (EOFError, OSError):
+            worker = self._replace(worker)
+            raise RuntimeError("Worker process died")
+        finally:
+            if not finished:
+                self.timeouts += 1
+                worker = self._replace(worker)
+            self._idle.put(worker)
+        if not finished:
+            raise WorkerTimeoutError(f"Task did not finish within {timeout:g}s")
+        if not ok:
+            raise value
+        return value
+
+    def shutdown(self):
+        with self._lock:
+            for worker in self._workers:
+                worker.kill()
+            self._workers = []
+            self._idle = queue.Queue()
+
+    def stats(self) -> dict:
+        return {"workers": len(self._workers), "timeouts": self.timeouts, "restarts": self.restarts}
@@ -1,6 +1,75 @@
 import sqlite3
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from app.models.document import DB_PATH
+from app.core.config import settings
+from app.services.diff_engine import remap_lines
+
+def _record_revision(cursor, doc_id: int, version: int, title: str, content: str, checkpoint: bool = True):
+    """
+    Store a snapshot of a document version and prune revisions (and the
+    summaries that reference them) beyond DOCUMENT_REVISION_LIMIT.
+
+    Non-checkpoint revisions (live-editing saves) are coalesced: the previous
+    one is replaced while it is less than DOCUMENT_REVISION_MERGE_SECONDS
+    newer than the revision before it, so a continuous editing session keeps
+    about one revision per window instead of one per save.
+    """
+    if not checkpoint:
+        cursor.execute(
+            "SELECT version, checkpoint, julianday(created_at) FROM document_revisions "
+            "WHERE document_id=? AND version<? ORDER BY version DESC LIMIT 2",
+            (doc_id, version)
+        )
+        previous = cursor.fetchall()
+        if (
+            len(previous) == 2 and not previous[0][1]
+            and (previous[0][2] - previous[1][2]) * 86400 < settings.DOCUMENT_REVISION_MERGE_SECONDS
+        ):
+            cursor.execute(
+                "DELETE FROM document_revisions WHERE document_id=? AND version=?",
+                (doc_id, previous[0][0])
+            )
+    cursor.execute(
+        "INSERT OR IGNORE INTO document_revisions (document_id, version, title, content, checkpoint) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (doc_id, version, title, content, int(checkpoint))
+    )
+    # Versions are sparse once revisions are merged, so the limit counts rows
+    cursor.execute(
+        "DELETE FROM document_revisions WHERE document_id=? AND version NOT IN "
+        "(SELECT version FROM document_revisions WHERE document_id=? ORDER BY version DESC LIMIT ?)",
+        (doc_id, doc_id, settings.DOCUMENT_REVISION_LIMIT)
+    )
+    cursor.execute(
+        "DELETE FROM revision_summaries WHERE document_id=? AND ("
+        "from_version NOT IN (SELECT version FROM document_revisions WHERE document_id=?) OR "
+        "to_version NOT IN (SELECT version FROM document_revisions WHERE document_id=?))",
+        (doc_id, doc_id, doc_id)
+    )
+
+def _remap_comments(cursor, doc_id: int, old_content: str, new_content: str):
+    """
+    Keep comment anchors on the same text after an edit. Comments below the
+    edited region move with one UPDATE; only comments inside it are remapped
+    individually.
+    """
+    first, last, shift, map_line = remap_lines(old_content, new_content)
+    cursor.execute(
+        "SELECT id, line_number FROM comments WHERE document_id=? AND line_number BETWEEN ? AND ?",
+        (doc_id, first, last)
+    )
+    moved = []
+    for comment_id, line in cursor.fetchall():
+        new_line = map_line(line)
+        if new_line != line:
+            moved.append((new_line, comment_id))
+    if shift:
+        cursor.execute(
+            "UPDATE comments SET line_number=line_number+? WHERE document_id=? AND line_number>?",
+            (shift, doc_id, last)
+        )
+    if moved:
+        cursor.executemany("UPDATE comments SET line_number=? WHERE id=?", moved)
 
 def create_document(title: str, content: str, supabase_uid: str) -> int:
     conn = sqlite3.connect(DB_PATH)
@@ -9,8 +78,9 @@ def create_document(title: str, content: str, supabase_uid: str) -> int:
         "INSERT INTO documents (title, content, supabase_uid) VALUES (?, ?, ?)",
         (title, content, supabase_uid)
     )
-    conn.commit()
     doc_id = cursor.lastrowid
+    _record_revision(cursor, doc_id, 1, title, content)
+    conn.commit()
     conn.close()
     return doc_id
 
@@ -18,35 +88,93 @@ def get_document(doc_id: int, supabase_uid: str) -> Optional[dict]:
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute(
-        "SELECT id, title, content, supabase_uid FROM documents WHERE id=? AND supabase_uid=?",
+        "SELECT id, title, content, supabase_uid, version FROM documents WHERE id=? AND supabase_uid=?",
         (doc_id, supabase_uid)
     )
     row = cursor.fetchone()
     conn.close()
-    return {"id": row[0], "title": row[1], "content": row[2], "supabase_uid": row[3]} if row else None
+    return {"id": row[0], "title": row[1], "content": row[2], "supabase_uid": row[3], "version": row[4]} if row else None
+
+def get_document_version(doc_id: int, supabase_uid: str) -> Optional[int]:
+    """
+    Return only the current version of a document, so conditional requests
+    can be answered without loading the content.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT version FROM documents WHERE id=? AND supabase_uid=?",
+        (doc_id, supabase_uid)
+    )
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
 
 def get_all_documents(supabase_uid: str) -> List[dict]:
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute(
-        "SELECT id, title, content, supabase_uid FROM documents WHERE supabase_uid=?",
+        "SELECT id, title, content, supabase_uid, version FROM documents WHERE supabase_uid=?",
         (supabase_uid,)
     )
     rows = cursor.fetchall()
     conn.close()
-    return [{"id": r[0], "title": r[1], "content": r[2], "supabase_uid": r[3]} for r in rows]
+    return [{"id": r[0], "title": r[1], "content": r[2], "supabase_uid": r[3], "version": r[4]} for r in rows]
 
-def update_document(doc_id: int, supabase_uid: str, title: Optional[str], content: Optional[str]) -> bool:
+def get_document_versions(supabase_uid: str) -> List[tuple]:
+    """
+    Return (id, version) pairs for all of a user's documents, ordered by id.
+    """
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, version FROM documents WHERE supabase_uid=? ORDER BY id",
+        (supabase_uid,)
+    )
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+class VersionConflictError(Exception):
+    """Raised when an update is made against a stale document version."""
+
+    def __init__(self, current_version: int):
+        super().__init__(f"Document has been modified (current version {current_version})")
+        self.current_version = current_version
+
+def update_document(
+    doc_id: int,
+    supabase_uid: str,
+    title: Optional[str],
+    content: Optional[str],
+    expected_version: Optional[int] = None,
+    checkpoint: bool = True,
+) -> bool:
+    """
+    Update a document and bump its version.
+
+    If expected_version is given, the update only succeeds when it matches the
+    stored version; otherwise VersionConflictError is raised. Saves with
+    checkpoint=False (live editing) record revisions that are coalesced over time.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    # Lock the database for writing so the version check and the update are atomic
+    cursor.execute("BEGIN IMMEDIATE")
     # Only update if the document belongs to the user
     cursor.execute(
-        "SELECT id FROM documents WHERE id=? AND supabase_uid=?",
+        "SELECT version, title, content FROM documents WHERE id=? AND supabase_uid=?",
         (doc_id, supabase_uid)
     )
-    if not cursor.fetchone():
+    row = cursor.fetchone()
+    if not row:
+        conn.rollback()
         conn.close()
         return False
+    if expected_version is not None and row[0] != expected_version:
+        conn.rollback()
+        conn.close()
+        raise VersionConflictError(row[0])
 
     if title:
         cursor.execute(
@@ -58,6 +186,16 @@ def update_document(doc_id: int, supabase_uid: str, title: Optional[str], conten
             "UPDATE documents SET content=? WHERE id=? AND supabase_uid=?",
             (content, doc_id, supabase_uid)
         )
+        if content != row[2]:
+            _remap_comments(cursor, doc_id, row[2], content)
+    if title or content:
+        cursor.execute(
+            "UPDATE documents SET version=version+1 WHERE id=? AND supabase_uid=?",
+            (doc_id, supabase_uid)
+        )
+        # Documents created before revisions were recorded get their previous version stored too
+        _record_revision(cursor, doc_id, row[0], row[1], row[2])
+        _record_revision(cursor, doc_id, row[0] + 1, title or row[1], content or row[2], checkpoint)
     conn.commit()
     conn.close()
     return True
@@ -69,12 +207,73 @@ def delete_document(doc_id: int, supabase_uid: str) -> bool:
         "DELETE FROM documents WHERE id=? AND supabase_uid=?",
         (doc_id, supabase_uid)
     )
-    conn.commit()
     deleted = cursor.rowcount > 0
+    if deleted:
+        # SQLite does not enforce ON DELETE CASCADE unless foreign keys are enabled
+        cursor.execute("DELETE FROM document_revisions WHERE document_id=?", (doc_id,))
+        cursor.execute("DELETE FROM revision_summaries WHERE document_id=?", (doc_id,))
+    conn.commit()
     conn.close()
     return deleted
 
 
+# ---- REVISIONS CRUD ----
+
+def get_revisions(doc_id: int, supabase_uid: str) -> List[dict]:
+    """
+    Return the stored revisions of a user's document (without content), newest first.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT r.version, r.title, r.created_at FROM document_revisions r "
+        "JOIN documents d ON d.id = r.document_id "
+        "WHERE r.document_id=? AND d.supabase_uid=? ORDER BY r.version DESC",
+        (doc_id, supabase_uid)
+    )
+    rows = cursor.fetchall()
+    conn.close()
+    return [{"version": r[0], "title": r[1], "created_at": r[2]} for r in rows]
+
+def get_revision(doc_id: int, supabase_uid: str, version: int) -> Optional[dict]:
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT r.version, r.title, r.content FROM document_revisions r "
+        "JOIN documents d ON d.id = r.document_id "
+        "WHERE r.document_id=? AND d.supabase_uid=? AND r.version=?",
+        (doc_id, supabase_uid, version)
+    )
+    row = cursor.fetchone()
+    conn.close()
+    return {"version": row[0], "title": row[1], "content": row[2]} if row else None
+
+def get_revision_summary(doc_id: int, from_version: int, to_version: int) -> Optional[str]:
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT summary FROM revision_summaries WHERE document_id=? AND from_version=? AND to_version=?",
+        (doc_id, from_version, to_version)
+    )
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def save_revision_summary(doc_id: int, from_version: int, to_version: int, summary: str):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    # Only memoize while both revisions still exist (they may have been pruned meanwhile)
+    cursor.execute(
+        "INSERT OR REPLACE INTO revision_summaries (document_id, from_version, to_version, summary) "
+        "SELECT ?, ?, ?, ? WHERE "
+        "(SELECT COUNT(*) FROM document_revisions WHERE document_id=? AND version IN (?, ?)) = ?",
+        (doc_id, from_version, to_version, summary,
+         doc_id, from_version, to_version, len({from_version, to_version}))
+    )
+    conn.commit()
+    conn.close()
+
+
 # ---- COMMENTS CRUD ----
 
 def add_comment(document_id: int, line_number: int, comment: str) -> int:
@@ -97,13 +296,39 @@ def add_comment(document_id: int, line_number: int, comment: str) -> int:
     return comment_id
 
 
-def get_comments(document_id: int) -> List[dict]:
+def get_comments(
+    document_id: int,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+    after: Optional[Tuple[int, int]] = None,
+    limit: Optional[int] = None,
+) -> List[dict]:
+    """
+    Return a document's comments ordered by (line_number, id).
+
+    start_line/end_line restrict the result to an inclusive line range, and
+    after=(line_number, id) continues from the last comment of a previous page
+    (keyset pagination on the (document_id, line_number, id) index).
+    """
+    query = "SELECT id, line_number, comment, created_at FROM comments WHERE document_id=?"
+    params: list = [document_id]
+    if start_line is not None:
+        query += " AND line_number >= ?"
+        params.append(start_line)
+    if end_line is not None:
+        query += " AND line_number <= ?"
+        params.append(end_line)
+    if after is not None:
+        query += " AND (line_number > ? OR (line_number = ? AND id > ?))"
+        params.extend([after[0], after[0], after[1]])
+    query += " ORDER BY line_number, id"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, line_number, comment, created_at FROM comments WHERE document_id=?",
-        (document_id,)
-    )
+    cursor.execute(query, params)
     rows = cursor.fetchall()
     conn.close()
     return [
@@ -112,6 +337,27 @@ def get_comments(document_id: int) -> List[dict]:
     ]
 
 
+def count_comments(document_ids: List[int]) -> Dict[int, int]:
+    """
+    Return {document_id: comment_count} for many documents in one query.
+    Documents without comments are reported with a count of 0.
+    """
+    counts = {doc_id: 0 for doc_id in document_ids}
+    if not document_ids:
+        return counts
+    placeholders = ",".join("?" * len(counts))
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT document_id, COUNT(*) FROM comments WHERE document_id IN ({placeholders}) GROUP BY document_id",
+        list(counts)
+    )
+    for doc_id, count in cursor.fetchall():
+        counts[doc_id] = count
+    conn.close()
+    return counts
+
+
 def delete_comment(comment_id: int) -> bool:
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -11,6 +11,10 @@ from app.api.routes_figures import router as figures_router
 from app.api.routes_accessibility import router as accessibility_router
 from app.api.routes_collaboration import router as collab_router
 from app.api.routes_auth import router as auth_router
+from app.api.routes_realtime import router as realtime_router
+from app.services.realtime_service import realtime
+from app.services.math_service import math_pool
+from app.services.reference_service import close_http_client
 
 app = FastAPI(title=settings.APP_NAME)
 
@@ -42,6 +46,19 @@ app.include_router(figures_router)
 app.include_router(accessibility_router)
 app.include_router(collab_router)
 app.include_router(auth_router)
+app.include_router(realtime_router)
+
+@app.on_event("shutdown")
+async def persist_live_documents():
+    await realtime.shutdown()
+
+@app.on_event("shutdown")
+def stop_math_workers():
+    math_pool.shutdown()
+
+@app.on_event("shutdown")
+async def close_reference_client():
+    await close_http_client()
 
 @app.get("/")
 def root():
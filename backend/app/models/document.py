@@ -2,6 +2,15 @@ import sqlite3
 
 DB_PATH = "documents.db"
 
+def _ensure_column(cursor, table: str, column: str, ddl: str):
+    """
+    Add a column to an existing table if it is missing (CREATE TABLE IF NOT EXISTS
+    does not alter tables created by older versions of this schema).
+    """
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
 def init_db():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -11,10 +20,12 @@ def init_db():
             title TEXT NOT NULL,
             content TEXT NOT NULL,
             supabase_uid TEXT NOT NULL,  -- new column
+            version INTEGER NOT NULL DEFAULT 1,  -- bumped on every update, used as ETag
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY(supabase_uid) REFERENCES users(supabase_uid)
         )
     """)
+    _ensure_column(cursor, "documents", "version", "INTEGER NOT NULL DEFAULT 1")
 
 
     cursor.execute("""
@@ -27,6 +38,38 @@ def init_db():
             FOREIGN KEY(document_id) REFERENCES documents(id) ON DELETE CASCADE
         )
     """)
+    # Comments are always read per document, ordered/filtered by line
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_comments_document_line ON comments(document_id, line_number, id)"
+    )
+
+    # --- Revisions: a snapshot of every stored version, pruned to the most recent ones ---
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS document_revisions (
+            document_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            checkpoint INTEGER NOT NULL DEFAULT 1,  -- 0 for live-editing saves, which are coalesced
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (document_id, version),
+            FOREIGN KEY(document_id) REFERENCES documents(id) ON DELETE CASCADE
+        )
+    """)
+    _ensure_column(cursor, "document_revisions", "checkpoint", "INTEGER NOT NULL DEFAULT 1")
+
+    # Memoized change summaries per revision pair
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS revision_summaries (
+            document_id INTEGER NOT NULL,
+            from_version INTEGER NOT NULL,
+            to_version INTEGER NOT NULL,
+            summary TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (document_id, from_version, to_version),
+            FOREIGN KEY(document_id) REFERENCES documents(id) ON DELETE CASCADE
+        )
+    """)
 
     # --- Users table (linked to Supabase ID) ---
     cursor.execute("""
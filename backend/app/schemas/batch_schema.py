@@ -0,0 +1,51 @@
+from pydantic import BaseModel, Field
+from typing import Annotated, List, Literal, Union
+from app.schemas.ai_schema import GenerateLatexRequest, ExplainLatexRequest
+from app.schemas.accessibility_schema import AddAltTextRequest
+from app.schemas.figure_schema import GenerateTableRequest, GenerateDiagramRequest
+from app.schemas.math_schema import DeriveEquationRequest
+
+# ---- Task types: each wraps the request model of the single-item endpoint ----
+class GenerateLatexTask(BaseModel):
+    type: Literal["generate_latex"]
+    input: GenerateLatexRequest
+
+class ExplainLatexTask(BaseModel):
+    type: Literal["explain_latex"]
+    input: ExplainLatexRequest
+
+class AddAltTextTask(BaseModel):
+    type: Literal["add_alt_text"]
+    input: AddAltTextRequest
+
+class GenerateTableTask(BaseModel):
+    type: Literal["generate_table"]
+    input: GenerateTableRequest
+
+class GenerateDiagramTask(BaseModel):
+    type: Literal["generate_diagram"]
+    input: GenerateDiagramRequest
+
+class DeriveEquationTask(BaseModel):
+    type: Literal["derive_equation"]
+    input: DeriveEquationRequest
+
+BatchTask = Annotated[
+    Union[
+        GenerateLatexTask, ExplainLatexTask, AddAltTextTask,
+        GenerateTableTask, GenerateDiagramTask, DeriveEquationTask,
+    ],
+    Field(discriminator="type"),
+]
+
+class BatchRequest(BaseModel):
+    tasks: List[BatchTask] = Field(..., min_length=1, max_length=200)
+    concurrency: int = Field(8, ge=1, le=32)   # max tasks running at once
+
+# Streamed per task (SSE `data:` payload), in completion order
+class BatchItemResult(BaseModel):
+    index: int                 # position of the task in the request
+    type: str
+    ok: bool
+    result: dict = {}          # same body as the single-item endpoint
+    error: str = ""
@@ -1,20 +1,37 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 
 # ---- 1. Diff ----
 class DiffRequest(BaseModel):
     old_text: str
     new_text: str
+    granularity: Literal["line", "word", "latex"] = "line"
+    algorithm: Literal["histogram", "patience", "myers"] = "histogram"
+    format: Literal["unified", "json"] = "unified"  # "json" also returns structured hunks
+    context: int = Field(3, ge=0, le=100)
+    time_budget_ms: Optional[int] = Field(500, ge=1)  # None for no limit
+
+class DiffHunk(BaseModel):
+    op: str  # "replace", "delete" or "insert"
+    old_start: int  # 1-based line numbers
+    old_end: int
+    new_start: int
+    new_end: int
+    old_text: str
+    new_text: str
 
 class DiffResponse(BaseModel):
-    diff: str  # unified diff string or JSON representation
+    diff: str  # unified diff for line granularity, inline [-old-]{+new+} diff otherwise
+    granularity: str = "line"  # granularity actually used
+    degraded: bool = False  # True if the time budget forced a coarser diff
+    hunks: Optional[List[DiffHunk]] = None
 
 # ---- 2. Merge ----
 class MergeRequest(BaseModel):
     base_text: str
     version_a: str
     version_b: str
-    strategy: Optional[str] = "ai"  # "ai" or "manual"
+    strategy: Optional[str] = "ai"  # "ai" (model resolves conflicts) or "manual" (conflict markers)
 
 class MergeResponse(BaseModel):
     merged_text: str
@@ -28,7 +45,23 @@ class SummarizeChangesRequest(BaseModel):
 class SummarizeChangesResponse(BaseModel):
     summary: str
 
-# ---- 4. Comments ----
+# ---- 4. Revisions ----
+class RevisionInfo(BaseModel):
+    version: int
+    title: str
+    created_at: Optional[str] = None
+
+class RevisionDiffResponse(DiffResponse):
+    from_revision: int
+    to_revision: int
+
+class RevisionSummaryResponse(BaseModel):
+    summary: str
+    from_revision: int
+    to_revision: int
+    cached: bool = False  # True if the summary was memoized for this revision pair
+
+# ---- 5. Comments ----
 class CommentRequest(BaseModel):
     document_id: int
     line_number: int
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class CompileRequest(BaseModel):
     content: str  # full LaTeX source code
@@ -12,6 +12,13 @@ class FixErrorRequest(BaseModel):
     content: str
     error_log: str
 
+class LinePatch(BaseModel):
+    start_line: int   # 1-based, inclusive
+    end_line: int     # inclusive; start_line - 1 inserts before start_line
+    replacement: str
+
 class FixErrorResponse(BaseModel):
     fixed_content: str
     explanation: str
+    patches: List[LinePatch] = []   # applied patches, empty for full rewrites
+    applied_rules: List[str] = []   # deterministic fixes applied before any model call
@@ -15,6 +15,7 @@ class DocumentUpdate(BaseModel):
 
 class Document(DocumentBase):
     id: int
+    version: int = 1  # incremented on every update, exposed as the ETag
 
     class Config:
         orm_mode = True
@@ -1,9 +1,8 @@
-from pydantic import BaseModel
-from typing import List, Optional, Literal
+from pydantic import BaseModel, Field
+from typing import List, Optional, Literal, Union
 
 # ------- Table -------
-class GenerateTableRequest(BaseModel):
-    csv: str                                # raw CSV text
+class TableOptions(BaseModel):
     delimiter: str = ","                    # default comma
     has_header: bool = True
     align: Optional[str] = None             # e.g., "lcr" or None → auto
@@ -12,6 +11,14 @@ class GenerateTableRequest(BaseModel):
     caption: Optional[str] = None
     label: Optional[str] = None
     table_env: Literal["table", "table*","none"] = "table"  # "none" → just tabularx
+    columns: Optional[List[Union[int, str]]] = None  # keep only these columns (0-based index or header name)
+    max_rows: Optional[int] = None          # stop after this many data rows
+    # "auto" → tabularx, or a page-breaking table above long_table_rows rows
+    layout: Literal["auto", "tabularx", "longtable", "xltabular"] = "auto"
+    long_table_rows: Optional[int] = None   # default: TABLE_LONG_ROWS setting
+
+class GenerateTableRequest(TableOptions):
+    csv: str                                # raw CSV text
 
 class GenerateTableResponse(BaseModel):
     latex: str
@@ -30,6 +37,13 @@ class GeneratePlotRequest(BaseModel):
     # data mode
     series: Optional[List[List[List[float]]]] = None
     # shape: [ series_i : [ [x,y], ... ] ]
+    downsample: Literal["lttb", "minmax", "none"] = "lttb"  # reduce long series; "none" keeps every point
+    # per series; default derived from width. At least 4: the end points plus
+    # one min/max pair, fewer than any method can keep
+    max_points: Optional[int] = Field(None, ge=4)
+    # "inline" table in the TeX source, or an external content-addressed .dat/.csv file
+    data_output: Literal["inline", "dat", "csv"] = "inline"
+    precision: Optional[int] = Field(None, ge=1, le=17)  # significant digits; None writes values exactly
 
     # equation mode
     expressions: Optional[List[str]] = None # e.g. ["sin(deg(x))","x^2"]
@@ -38,6 +52,7 @@ class GeneratePlotRequest(BaseModel):
 
 class GeneratePlotResponse(BaseModel):
     latex: str
+    artifacts: List[str] = []     # data files referenced by latex (data_output "dat"/"csv")
 
 # ------- TikZ diagram -------
 class GenerateDiagramRequest(BaseModel):
@@ -45,6 +60,10 @@ class GenerateDiagramRequest(BaseModel):
     style_hints: Optional[str] = None  # optional constraints (colors, nodes, etc.)
     tikz_libs: Optional[List[str]] = ["arrows.meta", "positioning"]
     strict_latex_only: bool = True     # enforce LaTeX-only output
+    validate_compile: bool = False     # return the first of several candidates that compiles
+    candidates: int = Field(3, ge=1, le=6)  # concurrent candidates when validate_compile is set
 
 class GenerateDiagramResponse(BaseModel):
     latex: str
+    compiled: Optional[bool] = None    # set when validate_compile was requested
+    cached: Optional[bool] = None
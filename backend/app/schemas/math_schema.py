@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Optional, Union
 
 class VerifyEquationRequest(BaseModel):
     lhs: str  # left-hand side expression
@@ -9,6 +9,8 @@ class VerifyEquationResponse(BaseModel):
     equivalent: bool
     simplified_lhs: str
     simplified_rhs: str
+    status: str = "ok"  # "ok", "timeout" (simplification exceeded its time budget) or "error"
+    method: Optional[str] = None  # check that decided: "numeric" (random points) or "symbolic"
 
 class DeriveEquationRequest(BaseModel):
     expression: str  # LaTeX or plain math expression
@@ -18,9 +20,49 @@ class DeriveEquationResponse(BaseModel):
     final_result: str
 
 class CheckUnitsRequest(BaseModel):
-    expression: str  # e.g., "F = m * a"
+    expression: Optional[str] = None  # e.g., "F = m * a" or "E = m c^2"
+    expressions: Optional[List[str]] = None  # check many equations in one call
+    # Extra or overridden symbols: a quantity name ("charge") or base exponents ({"M": 1, "T": -2})
+    units: Optional[Dict[str, Union[str, Dict[str, int]]]] = None
+
+class UnitCheckResult(BaseModel):
+    expression: str
+    consistent: Optional[bool]  # None: undecided, e.g. symbols with unknown units
+    details: str
 
 class CheckUnitsResponse(BaseModel):
-    consistent: bool
+    consistent: Optional[bool]  # all expressions are consistent; None if some are undecided and none failed
     details: str
+    results: List[UnitCheckResult] = []
+
+
+class VerifyDocumentRequest(BaseModel):
+    # Either the LaTeX source itself, or a stored document
+    content: Optional[str] = None
+    document_id: Optional[int] = None
+    supabase_uid: Optional[str] = None
+
+class EquationStep(BaseModel):
+    lhs: str
+    rhs: str
+    equivalent: bool
+    status: str  # "ok", "timeout" or "error"
+    method: Optional[str] = None
+    detail: Optional[str] = None
+
+class EquationResult(BaseModel):
+    kind: str  # environment name, "$$" or "\\["
+    label: Optional[str] = None
+    start_line: int
+    end_line: int
+    start_offset: int
+    end_offset: int
+    steps: List[EquationStep]
+    verified: bool  # every step is equivalent (vacuously true without equalities)
+    cached: bool  # results were reused from an identical equation checked earlier
 
+class VerifyDocumentResponse(BaseModel):
+    equations: List[EquationResult]
+    total: int
+    verified: int
+    cached: int
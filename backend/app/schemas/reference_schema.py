@@ -1,10 +1,26 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 class FetchBibtexRequest(BaseModel):
     identifier: str  # DOI or arXiv ID
 
 class FetchBibtexResponse(BaseModel):
     bibtex: str
+    cached: bool = False
+
+class FetchBibtexBatchRequest(BaseModel):
+    identifiers: List[str] = Field(..., min_length=1, max_length=500)
+
+class BibtexResult(BaseModel):
+    identifier: str
+    bibtex: Optional[str] = None
+    cached: bool = False
+    error: Optional[str] = None   # malformed, not found, or network failure
+
+class FetchBibtexBatchResponse(BaseModel):
+    results: List[BibtexResult]
+    found: int
+    cached: int
 
 class CheckBibtexRequest(BaseModel):
     bibtex: str
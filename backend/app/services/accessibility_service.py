@@ -2,10 +2,10 @@ from typing import List
 from app.schemas.accessibility_schema import (
     AddAltTextRequest, CheckColorRequest, CheckTemplateRequest
 )
-from app.services.ai_service import client
+from app.services.llm_gateway import gateway
 
 # ---- 1. Alt Text (AI captioning) ----
-def add_alt_text(req: AddAltTextRequest) -> str:
+async def add_alt_text(req: AddAltTextRequest) -> str:
     """
     Use Gemini to generate concise alt text for figures.
     """
@@ -16,11 +16,11 @@ def add_alt_text(req: AddAltTextRequest) -> str:
         "Do not return LaTeX code, only plain text."
     )
     user_prompt = f"Figure code:\n{req.figure_code}\n\nContext: {req.context or 'N/A'}"
-    resp = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=system_prompt + "\n" + user_prompt
+    text = await gateway.generate(
+        system_prompt + "\n" + user_prompt,
+        endpoint="accessibility.add_alt_text"
     )
-    return resp.text.strip()
+    return text.strip()
 
 # ---- 2. Color Compliance ----
 def _simulate_colorblindness(hex_color: str, mode: str) -> str:
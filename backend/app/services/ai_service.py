@@ -1,13 +1,102 @@
 import os
-import re
-from google import genai
+from typing import AsyncIterator, Optional
 from app.schemas.ai_schema import GenerateLatexRequest, ExplainLatexRequest
-from app.core.config import settings
+from app.services.llm_gateway import gateway
 
+class FenceStripper:
+    """
+    Incrementally removes markdown code fences from streamed model output and
+    trims leading/trailing whitespace, producing the same result as the
+    one-shot cleaners when fed the whole text.
+
+    Modes:
+    - "line": a fence removes everything up to and including the next newline
+      (```latex\n), as in process_gemini_output.
+    - "word": a fence removes an optional language word and following
+      whitespace (```latex ), as in clean_code_blocks.
+    - None: no fence handling, whitespace trimming only.
+
+    Usage: call feed() for every chunk and finish() once at the end; each
+    call returns the text that can be emitted so far.
+    """
+
+    def __init__(self, mode: Optional[str] = "line"):
+        self.mode = mode
+        self._in_fence = False
+        self._fence_phase = "word"  # "word" -> "space" (word mode only)
+        self._fence_text = ""       # consumed fence tag (line mode)
+        self._carry = ""            # trailing backticks that may start a fence
+        self._started = False
+        self._whitespace = ""       # trailing whitespace held back
 
+    def _emit(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        text = self._whitespace + text
+        body = text.rstrip()
+        self._whitespace = text[len(body):]
+        return body
 
-# Initialize Gemini client
-client = genai.Client(api_key=settings.GEMINI_API_KEY)
+    def feed(self, chunk: str) -> str:
+        if self.mode is None:
+            return self._emit(chunk)
+
+        data = self._carry + chunk
+        self._carry = ""
+        out = []
+        i = 0
+        while i < len(data):
+            if self._in_fence:
+                if self.mode == "line":
+                    j = data.find("\n", i)
+                    if j == -1:
+                        self._fence_text += data[i:]
+                        i = len(data)
+                    else:
+                        self._fence_text = ""
+                        self._in_fence = False
+                        i = j + 1
+                else:
+                    if self._fence_phase == "word":
+                        while i < len(data) and (data[i].isalnum() or data[i] == "_"):
+                            i += 1
+                        if i < len(data):
+                            self._fence_phase = "space"
+                    if self._fence_phase == "space":
+                        while i < len(data) and data[i].isspace():
+                            i += 1
+                        if i < len(data):
+                            self._in_fence = False
+                continue
+
+            j = data.find("```", i)
+            if j == -1:
+                rest = data[i:]
+                # Hold back up to two trailing backticks: the next chunk may complete a fence
+                tail = len(rest) - len(rest.rstrip("`"))
+                tail = min(tail, 2)
+                if tail:
+                    self._carry = rest[-tail:]
+                    rest = rest[:-tail]
+                out.append(rest)
+                i = len(data)
+            else:
+                out.append(data[i:j])
+                self._in_fence = True
+                self._fence_phase = "word"
+                i = j + 3
+        return self._emit("".join(out))
+
+    def finish(self) -> str:
+        text = self._carry
+        if self._in_fence and self.mode == "line":
+            # No newline followed the fence: only the backticks are removed
+            text += self._fence_text.replace("```", "")
+        self._carry = self._fence_text = ""
+        return self._emit(text)
 
 def process_gemini_output(text: str) -> str:
     """
@@ -26,37 +115,52 @@ def process_gemini_output(text: str) -> str:
     Returns:
         A cleaned string with the code fences removed.
     """
-    # Pattern to match and remove the opening and closing fences.
-    # It handles cases like ```latex or just ```.
-    pattern = r"```[\s\S]*?\n|```"
-    
-    # Use re.sub to find all occurrences of the pattern and replace them with an empty string.
-    # The re.MULTILINE flag allows ^ and $ to match at the beginning/end of each line.
-    cleaned_text = re.sub(pattern, "", text, flags=re.MULTILINE)
+    # An opening fence is removed together with the rest of its line
+    # (the language tag); a fence without a following newline is removed alone.
+    stripper = FenceStripper("line")
+    return stripper.feed(text) + stripper.finish()
 
-    # Return the stripped string to remove any leading/trailing whitespace
-    return cleaned_text.strip()
+async def strip_stream(chunks: AsyncIterator[str], mode: Optional[str] = "line") -> AsyncIterator[str]:
+    """
+    Apply FenceStripper to a stream of chunks, skipping empty outputs.
+    """
+    stripper = FenceStripper(mode)
+    async for chunk in chunks:
+        cleaned = stripper.feed(chunk)
+        if cleaned:
+            yield cleaned
+    cleaned = stripper.finish()
+    if cleaned:
+        yield cleaned
+
+def _generate_latex_prompt(request: GenerateLatexRequest) -> str:
+    return f"Convert this request into valid LaTeX code only:\n\n{request.prompt}"
+
+def _explain_latex_prompt(request: ExplainLatexRequest) -> str:
+    return f"Explain this LaTeX expression in simple English:\n\n{request.code}"
 
-def generate_latex(request: GenerateLatexRequest) -> str:
+async def generate_latex(request: GenerateLatexRequest) -> str:
     """
     Convert natural language to LaTeX code using Gemini.
     """
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=f"Convert this request into valid LaTeX code only:\n\n{request.prompt}"
-    )
-    response = response.text.strip()
-    response = process_gemini_output(response)
-    return response
+    response = await gateway.generate(_generate_latex_prompt(request), endpoint="ai.generate_latex")
+    return process_gemini_output(response)
 
-def explain_latex(request: ExplainLatexRequest) -> str:
+async def explain_latex(request: ExplainLatexRequest) -> str:
     """
     Explain LaTeX code in plain English using Gemini.
     """
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=f"Explain this LaTeX expression in simple English:\n\n{request.code}"
-    )
-    response = response.text.strip()
-    response = process_gemini_output(response)
-    return response
+    response = await gateway.generate(_explain_latex_prompt(request), endpoint="ai.explain_latex")
+    return process_gemini_output(response)
+
+def stream_generate_latex(request: GenerateLatexRequest) -> AsyncIterator[str]:
+    """
+    Streaming variant of generate_latex: yields cleaned LaTeX as it is generated.
+    """
+    return strip_stream(gateway.stream(_generate_latex_prompt(request), endpoint="ai.generate_latex"))
+
+def stream_explain_latex(request: ExplainLatexRequest) -> AsyncIterator[str]:
+    """
+    Streaming variant of explain_latex.
+    """
+    return strip_stream(gateway.stream(_explain_latex_prompt(request), endpoint="ai.explain_latex"))
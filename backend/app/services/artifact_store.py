@@ -0,0 +1,119 @@
+"""
+Content-addressed files generated for documents (e.g. plot data tables).
+
+A file's name is derived from its bytes, so identical data is stored once
+and an existing file is never rewritten. The compile service adds the
+directory to TEXINPUTS so documents can refer to the files by name.
+
+Documents are compiled from their content alone (there is no project
+directory on the server), so the store is shared by all documents; since a
+name always refers to the same bytes, sharing cannot mix up data. Clients
+fetch the files through /figures/artifacts/{name} to keep them with a project.
+
+Files unused for PLOT_DATA_MAX_AGE_DAYS, then the least recently used ones
+beyond PLOT_DATA_MAX_MB, are removed after each new file. Storing, serving
+and compiling a document that names a file all count as a use.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Callable, Optional
+from app.core.config import settings
+
+_NAME = re.compile(r"^[a-z]+-[0-9a-f]{16}\.(?:dat|csv)$")
+# Artifact names as documents refer to them, e.g. \addplot table {plot-0123456789abcdef.dat}
+_REFERENCE = re.compile(r"\b[a-z]+-[0-9a-f]{16}\.(?:dat|csv)\b")
+
+
+def prune_lru(directory: str, matches: Callable[[str], bool], max_mb: float, max_age_days: float) -> int:
+    """
+    Remove the files of directory whose names match that were last used (mtime)
+    more than max_age_days ago, then the least recently used ones until the rest
+    fits in max_mb. Returns the number of files removed.
+    """
+    entries = []
+    for entry in os.scandir(directory):
+        if matches(entry.name):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    expired = time.time() - max_age_days * 86400
+    budget = max_mb * 1024 * 1024
+    removed = 0
+    for mtime, size, path in entries:
+        if mtime > expired and total <= budget:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def _touch(path: str) -> bool:
+    """Mark a file as recently used; False if it does not exist."""
+    try:
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+
+def artifact_dir() -> str:
+    return os.path.abspath(settings.PLOT_DATA_DIR)
+
+
+def store_artifact(data: bytes, prefix: str, suffix: str) -> str:
+    """Store data unless a file with the same content exists; returns its name."""
+    name = f"{prefix}-{hashlib.sha256(data).hexdigest()[:16]}.{suffix}"
+    directory = artifact_dir()
+    path = os.path.join(directory, name)
+    if _touch(path):
+        return name
+    os.makedirs(directory, exist_ok=True)
+    # Written under a temporary name and renamed, so readers never see partial files
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    prune_artifacts()
+    return name
+
+
+_prune_lock = threading.Lock()
+
+
+def prune_artifacts():
+    """Drop artifacts unused for PLOT_DATA_MAX_AGE_DAYS, then the least recently used beyond PLOT_DATA_MAX_MB."""
+    if not _prune_lock.acquire(blocking=False):
+        return  # another store is already pruning
+    try:
+        prune_lru(artifact_dir(), _NAME.match, settings.PLOT_DATA_MAX_MB, settings.PLOT_DATA_MAX_AGE_DAYS)
+    except OSError:
+        pass
+    finally:
+        _prune_lock.release()
+
+
+def touch_artifacts(source: str):
+    """Mark the artifacts a document names as used, so compiling it keeps them."""
+    for name in set(_REFERENCE.findall(source)):
+        _touch(os.path.join(artifact_dir(), name))
+
+
+def artifact_path(name: str) -> Optional[str]:
+    """Path of a stored artifact, or None for unknown or malformed names."""
+    if not _NAME.match(name):
+        return None
+    path = os.path.join(artifact_dir(), name)
+    return path if _touch(path) else None
@@ -0,0 +1,72 @@
+import asyncio
+import json
+from typing import AsyncIterator, Dict, List
+from app.schemas.batch_schema import BatchRequest, BatchItemResult
+from app.services.ai_service import generate_latex, explain_latex
+from app.services.accessibility_service import add_alt_text
+from app.services.figure_service import generate_table, generate_diagram
+from app.services.math_service import derive_equation
+
+
+# ---- Task handlers: return the same body as the single-item endpoints ----
+async def _generate_latex(req):
+    return {"latex": await generate_latex(req)}
+
+async def _explain_latex(req):
+    return {"explanation": await explain_latex(req)}
+
+async def _add_alt_text(req):
+    return {"alt_text": await add_alt_text(req)}
+
+async def _generate_table(req):
+    return {"latex": await asyncio.to_thread(generate_table, req)}
+
+async def _generate_diagram(req):
+    return {"latex": await generate_diagram(req)}
+
+async def _derive_equation(req):
+    return await derive_equation(req)
+
+HANDLERS = {
+    "generate_latex": _generate_latex,
+    "explain_latex": _explain_latex,
+    "add_alt_text": _add_alt_text,
+    "generate_table": _generate_table,
+    "generate_diagram": _generate_diagram,
+    "derive_equation": _derive_equation,
+}
+
+
+async def run_batch(req: BatchRequest) -> AsyncIterator[dict]:
+    """
+    Run batch tasks concurrently (at most req.concurrency at once) and yield one
+    result per task as soon as it finishes. Identical tasks are run only once
+    and their result is reported for every index they appear at.
+    """
+    groups: Dict[str, List[int]] = {}
+    for i, task in enumerate(req.tasks):
+        key = json.dumps(task.model_dump(), sort_keys=True)
+        groups.setdefault(key, []).append(i)
+
+    semaphore = asyncio.Semaphore(req.concurrency)
+
+    async def run(indices: List[int]):
+        task = req.tasks[indices[0]]
+        async with semaphore:
+            try:
+                return indices, task.type, True, await HANDLERS[task.type](task.input), ""
+            except Exception as e:
+                return indices, task.type, False, {}, str(e) or type(e).__name__
+
+    pending = [asyncio.ensure_future(run(indices)) for indices in groups.values()]
+    try:
+        for finished in asyncio.as_completed(pending):
+            indices, task_type, ok, result, error = await finished
+            for index in indices:
+                yield BatchItemResult(
+                    index=index, type=task_type, ok=ok, result=result, error=error
+                ).model_dump()
+    finally:
+        # Client went away or the stream was closed early
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalize a prompt for cache lookups without changing its meaning for LaTeX:
+    unify line endings, drop trailing whitespace on each line and surrounding blank space.
+    """
+    lines = prompt.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def make_cache_key(model: str, prompt: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Build a stable cache key from the model name, normalized prompt and call parameters.
+    """
+    payload = json.dumps(
+        {"model": model, "prompt": normalize_prompt(prompt), "params": params or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-level string cache: an in-memory LRU in front of a SQLite store on disk.
+
+    Entries expire after a TTL. The memory tier is bounded by entry count and the
+    disk tier by total value size; least recently used entries are evicted first.
+    Hits and misses are counted per namespace (e.g. per endpoint).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_memory_entries: int = 512,
+        max_disk_bytes: int = 64 * 1024 * 1024,
+        default_ttl: float = 7 * 24 * 3600,
+    ):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.default_ttl = default_ttl
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._evictions = 0
+        self._disk_bytes: Optional[int] = None
+
+    # ---- disk tier ----
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries(accessed_at)"
+        )
+        if self._disk_bytes is None:
+            row = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+            self._disk_bytes = row[0]
+        return conn
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, size, expires_at FROM cache_entries WHERE key=?", (key,)
+        ).fetchone()
+        if row is None:
+            conn.close()
+            return None
+        value, size, expires_at = row
+        if expires_at <= now:
+            conn.execute("DELETE FROM cache_entries WHERE key=?", (key,))
+            self._disk_bytes -= size
+        else:
+            conn.execute("UPDATE cache_entries SET accessed_at=? WHERE key=?", (now, key))
+        conn.commit()
+        conn.close()
+        return (value, expires_at) if expires_at > now else None
+
+    def _disk_set(self, key: str, value: str, expires_at: float, now: float):
+        size = len(value.encode("utf-8"))
+        conn = self._connect()
+        old = conn.execute("SELECT size FROM cache_entries WHERE key=?", (key,)).fetchone()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, size, expires_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, value, size, expires_at, now),
+        )
+        self._disk_bytes += size - (old[0] if old else 0)
+
+        if self._disk_bytes > self.max_disk_bytes:
+            # Drop expired entries first, then least recently used until under budget
+            freed = conn.execute(
+                "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM cache_entries WHERE expires_at<=?", (now,)
+            ).fetchone()
+            conn.execute("DELETE FROM cache_entries WHERE expires_at<=?", (now,))
+            self._disk_bytes -= freed[0]
+            self._evictions += freed[1]
+            if self._disk_bytes > self.max_disk_bytes:
+                rows = conn.execute(
+                    "SELECT key, size FROM cache_entries ORDER BY accessed_at"
+                ).fetchall()
+                stale = []
+                for old_key, old_size in rows:
+                    if self._disk_bytes <= self.max_disk_bytes:
+                        break
+                    stale.append((old_key,))
+                    self._disk_bytes -= old_size
+                conn.executemany("DELETE FROM cache_entries WHERE key=?", stale)
+                self._evictions += len(stale)
+        conn.commit()
+        conn.close()
+
+    # ---- memory tier ----
+    def _memory_put(self, key: str, value: str, expires_at: float):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._evictions += 1
+
+    def _count(self, namespace: str, field: str):
+        counters = self._stats.setdefault(namespace, {"hits": 0, "misses": 0})
+        counters[field] += 1
+
+    # ---- public API ----
+    def get(self, key: str, namespace: str = "default") -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                self._count(namespace, "hits")
+                return entry[0]
+            if entry is not None:
+                del self._memory[key]
+
+            entry = self._disk_get(key, now)
+            if entry is not None:
+                self._memory_put(key, entry[0], entry[1])
+                self._count(namespace, "hits")
+                return entry[0]
+
+            self._count(namespace, "misses")
+            return None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        now = time.time()
+        expires_at = now + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._memory_put(key, value, expires_at)
+            self._disk_set(key, value, expires_at, now)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+            conn = self._connect()
+            row = conn.execute("SELECT size FROM cache_entries WHERE key=?", (key,)).fetchone()
+            if row:
+                conn.execute("DELETE FROM cache_entries WHERE key=?", (key,))
+                self._disk_bytes -= row[0]
+            conn.commit()
+            conn.close()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            conn = self._connect()
+            conn.execute("DELETE FROM cache_entries")
+            conn.commit()
+            conn.close()
+            self._disk_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = sum(s["hits"] for s in self._stats.values())
+            misses = sum(s["misses"] for s in self._stats.values())
+            return {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes or 0,
+                "evictions": self._evictions,
+                "namespaces": {
+                    name: {
+                        **s,
+                        "hit_rate": s["hits"] / (s["hits"] + s["misses"]) if s["hits"] + s["misses"] else 0.0,
+                    }
+                    for name, s in self._stats.items()
+                },
+            }
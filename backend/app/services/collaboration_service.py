@@ -1,60 +1,185 @@
-import difflib
+import asyncio
+from typing import AsyncIterator, List, Optional, Tuple
 from app.schemas.collaboration_schema import (
     DiffRequest, MergeRequest, SummarizeChangesRequest, CommentRequest
 )
-from app.services.ai_service import client
+from app.services.llm_gateway import gateway
+from app.services.ai_service import process_gemini_output, strip_stream
+from app.services.merge_service import MergeChunk, conflict_markers, merge_lines
+from app.services.diff_engine import diff_texts
 
 from app.db import crud
 from app.schemas.collaboration_schema import CommentRequest
 
 # ---- 1. Diff ----
-def generate_diff(req: DiffRequest) -> str:
-    diff = difflib.unified_diff(
-        req.old_text.splitlines(),
-        req.new_text.splitlines(),
-        fromfile="old",
-        tofile="new",
-        lineterm=""
+def generate_diff(req: DiffRequest) -> dict:
+    result = diff_texts(
+        req.old_text,
+        req.new_text,
+        granularity=req.granularity,
+        algorithm=req.algorithm,
+        context=req.context,
+        time_budget_ms=req.time_budget_ms,
     )
-    return "\n".join(diff)
+    if req.format != "json":
+        result["hunks"] = None
+    return result
 
 # ---- 2. Merge ----
-def merge_versions(req: MergeRequest):
-    """
-    AI-assisted merge between version_a and version_b given a base_text.
-    """
-    if req.strategy == "manual":
-        # naive merge: concatenate with conflict markers
-        merged = f"<<<<<<< VERSION A\n{req.version_a}\n=======\n{req.version_b}\n>>>>>>> VERSION B"
-        return merged, ["Manual conflict resolution required"]
+# Lines of merged text shown around a conflict when asking the model to resolve it
+CONFLICT_CONTEXT_LINES = 3
 
-    # AI strategy
+async def _resolve_conflict(chunk: MergeChunk, before: List[str], after: List[str]) -> List[str]:
     prompt = (
-        "You are a LaTeX-aware merge assistant. "
-        "Given a base version and two edited versions, merge them intelligently. "
-        "Preserve LaTeX syntax. Resolve conflicts gracefully.\n\n"
-        f"BASE:\n{req.base_text}\n\nVERSION A:\n{req.version_a}\n\nVERSION B:\n{req.version_b}"
+        "You are a LaTeX-aware merge assistant. Two people edited the same region of a "
+        "LaTeX document. Merge their edits into one version of that region, keeping both "
+        "intents where possible and preserving LaTeX syntax. Return ONLY the merged lines "
+        "of the region, without the surrounding context and without explanations.\n\n"
+        f"CONTEXT BEFORE:\n{''.join(before)}\n"
+        f"BASE REGION:\n{''.join(chunk.base)}\n"
+        f"VERSION A REGION:\n{''.join(chunk.a)}\n"
+        f"VERSION B REGION:\n{''.join(chunk.b)}\n"
+        f"CONTEXT AFTER:\n{''.join(after)}"
     )
-    resp = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt
-    )
-    return resp.text.strip(), []
+    text = await gateway.generate(prompt, endpoint="collaboration.merge")
+    resolved = process_gemini_output(text)
+    return (resolved + "\n").splitlines(keepends=True) if resolved else []
+
+def _context(chunks: List[MergeChunk], index: int):
+    """Merged lines just before and after a conflict chunk (base lines for neighbouring conflicts)."""
+    def lines_of(chunk: MergeChunk) -> List[str]:
+        return chunk.base if chunk.kind == "conflict" else chunk.lines
+
+    before: List[str] = []
+    for chunk in reversed(chunks[:index]):
+        before = lines_of(chunk) + before
+        if len(before) >= CONFLICT_CONTEXT_LINES:
+            break
+    after: List[str] = []
+    for chunk in chunks[index + 1:]:
+        after = after + lines_of(chunk)
+        if len(after) >= CONFLICT_CONTEXT_LINES:
+            break
+    return before[-CONFLICT_CONTEXT_LINES:], after[:CONFLICT_CONTEXT_LINES]
+
+async def merge_versions(req: MergeRequest):
+    """
+    Three-way merge between version_a and version_b given a base_text.
+
+    Non-overlapping edits are merged locally (line-level diff3, refined at token
+    level). Remaining conflicts are either marked with conflict markers
+    ("manual") or resolved by the model one hunk at a time, in parallel ("ai").
+    """
+    # Diffing is CPU-bound: keep it off the event loop
+    chunks = await asyncio.to_thread(merge_lines, req.base_text, req.version_a, req.version_b)
+    conflict_indices = [i for i, c in enumerate(chunks) if c.kind == "conflict"]
+
+    resolutions = {}
+    if req.strategy != "manual" and conflict_indices:
+        results = await asyncio.gather(
+            *[_resolve_conflict(chunks[i], *_context(chunks, i)) for i in conflict_indices],
+            return_exceptions=True,
+        )
+        for i, result in zip(conflict_indices, results):
+            if not isinstance(result, Exception):
+                resolutions[i] = result
+
+    merged: List[str] = []
+    conflicts: List[str] = []
+    for i, chunk in enumerate(chunks):
+        if chunk.kind != "conflict":
+            merged.extend(chunk.lines)
+        elif i in resolutions:
+            merged.extend(resolutions[i])
+        else:
+            start = len(merged) + 1
+            merged.extend(conflict_markers(chunk))
+            conflicts.append(f"Manual conflict resolution required at lines {start}-{len(merged)}")
+    return "".join(merged), conflicts
 
 # ---- 3. Summarize Changes ----
-def summarize_changes(req: SummarizeChangesRequest) -> str:
-    diff = generate_diff(DiffRequest(old_text=req.old_text, new_text=req.new_text))
-    prompt = (
+def _summarize_prompt(req: SummarizeChangesRequest) -> str:
+    diff = generate_diff(DiffRequest(old_text=req.old_text, new_text=req.new_text))["diff"]
+    return (
         "Summarize the following LaTeX document changes in plain English, focusing on "
         "sections, equations, and figures:\n\n" + diff
     )
-    resp = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt
+
+async def summarize_changes(req: SummarizeChangesRequest) -> str:
+    text = await gateway.generate(_summarize_prompt(req), endpoint="collaboration.summarize_changes")
+    return text.strip()
+
+def stream_summarize_changes(req: SummarizeChangesRequest) -> AsyncIterator[str]:
+    return strip_stream(
+        gateway.stream(_summarize_prompt(req), endpoint="collaboration.summarize_changes"), mode=None
     )
-    return resp.text.strip()
 
-# ---- 4. Comments ----
+# ---- 4. Revisions ----
+def get_revisions_for_doc(doc_id: int, supabase_uid: str):
+    return crud.get_revisions(doc_id, supabase_uid)
+
+def _load_revision_pair(
+    doc_id: int, supabase_uid: str, from_revision: int, to_revision: Optional[int]
+) -> Tuple[dict, dict]:
+    """
+    Load two stored revisions; to_revision defaults to the current version,
+    read from the document itself if it has no revision row (documents created
+    before revisions were recorded). Raises ValueError if the document or
+    either revision does not exist.
+    """
+    if to_revision is None:
+        document = crud.get_document(doc_id, supabase_uid)
+        if document is None:
+            raise ValueError("Document not found or access denied")
+        to_revision = document["version"]
+        new = crud.get_revision(doc_id, supabase_uid, to_revision) or {
+            "version": document["version"], "title": document["title"], "content": document["content"],
+        }
+    else:
+        new = crud.get_revision(doc_id, supabase_uid, to_revision)
+    old = crud.get_revision(doc_id, supabase_uid, from_revision)
+    if old is None or new is None:
+        missing = from_revision if old is None else to_revision
+        raise ValueError(f"Revision {missing} of document {doc_id} not found")
+    return old, new
+
+def diff_revisions(
+    doc_id: int,
+    supabase_uid: str,
+    from_revision: int,
+    to_revision: Optional[int] = None,
+    **options,
+) -> dict:
+    """
+    Diff two stored revisions of a document. options are the DiffRequest
+    settings (granularity, algorithm, format, context, time_budget_ms).
+    """
+    old, new = _load_revision_pair(doc_id, supabase_uid, from_revision, to_revision)
+    result = generate_diff(DiffRequest(old_text=old["content"], new_text=new["content"], **options))
+    result.update(from_revision=old["version"], to_revision=new["version"])
+    return result
+
+async def summarize_revisions(
+    doc_id: int, supabase_uid: str, from_revision: int, to_revision: Optional[int] = None
+) -> dict:
+    """
+    Summarize the changes between two stored revisions. Revisions never change
+    once stored, so summaries are memoized per (from, to) pair; an edit creates
+    a new revision (and therefore a new pair), and pruning a revision drops the
+    summaries that reference it.
+    """
+    old, new = _load_revision_pair(doc_id, supabase_uid, from_revision, to_revision)
+    from_version, to_version = old["version"], new["version"]
+    summary = await asyncio.to_thread(crud.get_revision_summary, doc_id, from_version, to_version)
+    cached = summary is not None
+    if not cached:
+        summary = await summarize_changes(
+            SummarizeChangesRequest(old_text=old["content"], new_text=new["content"])
+        )
+        await asyncio.to_thread(crud.save_revision_summary, doc_id, from_version, to_version, summary)
+    return {"summary": summary, "from_revision": from_version, "to_revision": to_version, "cached": cached}
+
+# ---- 5. Comments ----
 
 def add_comment(req: CommentRequest):
     try:
@@ -63,8 +188,34 @@ def add_comment(req: CommentRequest):
     except ValueError as e:
         raise e
 
-def get_comments_for_doc(document_id: int):
-    return crud.get_comments(document_id)
+def _decode_cursor(cursor: str):
+    try:
+        line_number, comment_id = cursor.split(":")
+        return int(line_number), int(comment_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def get_comments_for_doc(
+    document_id: int,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+):
+    """
+    Return (comments, next_cursor). next_cursor is "line_number:id" of the last
+    comment on a full page, or None when there are no more results.
+    """
+    after = _decode_cursor(cursor) if cursor else None
+    comments = crud.get_comments(document_id, start_line, end_line, after, limit)
+    next_cursor = None
+    if limit is not None and len(comments) == limit:
+        last = comments[-1]
+        next_cursor = f"{last['line_number']}:{last['id']}"
+    return comments, next_cursor
+
+def count_comments_for_docs(document_ids: List[int]):
+    return crud.count_comments(document_ids)
 
 def delete_comment_by_id(comment_id: int):
     return crud.delete_comment(comment_id)
\ No newline at end of file
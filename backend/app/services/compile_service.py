@@ -1,7 +1,292 @@
+import asyncio
 import subprocess
 import tempfile
 import base64
+import hashlib
 import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from app.core.config import settings
+from app.services.artifact_store import artifact_dir, prune_lru, touch_artifacts
+
+def _tex_env() -> dict:
+    # Generated plot data and prebuilt figures are looked up by name;
+    # the trailing separator keeps TeX's default search paths
+    paths = [artifact_dir(), os.path.abspath(settings.FIGURE_CACHE_DIR), os.environ.get("TEXINPUTS", "")]
+    return {**os.environ, "TEXINPUTS": os.pathsep.join(paths).rstrip(os.pathsep) + os.pathsep}
+
+# ---- Figure externalization ----
+# Each tikzpicture is compiled once into its own PDF, cached under a hash of
+# its source and the document preamble, and included as a graphic.
+_TIKZPICTURE = re.compile(r"\\begin\{tikzpicture\}.*?\\end\{tikzpicture\}", re.DOTALL)
+_COMMENT = re.compile(r"(?<!\\)%[^\n]*")
+# Text that is not typeset as written: pictures there are left alone
+_VERBATIM = re.compile(
+    r"\\begin\{(verbatim\*?|Verbatim\*?|lstlisting|minted|comment|filecontents\*?)\}.*?\\end\{\1\}"
+    r"|\\verb\*?([^A-Za-z\s]).*?\2",
+    re.DOTALL,
+)
+# Definitions and how many braced groups follow the defined name (\def\x#1{...} has one)
+_DEFINITION = re.compile(
+    r"\\(?:((?:re)?newcommand|providecommand|[gex]?def)|((?:re)?newenvironment)"
+    r"|((?:New|Renew|Provide|Declare)DocumentCommand)|((?:New|Renew)DocumentEnvironment))\*?(?![A-Za-z])"
+)
+# Pictures that depend on the page or on the main document's .aux stay inline
+_KEEP_INLINE = re.compile(r"remember picture|overlay|baseline|\\(?:ref|eqref|pageref|cite|label)\b|#")
+# Preamble lines that cannot change how a figure renders
+_PREAMBLE_NOISE = re.compile(r"^\s*\\(?:title|author|date|hypersetup)\b.*$", re.MULTILINE)
+
+figure_stats = {"hits": 0, "builds": 0, "failures": 0, "skipped_failures": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+
+def _count(outcome: str, n: int = 1):
+    with _stats_lock:
+        figure_stats[outcome] += n
+
+def _blank(match) -> str:
+    # Same length as the match so offsets into the text stay valid
+    return " " * len(match.group(0))
+
+def _mask_comments(text: str) -> str:
+    return _COMMENT.sub(_blank, text)
+
+def _group_end(text: str, start: int) -> int:
+    """End of the braced group opening at or after start (len(text) if unbalanced)."""
+    start = text.find("{", start)
+    if start < 0:
+        return len(text)
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == "{" and text[i - 1] != "\\":
+            depth += 1
+        elif text[i] == "}" and text[i - 1] != "\\":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return len(text)
+
+def _mask_definitions(text: str) -> str:
+    parts, last = [], 0
+    for match in _DEFINITION.finditer(text):
+        if match.start() < last:
+            continue
+        groups = 1 if match.group(1) else 2 if match.group(2) or match.group(3) else 3
+        # The defined name is a group ({\x}) or a control sequence (\x)
+        end = match.end()
+        name = re.match(r"\s*(?:\\[A-Za-z@]+|\\.|\{)", text[end:])
+        if name:
+            end = _group_end(text, end) if name.group(0).endswith("{") else end + name.end()
+        for _ in range(groups):
+            end = _group_end(text, end)
+        parts.append(text[last:match.start()] + " " * (end - match.start()))
+        last = end
+    return "".join(parts) + text[last:]
+
+def _mask_unsafe(body: str) -> str:
+    """Blank out verbatim text, comments and macro definitions (same length as body)."""
+    return _mask_definitions(_mask_comments(_VERBATIM.sub(_blank, body)))
+
+def _figure_key(preamble: str, picture: str) -> str:
+    relevant = _PREAMBLE_NOISE.sub("", _mask_comments(preamble))
+    digest = hashlib.sha256(" ".join(relevant.split()).encode("utf-8"))
+    digest.update(b"\0" + picture.encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+def _figure_pdf(key: str) -> str:
+    return os.path.join(os.path.abspath(settings.FIGURE_CACHE_DIR), f"figure-{key}.pdf")
+
+_FIGURE_COMMAND = ["pdflatex", "-interaction=nonstopmode", "-halt-on-error", "figure.tex"]
+
+def _write_figure_source(tmpdir: str, preamble: str, picture: str):
+    # The preview package crops the page to the picture
+    with open(os.path.join(tmpdir, "figure.tex"), "w", encoding="utf-8") as f:
+        f.write(
+            preamble
+            + "\\usepackage[active,tightpage]{preview}\n"
+            + "\\PreviewEnvironment{tikzpicture}\n\\setlength\\PreviewBorder{0pt}\n"
+            + "\\begin{document}\n" + picture + "\n\\end{document}\n"
+        )
+
+def _install_figure(tmpdir: str, key: str) -> bool:
+    built = os.path.join(tmpdir, "figure.pdf")
+    if not os.path.exists(built):
+        return False
+    target = _figure_pdf(key)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Copied under a temporary name and renamed, so concurrent compiles never see partial files
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+    os.close(fd)
+    shutil.copyfile(built, tmp_path)
+    os.replace(tmp_path, target)
+    prune_figure_cache()
+    return True
+
+_prune_lock = threading.Lock()
+
+def prune_figure_cache():
+    """
+    Drop figures unused for FIGURE_CACHE_MAX_AGE_DAYS, then the least recently
+    used ones until the cache fits in FIGURE_CACHE_MAX_MB. A figure's mtime is
+    its last use (hits touch it).
+    """
+    if not _prune_lock.acquire(blocking=False):
+        return  # another build is already pruning
+    try:
+        removed = prune_lru(
+            os.path.abspath(settings.FIGURE_CACHE_DIR),
+            lambda name: name.startswith("figure-") and name.endswith(".pdf"),
+            settings.FIGURE_CACHE_MAX_MB, settings.FIGURE_CACHE_MAX_AGE_DAYS,
+        )
+        _count("evictions", removed)
+    except OSError:
+        pass
+    finally:
+        _prune_lock.release()
+
+# Figures whose build failed, by key, and when they may be built again: a
+# broken picture stays inline without costing a pdflatex run on every compile
+_failed_figures: Dict[str, float] = {}
+_failed_lock = threading.Lock()
+
+def _failed_recently(key: str) -> bool:
+    with _failed_lock:
+        retry_at = _failed_figures.get(key)
+    if retry_at is not None and retry_at > time.monotonic():
+        _count("skipped_failures")
+        return True
+    return False
+
+def _record_failure(key: str):
+    now = time.monotonic()
+    with _failed_lock:
+        for expired in [k for k, retry_at in _failed_figures.items() if retry_at <= now]:
+            del _failed_figures[expired]
+        _failed_figures[key] = now + settings.FIGURE_FAILURE_TTL_SECONDS
+    _count("failures")
+
+def _cached_figure(path: str) -> bool:
+    """Whether a figure is cached, marking it as recently used."""
+    try:
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+def _build_figure(preamble: str, picture: str, key: str) -> bool:
+    """Compile one picture with the given preamble into the figure cache."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _write_figure_source(tmpdir, preamble, picture)
+        try:
+            result = subprocess.run(
+                _FIGURE_COMMAND, cwd=tmpdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                timeout=60, env=_tex_env(),
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return False
+        # A failed run can still leave a (partial) PDF behind
+        return result.returncode == 0 and _install_figure(tmpdir, key)
+
+def render_figure(preamble: str, picture: str) -> Optional[str]:
+    """Path of the cached PDF of a tikzpicture, building it if needed; None if it does not compile."""
+    key = _figure_key(preamble, picture)
+    path = _figure_pdf(key)
+    if _cached_figure(path):
+        _count("hits")
+        return path
+    if _failed_recently(key):
+        return None
+    if _build_figure(preamble, picture, key):
+        _count("builds")
+        return path
+    _record_failure(key)
+    return None
+
+async def compile_snippet(preamble: str, picture: str, timeout: float = 30.0) -> Optional[str]:
+    """
+    Async render_figure for interactive checks: a single pdflatex run that is
+    killed if the calling task is cancelled or the timeout expires.
+    """
+    key = _figure_key(preamble, picture)
+    path = _figure_pdf(key)
+    if _cached_figure(path):
+        _count("hits")
+        return path
+    if _failed_recently(key):
+        return None
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _write_figure_source(tmpdir, preamble, picture)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *_FIGURE_COMMAND, cwd=tmpdir, stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL, env=_tex_env(),
+            )
+        except OSError:
+            _count("failures")
+            return None
+        try:
+            await asyncio.wait_for(process.wait(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+        except asyncio.CancelledError:
+            # The caller no longer needs the result: do not leave pdflatex running,
+            # and reap it before the temporary directory is removed
+            process.kill()
+            await asyncio.shield(process.wait())
+            raise
+        if process.returncode == 0 and _install_figure(tmpdir, key):
+            _count("builds")
+            return path
+        if process.returncode > 0:
+            # pdflatex rejected the picture; a kill at this caller's timeout says
+            # nothing about other callers, so that is not remembered
+            _record_failure(key)
+            return None
+    _count("failures")
+    return None
+
+def externalize_figures(content: str) -> str:
+    """
+    Replace every tikzpicture of a document by \\includegraphics of its cached
+    PDF. Missing figures are built in parallel (FIGURE_BUILD_WORKERS); a figure
+    that fails to build stays inline so the main compile reports its error.
+    Pictures in verbatim text, comments and macro definitions are left alone.
+    """
+    begin = content.find("\\begin{document}")
+    if begin < 0:
+        return content
+    preamble, body = content[:begin], content[begin:]
+    pictures = [
+        (m.start(), m.end()) for m in _TIKZPICTURE.finditer(_mask_unsafe(body))
+        if not _KEEP_INLINE.search(body[m.start():m.end()])
+    ]
+    if not pictures:
+        return content
+
+    sources = list(dict.fromkeys(body[start:end] for start, end in pictures))
+    workers = max(1, min(settings.FIGURE_BUILD_WORKERS or os.cpu_count() or 1, len(sources)))
+    with ThreadPoolExecutor(workers) as pool:
+        paths = dict(zip(sources, pool.map(lambda picture: render_figure(preamble, picture), sources)))
+
+    # Line numbers in the compile log must still point into the document the
+    # user wrote: nothing adds a line, and each replacement keeps the picture's
+    # line breaks as comment lines (not blank lines, which would end a paragraph)
+    # with the graphic on the line where the picture ended
+    parts, last = [], 0
+    for start, end in pictures:
+        path = paths[body[start:end]]
+        if path is not None:
+            parts.append(body[last:start])
+            parts.append("%\n" * body.count("\n", start, end) + "\\includegraphics{" + os.path.basename(path) + "}")
+            last = end
+    if not parts:
+        return content
+    parts.append(body[last:])
+    return preamble + "\\usepackage{graphicx}" + "".join(parts)
 
 def compile_latex(content: str):
     """
@@ -25,10 +310,16 @@ def compile_latex(content: str):
         tex_path = os.path.join(tmpdir, "document.tex")
         pdf_path = os.path.join(tmpdir, "document.pdf")
         
+        touch_artifacts(content)
+        if settings.FIGURE_EXTERNALIZE:
+            content = externalize_figures(content)
+
         # Write the LaTeX content to the .tex file
         with open(tex_path, "w", encoding="utf-8") as f:
             f.write(content)
 
+        env = _tex_env()
+
         try:
             # We run pdflatex from within the temporary directory using `cwd`.
             # This ensures all output files (.pdf, .log, etc.) are placed there.
@@ -42,7 +333,8 @@ def compile_latex(content: str):
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
-                timeout=60
+                timeout=60,
+                env=env
             )
 
             # Second pass: Crucial for resolving all cross-references, table of
@@ -53,7 +345,8 @@ def compile_latex(content: str):
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
-                timeout=60
+                timeout=60,
+                env=env
             )
             
             # The compilation log is a combination of stdout and stderr
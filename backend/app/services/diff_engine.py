@@ -0,0 +1,478 @@
+import bisect
+import re
+import time
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+# Opcodes use the difflib convention: (tag, i1, i2, j1, j2)
+Opcode = Tuple[str, int, int, int, int]
+# Matching blocks use the difflib convention: (i, j, size)
+Block = Tuple[int, int, int]
+
+# Histogram diff ignores elements that occur more often than this in a region
+# (e.g. "\item", "\\", blank lines) when choosing anchors
+MAX_HISTOGRAM_OCCURRENCES = 64
+
+
+class _Deadline:
+    def __init__(self, budget_seconds: Optional[float]):
+        self.at = time.monotonic() + budget_seconds if budget_seconds else None
+        self.hit = False
+
+    def expired(self) -> bool:
+        if self.at is not None and not self.hit and time.monotonic() > self.at:
+            self.hit = True
+        return self.hit
+
+
+def _intern(a: Sequence[Hashable], b: Sequence[Hashable]) -> Tuple[List[int], List[int]]:
+    """Map elements to small ints so comparisons in the hot loops are cheap."""
+    ids: Dict[Hashable, int] = {}
+    return [ids.setdefault(x, len(ids)) for x in a], [ids.setdefault(x, len(ids)) for x in b]
+
+
+# ---- Myers (linear space) ----
+def _myers_split(a, alo, ahi, b, blo, bhi, deadline: _Deadline) -> Optional[Tuple[int, int]]:
+    """
+    Find the middle snake of a[alo:ahi] vs b[blo:bhi] (Myers 1986, linear
+    space variant) and return the split point (x, y) in absolute indices,
+    or None when there is no common element or the deadline expired.
+    """
+    n, m = ahi - alo, bhi - blo
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    size = 2 * max_d + 2
+    v1 = [-1] * size
+    v2 = [-1] * size
+    v1[offset + 1] = 0
+    v2[offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d):
+        if deadline.expired():
+            return None
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = offset + delta - k1
+                if 0 <= k2_offset < size and v2[k2_offset] != -1 and x1 >= n - v2[k2_offset]:
+                    return alo + x1, blo + y1
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - x2 - 1] == b[bhi - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < size and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    y1 = offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        return alo + x1, blo + y1
+    return None
+
+
+# ---- anchor selection ----
+def _histogram_anchor(a, alo, ahi, b, blo, bhi) -> Optional[Tuple[int, int, int]]:
+    """
+    Histogram diff anchor: the longest common run containing the element with
+    the lowest occurrence count in a[alo:ahi]. Returns (i, j, length) or None.
+    """
+    positions: Dict[int, List[int]] = {}
+    for i in range(alo, ahi):
+        positions.setdefault(a[i], []).append(i)
+
+    best = None  # (count, -length, i, j)
+    j = blo
+    while j < bhi:
+        occurrences = positions.get(b[j])
+        next_j = j + 1
+        if occurrences and len(occurrences) <= MAX_HISTOGRAM_OCCURRENCES:
+            count = len(occurrences)
+            if best is None or count <= best[0]:
+                for i in occurrences:
+                    si, sj = i, j
+                    while si > alo and sj > blo and a[si - 1] == b[sj - 1]:
+                        si -= 1
+                        sj -= 1
+                    ei, ej = i + 1, j + 1
+                    while ei < ahi and ej < bhi and a[ei] == b[ej]:
+                        ei += 1
+                        ej += 1
+                    candidate = (count, -(ei - si), si, sj)
+                    if best is None or candidate < best:
+                        best = candidate
+                    next_j = max(next_j, ej)
+        j = next_j
+    if best is None:
+        return None
+    return best[2], best[3], -best[1]
+
+
+def _patience_anchors(a, alo, ahi, b, blo, bhi) -> List[Tuple[int, int]]:
+    """
+    Patience diff anchors: elements that occur exactly once in both regions,
+    reduced to their longest increasing subsequence.
+    """
+    counts: Dict[int, List[int]] = {}
+    for i in range(alo, ahi):
+        entry = counts.setdefault(a[i], [0, 0, i])
+        entry[0] += 1
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is not None:
+            entry[1] += 1
+            entry.append(j)
+    pairs = [(e[2], e[3]) for e in counts.values() if e[0] == 1 and e[1] == 1]
+    if not pairs:
+        return []
+    pairs.sort(key=lambda p: p[1])
+
+    # Longest increasing subsequence of a-indices (patience sorting)
+    tails: List[int] = []
+    tail_index: List[int] = []
+    previous: List[int] = [-1] * len(pairs)
+    for n, (i, _) in enumerate(pairs):
+        k = bisect.bisect_left(tails, i)
+        if k == len(tails):
+            tails.append(i)
+            tail_index.append(n)
+        else:
+            tails[k] = i
+            tail_index[k] = n
+        previous[n] = tail_index[k - 1] if k > 0 else -1
+    result = []
+    n = tail_index[-1]
+    while n != -1:
+        result.append(pairs[n])
+        n = previous[n]
+    return result[::-1]
+
+
+# ---- driver ----
+def matching_blocks(
+    a: Sequence[Hashable],
+    b: Sequence[Hashable],
+    algorithm: str = "histogram",
+    deadline: Optional[_Deadline] = None,
+) -> List[Block]:
+    """
+    Return matching blocks (i, j, size) of a and b, ending with the sentinel
+    (len(a), len(b), 0) like difflib.SequenceMatcher.get_matching_blocks().
+
+    algorithm is "histogram", "patience" or "myers"; the first two fall back to
+    Myers for regions without usable anchors. When the deadline expires,
+    unresolved regions are reported as fully changed.
+    """
+    deadline = deadline or _Deadline(None)
+    a, b = _intern(a, b)
+    matches: List[Block] = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        # Common prefix / suffix
+        start = 0
+        while alo + start < ahi and blo + start < bhi and a[alo + start] == b[blo + start]:
+            start += 1
+        if start:
+            matches.append((alo, blo, start))
+            alo += start
+            blo += start
+        end = 0
+        while ahi - end > alo and bhi - end > blo and a[ahi - end - 1] == b[bhi - end - 1]:
+            end += 1
+        if end:
+            matches.append((ahi - end, bhi - end, end))
+            ahi -= end
+            bhi -= end
+        if alo == ahi or blo == bhi or deadline.expired():
+            continue
+
+        if algorithm == "histogram":
+            anchor = _histogram_anchor(a, alo, ahi, b, blo, bhi)
+            if anchor:
+                i, j, length = anchor
+                matches.append((i, j, length))
+                stack.append((alo, i, blo, j))
+                stack.append((i + length, ahi, j + length, bhi))
+                continue
+        elif algorithm == "patience":
+            anchors = _patience_anchors(a, alo, ahi, b, blo, bhi)
+            if anchors:
+                previous_i, previous_j = alo, blo
+                for i, j in anchors:
+                    matches.append((i, j, 1))
+                    stack.append((previous_i, i, previous_j, j))
+                    previous_i, previous_j = i + 1, j + 1
+                stack.append((previous_i, ahi, previous_j, bhi))
+                continue
+
+        split = _myers_split(a, alo, ahi, b, blo, bhi, deadline)
+        if split:
+            x, y = split
+            stack.append((alo, x, blo, y))
+            stack.append((x, ahi, y, bhi))
+
+    # Sort and coalesce adjacent blocks
+    matches.sort()
+    blocks: List[Block] = []
+    for i, j, size in matches:
+        if blocks and blocks[-1][0] + blocks[-1][2] == i and blocks[-1][1] + blocks[-1][2] == j:
+            blocks[-1] = (blocks[-1][0], blocks[-1][1], blocks[-1][2] + size)
+        elif size:
+            blocks.append((i, j, size))
+    blocks.append((len(a), len(b), 0))
+    return blocks
+
+
+def opcodes_from_blocks(blocks: List[Block]) -> List[Opcode]:
+    """Convert matching blocks to difflib-style opcodes."""
+    opcodes: List[Opcode] = []
+    i = j = 0
+    for ai, bj, size in blocks:
+        if i < ai and j < bj:
+            opcodes.append(("replace", i, ai, j, bj))
+        elif i < ai:
+            opcodes.append(("delete", i, ai, j, bj))
+        elif j < bj:
+            opcodes.append(("insert", i, ai, j, bj))
+        if size:
+            opcodes.append(("equal", ai, ai + size, bj, bj + size))
+        i, j = ai + size, bj + size
+    return opcodes
+
+
+def grouped_opcodes(opcodes: List[Opcode], n: int = 3) -> List[List[Opcode]]:
+    """Group opcodes into hunks with n elements of context (as difflib does)."""
+    codes = list(opcodes) or [("equal", 0, 1, 0, 1)]
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    groups: List[List[Opcode]] = []
+    group: List[Opcode] = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "equal" and i2 - i1 > 2 * n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            groups.append(group)
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        groups.append(group)
+    return groups
+
+
+# ---- tokenization ----
+_WORD_TOKENS = re.compile(r"\n|[^\S\n]+|\w+|[^\w\s]")
+_LATEX_TOKENS = re.compile(
+    r"\n|%[^\n]*|\\[A-Za-z@]+\*?|\\.|\$\$|[^\S\n]+|\w+|[^\w\s]"
+)
+
+
+def tokenize(text: str, granularity: str) -> List[str]:
+    """
+    Split text into diff units: "line" (lines without their endings), "word"
+    (words, whitespace runs, punctuation) or "latex" (control sequences,
+    comments, math delimiters, braces, words).
+    """
+    if granularity == "line":
+        return text.splitlines()
+    pattern = _WORD_TOKENS if granularity == "word" else _LATEX_TOKENS
+    return pattern.findall(text)
+
+
+def _line_starts(tokens: List[str], granularity: str) -> List[int]:
+    """1-based line number at which each token starts (plus one entry past the end)."""
+    if granularity == "line":
+        return list(range(1, len(tokens) + 2))
+    line = 1
+    starts = []
+    for token in tokens:
+        starts.append(line)
+        line += token.count("\n")
+    starts.append(line)
+    return starts
+
+
+# ---- high-level API ----
+def _format_range(start: int, stop: int) -> str:
+    # Same as difflib's unified range format
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return str(beginning)
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def _unified(old: List[str], new: List[str], opcodes: List[Opcode], context: int) -> str:
+    lines = []
+    for group in grouped_opcodes(opcodes, context):
+        if not lines:
+            lines += ["--- old", "+++ new"]
+        first, last = group[0], group[-1]
+        lines.append(
+            f"@@ -{_format_range(first[1], last[2])} +{_format_range(first[3], last[4])} @@"
+        )
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                lines += [" " + line for line in old[i1:i2]]
+                continue
+            if tag in ("replace", "delete"):
+                lines += ["-" + line for line in old[i1:i2]]
+            if tag in ("replace", "insert"):
+                lines += ["+" + line for line in new[j1:j2]]
+    return "\n".join(lines)
+
+
+def _inline(old: List[str], new: List[str], opcodes: List[Opcode]) -> str:
+    # wdiff-style: [-removed-]{+added+}
+    out = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            out.append("".join(old[i1:i2]))
+            continue
+        if tag in ("replace", "delete"):
+            out.append("[-" + "".join(old[i1:i2]) + "-]")
+        if tag in ("replace", "insert"):
+            out.append("{+" + "".join(new[j1:j2]) + "+}")
+    return "".join(out)
+
+
+def _hunks(old: List[str], new: List[str], opcodes: List[Opcode], granularity: str) -> List[dict]:
+    old_lines, new_lines = _line_starts(old, granularity), _line_starts(new, granularity)
+    if granularity == "line":
+        join = lambda tokens: "".join(t + "\n" for t in tokens)
+    else:
+        join = "".join
+    hunks = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            continue
+        hunks.append({
+            "op": tag,
+            "old_start": old_lines[i1],
+            "old_end": old_lines[i2 - 1] if i2 > i1 else old_lines[i1],
+            "new_start": new_lines[j1],
+            "new_end": new_lines[j2 - 1] if j2 > j1 else new_lines[j1],
+            "old_text": join(old[i1:i2]),
+            "new_text": join(new[j1:j2]),
+        })
+    return hunks
+
+
+def diff_texts(
+    old_text: str,
+    new_text: str,
+    granularity: str = "line",
+    algorithm: str = "histogram",
+    context: int = 3,
+    time_budget_ms: Optional[int] = 500,
+) -> dict:
+    """
+    Diff two texts.
+
+    Returns {"diff", "hunks", "granularity", "algorithm", "degraded"}: "diff"
+    is a unified diff for line granularity and an inline [-old-]{+new+} diff
+    otherwise; "hunks" lists every change with 1-based line ranges. If a finer
+    granularity runs out of time it is redone at line level, and if the line
+    diff runs out of time the remaining regions are reported as replaced
+    wholesale ("degraded": true).
+    """
+    budget = time_budget_ms / 1000 if time_budget_ms else None
+    started = time.monotonic()
+    degraded = False
+
+    if granularity != "line":
+        old, new = tokenize(old_text, granularity), tokenize(new_text, granularity)
+        deadline = _Deadline(budget)
+        blocks = matching_blocks(old, new, algorithm, deadline)
+        if not deadline.hit:
+            opcodes = opcodes_from_blocks(blocks)
+            return {
+                "diff": _inline(old, new, opcodes),
+                "hunks": _hunks(old, new, opcodes, granularity),
+                "granularity": granularity,
+                "algorithm": algorithm,
+                "degraded": False,
+            }
+        degraded = True
+
+    old, new = tokenize(old_text, "line"), tokenize(new_text, "line")
+    remaining = budget - (time.monotonic() - started) if budget else None
+    deadline = _Deadline(max(remaining, 0.001) if remaining is not None else None)
+    opcodes = opcodes_from_blocks(matching_blocks(old, new, algorithm, deadline))
+    return {
+        "diff": _unified(old, new, opcodes, context),
+        "hunks": _hunks(old, new, opcodes, "line"),
+        "granularity": "line",
+        "algorithm": algorithm,
+        "degraded": degraded or deadline.hit,
+    }
+
+
+def remap_lines(old_text: str, new_text: str) -> Tuple[int, int, int, Callable[[int], int]]:
+    """
+    Describe how 1-based line numbers move when old_text becomes new_text.
+
+    Returns (first, last, shift, map_line): lines before `first` keep their
+    number, lines after `last` move by `shift`, and map_line(n) gives the new
+    number of a line in [first, last]. Lines that were deleted or rewritten map
+    to the corresponding line of the replacement. Only the changed region
+    between the common prefix and suffix is diffed, and only when map_line is
+    first called.
+    """
+    old, new = old_text.splitlines(), new_text.splitlines()
+    limit = min(len(old), len(new))
+    prefix = 0
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    first, last = prefix + 1, len(old) - suffix
+    opcodes: List[Opcode] = []
+
+    def map_line(line: int) -> int:
+        if not opcodes:
+            middle_old, middle_new = old[prefix:len(old) - suffix], new[prefix:len(new) - suffix]
+            opcodes.extend(opcodes_from_blocks(matching_blocks(middle_old, middle_new)))
+        i = line - first
+        for tag, i1, i2, j1, j2 in opcodes:
+            if i1 <= i < i2:
+                if tag == "equal":
+                    target = j1 + (i - i1)
+                else:
+                    target = j1 + min(i - i1, max(j2 - j1 - 1, 0))
+                return max(1, min(prefix + target + 1, len(new)))
+        return line
+
+    return first, last, len(new) - len(old), map_line
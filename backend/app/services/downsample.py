@@ -0,0 +1,71 @@
+"""
+Downsampling of plot series to what a plot of a given width can show.
+
+Both methods return the indexes of the points to keep, in their original
+order, and always keep the first and last point.
+"""
+from typing import List, Sequence, Tuple
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, target: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: from each bucket keep the point forming the
+    largest triangle with the previously kept point and the next bucket's mean.
+    """
+    n = len(x)
+    if n <= target or target < 3:
+        return np.arange(n)
+    # target - 2 buckets over the interior points
+    edges = np.linspace(1, n - 1, target - 1).astype(int)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y[-1])
+
+    keep = np.empty(target, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(target - 2):
+        start, end = edges[i], edges[i + 1]
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[a] - mean_x[i]) * (by - y[a]) - (x[a] - bx) * (mean_y[i] - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def min_max(x: np.ndarray, y: np.ndarray, target: int) -> np.ndarray:
+    """
+    Keep the lowest and highest point of each of ~target/2 buckets, so spikes
+    survive. Buckets are slices of the x range when x is sorted (one per
+    horizontal pixel column), and runs of consecutive points otherwise.
+    """
+    n = len(x)
+    if n <= target:
+        return np.arange(n)
+    buckets = max((target - 2) // 2, 1)  # two points each, plus the end points
+    span = x[-1] - x[0]
+    if span > 0 and np.all(np.diff(x) >= 0):
+        ids = np.minimum(((x - x[0]) / span * buckets).astype(np.int64), buckets - 1)
+    else:
+        ids = np.arange(n) * buckets // n
+    # Sort by bucket, then y: each bucket's first entry is its minimum, its last its maximum
+    order = np.lexsort((y, ids))
+    sorted_ids = ids[order]
+    first = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    last = np.r_[first[1:] - 1, n - 1]
+    return np.unique(np.r_[0, order[first], order[last], n - 1])
+
+
+METHODS = {"lttb": lttb, "minmax": min_max}
+
+
+def downsample(points: Sequence[Sequence[float]], target: int, method: str = "lttb") -> List[Tuple[float, float]]:
+    """Reduce [[x, y], ...] to about `target` points with the given method."""
+    if len(points) <= target:
+        return points
+    data = np.asarray(points, dtype=float)
+    keep = METHODS[method](data[:, 0], data[:, 1], target)
+    return data[keep].tolist()
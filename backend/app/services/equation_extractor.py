@@ -0,0 +1,127 @@
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+# Display-math environments whose equalities are checked
+ENVIRONMENTS = ("equation", "align", "gather", "multline", "eqnarray")
+
+_ENVIRONMENT = re.compile(
+    r"\\begin\{((?:%s)\*?)\}(.*?)\\end\{\1\}" % "|".join(ENVIRONMENTS), re.DOTALL
+)
+_DISPLAY = re.compile(r"\$\$(.*?)\$\$|\\\[(.*?)\\\]", re.DOTALL)
+_COMMENT = re.compile(r"(?<!\\)%[^\n]*")
+_LABEL = re.compile(r"\\label\{([^}]*)\}")
+_ROW_BREAK = re.compile(r"\\\\(?:\[[^\]]*\])?")
+_NOISE = re.compile(r"\\(?:nonumber|notag)\b|\\label\{[^}]*\}|&")
+_TRAILING = re.compile(r"(?:\\q?quad\b.*|[,.;]\s*)$", re.DOTALL)
+# A lone name such as "y", "E_k" or "f(x)" on the left of a chain is being defined
+_DEFINED_NAME = re.compile(r"^\\?[A-Za-z]+(?:_\{?\w+\}?)?(?:\([^()=]*\))?$")
+
+
+@dataclass
+class Equation:
+    """A display-math block with its location (1-based lines, 0-based character offsets)."""
+    kind: str
+    source: str
+    start: int
+    end: int
+    start_line: int
+    end_line: int
+    label: Optional[str] = None
+    steps: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def hash(self) -> str:
+        # Whitespace does not change what is being checked
+        return hashlib.sha256(" ".join(self.source.split()).encode("utf-8")).hexdigest()
+
+
+def _mask_comments(content: str) -> str:
+    # Same length as the input so match offsets stay valid
+    return _COMMENT.sub(lambda m: " " * len(m.group(0)), content)
+
+
+def _split_top_level(text: str, separator: str) -> List[str]:
+    """Split on a character outside braces and brackets."""
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char in "{[(" and (i == 0 or text[i - 1] != "\\"):
+            depth += 1
+        elif char in "}])" and (i == 0 or text[i - 1] != "\\"):
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def equality_steps(body: str) -> List[Tuple[str, str]]:
+    """
+    Turn the body of a display-math block into consecutive equalities.
+
+    Rows are separated by \\\\. A row starting with "=" continues the previous
+    chain (as in align: "a &= b \\\\ &= c"), and a row without "=" continues the
+    previous row's last expression. Definitions (":=", or a lone name such
+    as "y" or "f(x)" at the start of a chain) are not checked.
+    """
+    chains: List[List[str]] = []
+    for row in _ROW_BREAK.split(body):
+        row = _NOISE.sub(" ", row).strip()
+        row = _TRAILING.sub("", row).strip()
+        if not row:
+            continue
+        parts = [p.strip() for p in _split_top_level(row, "=")]
+        if chains and len(parts) > 1 and not parts[0]:
+            chains[-1].extend(parts[1:])
+        elif chains and len(parts) == 1:
+            chains[-1][-1] = f"{chains[-1][-1]} {parts[0]}".strip()
+        else:
+            chains.append(parts)
+
+    steps = []
+    for chain in chains:
+        if len(chain) > 1 and _DEFINED_NAME.match(chain[0]):
+            chain = chain[1:]
+        for left, right in zip(chain, chain[1:]):
+            if left and right and not left.endswith(":"):
+                steps.append((left, right))
+    return steps
+
+
+def extract_equations(content: str) -> List[Equation]:
+    """
+    Find equation/align/gather/multline/eqnarray environments, $$...$$ and
+    \\[...\\] blocks (ignoring commented-out source), in document order.
+    """
+    masked = _mask_comments(content)
+    found = []
+    for match in _ENVIRONMENT.finditer(masked):
+        found.append((match.start(), match.end(), match.group(1), match.start(2), match.end(2)))
+    for match in _DISPLAY.finditer(masked):
+        group = 1 if match.group(1) is not None else 2
+        kind = "$$" if group == 1 else "\\["
+        found.append((match.start(), match.end(), kind, match.start(group), match.end(group)))
+    found.sort()
+
+    equations: List[Equation] = []
+    last_end = -1
+    for start, end, kind, body_start, body_end in found:
+        if start < last_end:
+            continue  # nested in a block already taken
+        last_end = end
+        body = masked[body_start:body_end]
+        label = _LABEL.search(body)
+        start_line = content.count("\n", 0, start) + 1
+        equations.append(Equation(
+            kind=kind,
+            source=content[start:end],
+            start=start,
+            end=end,
+            start_line=start_line,
+            end_line=start_line + content.count("\n", start, end),
+            label=label.group(1) if label else None,
+            steps=equality_steps(body),
+        ))
+    return equations
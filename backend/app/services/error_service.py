@@ -1,6 +1,20 @@
+import json
 import re
-from app.services.ai_service import client
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from app.services.llm_gateway import gateway
+from app.services.ai_service import FenceStripper
 from app.schemas.compile_schema import FixErrorRequest
+from app.services.fix_rules import apply_rules
+
+# Lines of source sent on each side of a failing line
+CONTEXT_LINES = 8
+
+@dataclass
+class LogError:
+    message: str
+    line: Optional[int] = None   # 1-based source line, when the log reports one
+    context: str = ""            # source excerpt pdflatex printed after "l.<n>"
 
 def parse_log(log: str) -> str:
     """
@@ -12,29 +26,201 @@ def parse_log(log: str) -> str:
             errors.append(line.strip())
     return "\n".join(errors) if errors else log
 
+def parse_log_entries(log: str) -> List[LogError]:
+    """
+    Extract structured errors from a pdflatex log.
+
+    Understands both the default format ("! Message." followed later by
+    "l.<n> <source>") and -file-line-error output ("./file.tex:<n>: Message").
+    Duplicates (pdflatex runs twice) are dropped.
+    """
+    lines = log.splitlines()
+    entries: List[LogError] = []
+    seen = set()
+
+    def add(entry: LogError):
+        key = (entry.message, entry.line)
+        if key not in seen:
+            seen.add(key)
+            entries.append(entry)
+
+    for i, line in enumerate(lines):
+        file_line = re.match(r"^\S*\.tex:(\d+): (.*)$", line)
+        if file_line:
+            add(LogError(message=file_line.group(2).strip(), line=int(file_line.group(1))))
+            continue
+        if line.startswith("! "):
+            entry = LogError(message=line[2:].strip())
+            # The "l.<n>" marker follows within a few lines of the message
+            for follow in lines[i + 1:i + 12]:
+                if follow.startswith("! "):
+                    break
+                marker = re.match(r"^l\.(\d+) ?(.*)$", follow)
+                if marker:
+                    entry.line = int(marker.group(1))
+                    entry.context = marker.group(2)
+                    break
+            add(entry)
+    return entries
+
 def clean_code_blocks(text: str) -> str:
     """
     Remove markdown-style code fences such as ```latex, ```json, etc.
     """
-    # Regex removes ``` followed by optional language (letters) and the trailing ```
-    return re.sub(r"```(?:\w+)?\s*|```", "", text).strip()
+    # Removes ``` followed by an optional language word and whitespace, and bare ```
+    stripper = FenceStripper("word")
+    return stripper.feed(text) + stripper.finish()
+
+# ---- Error-local fixing ----
+def _preamble_end(lines: List[str]) -> int:
+    """Number of lines before \\begin{document} (0 if there is none)."""
+    for i, line in enumerate(lines):
+        if "\\begin{document}" in line:
+            return i
+    return 0
+
+def _error_windows(lines: List[str], errors: List[LogError]) -> List[Tuple[int, int]]:
+    """
+    Merge [line - CONTEXT_LINES, line + CONTEXT_LINES] ranges (1-based, inclusive)
+    around every failing line that lies outside the preamble.
+    """
+    preamble_end = _preamble_end(lines)
+    ranges = []
+    for err in errors:
+        if err.line is None or err.line <= preamble_end:
+            continue
+        line = min(err.line, len(lines))
+        ranges.append((max(preamble_end + 1, line - CONTEXT_LINES), min(len(lines), line + CONTEXT_LINES)))
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _numbered(lines: List[str], start: int, end: int) -> str:
+    return "\n".join(f"{n:>5}| {lines[n - 1]}" for n in range(start, end + 1))
+
+def _parse_patches(text: str) -> Tuple[List[dict], str]:
+    data = json.loads(clean_code_blocks(text))
+    patches = [
+        {"start_line": int(p["start_line"]), "end_line": int(p["end_line"]), "replacement": str(p["replacement"])}
+        for p in data.get("patches", [])
+    ]
+    return patches, str(data.get("explanation", ""))
+
+def apply_patches(content: str, patches: List[dict], allowed: List[Tuple[int, int]]) -> str:
+    """
+    Apply line patches to content. Every patch must fall inside one of the
+    allowed ranges, and patches must not overlap; otherwise ValueError is raised.
+    """
+    lines = content.split("\n")
+    ordered = sorted(patches, key=lambda p: (p["start_line"], p["end_line"]))
+    previous_end = 0
+    for patch in ordered:
+        start, end = patch["start_line"], patch["end_line"]
+        if end < start - 1 or start < 1 or end > len(lines):
+            raise ValueError(f"Invalid patch range {start}-{end}")
+        if start <= previous_end:
+            raise ValueError(f"Overlapping patch at line {start}")
+        if not any(lo <= start and end <= hi for lo, hi in allowed):
+            raise ValueError(f"Patch {start}-{end} is outside the provided context")
+        previous_end = max(end, start)
+    # Apply bottom-up so earlier line numbers stay valid
+    for patch in reversed(ordered):
+        replacement = patch["replacement"].split("\n") if patch["replacement"] else []
+        lines[patch["start_line"] - 1:patch["end_line"]] = replacement
+    return "\n".join(lines)
 
-def fix_errors(request: FixErrorRequest) -> dict:
+async def _fix_locally(request: FixErrorRequest, errors: List[LogError]) -> Optional[dict]:
     """
-    Ask Gemini to fix LaTeX errors based on log + content.
+    Send only the preamble and the windows around failing lines, and apply the
+    returned patches. Returns None when the errors cannot be localized or the
+    model reply is unusable, so the caller can fall back to a full rewrite.
     """
+    lines = request.content.split("\n")
+    windows = _error_windows(lines, errors)
+    preamble_end = _preamble_end(lines)
+    if not windows and not any(e.line for e in errors):
+        return None
+
+    allowed = ([(1, preamble_end)] if preamble_end else []) + windows
+    sections = []
+    if preamble_end:
+        sections.append("PREAMBLE:\n" + _numbered(lines, 1, preamble_end))
+    for start, end in windows:
+        sections.append(f"LINES {start}-{end}:\n" + _numbered(lines, start, end))
+    error_text = "\n".join(
+        f"line {e.line}: {e.message}" if e.line else e.message for e in errors
+    )
+
+    response = await gateway.generate(
+        (
+            "The following excerpts of a LaTeX document cause compile errors. "
+            "Each source line is prefixed with its line number and '| '. "
+            "Fix the errors by replacing line ranges. Reply with JSON only, in the form "
+            '{"patches": [{"start_line": <int>, "end_line": <int>, "replacement": "<new lines>"}], '
+            '"explanation": "<short explanation>"}. '
+            "Line ranges are inclusive, use the original line numbers, must stay inside the "
+            "excerpts shown and must not overlap. Replacements contain plain LaTeX without "
+            "line-number prefixes.\n\n"
+            f"Errors:\n{error_text}\n\n" + "\n\n".join(sections)
+        ),
+        endpoint="compile.fix_errors"
+    )
+    try:
+        patches, explanation = _parse_patches(response)
+        fixed = apply_patches(request.content, patches, allowed)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+    return {
+        "fixed_content": fixed,
+        "explanation": explanation or f"Fixed based on errors: {error_text}",
+        "patches": patches,
+    }
+
+async def fix_errors(request: FixErrorRequest) -> dict:
+    """
+    Fix LaTeX errors based on log + content.
+
+    Mechanical errors (missing packages, unbalanced braces, unescaped special
+    characters, ...) are fixed by local rules first; Gemini is only called for
+    what is left. Errors that can be mapped to source lines are fixed with
+    targeted patches from a prompt containing only the preamble and the
+    surrounding lines; otherwise the whole document is sent and rewritten.
+    """
+    errors = parse_log_entries(request.error_log)
+    content, applied_rules, unresolved = apply_rules(request.content, errors)
+    if applied_rules and not unresolved:
+        return {
+            "fixed_content": content,
+            "explanation": "Fixed without AI: " + "; ".join(applied_rules),
+            "applied_rules": applied_rules,
+        }
+    if applied_rules:
+        # Hand the partially fixed document and only the remaining errors to the model
+        request = FixErrorRequest(content=content, error_log=request.error_log)
+        errors = unresolved
+
+    localized = await _fix_locally(request, errors)
+    if localized:
+        return {**localized, "applied_rules": applied_rules}
+
     parsed_errors = parse_log(request.error_log)
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=(
+    response = await gateway.generate(
+        (
             "The following LaTeX code has errors. "
             "Fix the errors and return corrected LaTeX only.\n\n"
             f"Errors:\n{parsed_errors}\n\nCode:\n{request.content}"
-        )
+        ),
+        endpoint="compile.fix_errors"
     )
 
-    cleaned = clean_code_blocks(response.text.strip())
+    cleaned = clean_code_blocks(response.strip())
     return {
         "fixed_content": cleaned,
-        "explanation": f"Fixed based on errors: {parsed_errors}"
+        "explanation": f"Fixed based on errors: {parsed_errors}",
+        "applied_rules": applied_rules,
     }
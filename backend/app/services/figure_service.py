@@ -1,11 +1,19 @@
+import asyncio
 import csv
 import io
+import itertools
+import re
 import textwrap
-from typing import List, Optional
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Sequence, Union
+from app.core.config import settings
+from app.services.artifact_store import store_artifact
 from app.schemas.figure_schema import (
-    GenerateTableRequest, GeneratePlotRequest, GenerateDiagramRequest
+    TableOptions, GenerateTableRequest, GeneratePlotRequest, GenerateDiagramRequest
 )
-from app.services.ai_service import client
+from app.services.cache_service import make_cache_key
+from app.services.compile_service import compile_snippet
+from app.services.llm_gateway import DEFAULT_MODEL, gateway
+from app.services.ai_service import strip_stream
 
 LATEX_SPECIALS = {
     "&": r"\&", "%": r"\%", "$": r"\$", "#": r"\#",
@@ -13,85 +21,137 @@ LATEX_SPECIALS = {
     "^": r"\textasciicircum{}", "\\": r"\textbackslash{}"
 }
 
+_SPECIAL = re.compile("|".join(re.escape(ch) for ch in LATEX_SPECIALS))
+
 def _escape_latex(s: str) -> str:
-    out = []
-    for ch in s:
-        out.append(LATEX_SPECIALS.get(ch, ch))
-    return "".join(out)
+    return _SPECIAL.sub(lambda m: LATEX_SPECIALS[m.group()], s)
 
 def _makecell(s: str, maxw: Optional[int]) -> str:
     if maxw and len(s) > maxw:
-        wrapped = r" \\ ".join(textwrap.wrap(s, maxw))
+        wrapped = r" \\ ".join(_escape_latex(line) for line in textwrap.wrap(s, maxw))
         return r"\makecell{" + wrapped + "}"
-    return s
+    return _escape_latex(s)
 
 # ---------- TABLE ----------
-# ---------- TABLE (CORRECTED) ----------
-def generate_table(req: GenerateTableRequest) -> str:
+def _resolve_columns(columns: Optional[List[Union[int, str]]], header: Optional[List[str]], ncols: int) -> List[int]:
+    """Column indexes to keep, from 0-based indexes or header names."""
+    if not columns:
+        return list(range(ncols))
+    names = [h.strip() for h in header] if header else []
+    indexes = []
+    for column in columns:
+        if isinstance(column, int):
+            if not 0 <= column < ncols:
+                raise ValueError(f"Column index {column} is out of range (0-{ncols - 1})")
+            indexes.append(column)
+        elif column in names:
+            indexes.append(names.index(column))
+        else:
+            raise ValueError(f"Unknown column '{column}'")
+    return indexes
+
+def _table_row(row: List[str], indexes: List[int], maxw: Optional[int]) -> str:
+    # Missing cells are left empty so ragged CSV still compiles
+    cells = [_makecell((row[i] if i < len(row) else "").strip(), maxw) for i in indexes]
+    return " & ".join(cells) + r" \\"
+
+def iter_table(rows: Iterator[List[str]], opts: TableOptions) -> Iterator[str]:
     """
-    Generates a LaTeX table fragment. The required packages
-    (tabularx, makecell, booktabs) must be included by the caller.
+    Generate a LaTeX table line by line from parsed CSV rows, in constant
+    memory: rows are read as lines are produced. With layout "auto", tables
+    longer than long_table_rows become page-breaking xltabular (X columns)
+    or longtable, deciding after buffering at most that many rows.
     """
-    # Parse CSV
-    reader = csv.reader(io.StringIO(req.csv), delimiter=req.delimiter)
-    rows = [list(r) for r in reader]
-
-    if not rows:
-        return "% Empty CSV -> no table"
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        yield "% Empty CSV -> no table"
+        return
 
-    header = rows[0] if req.has_header else None
-    data = rows[1:] if req.has_header else rows
+    header = first if opts.has_header else None
+    indexes = _resolve_columns(opts.columns, header, len(first))
+    data = rows if opts.has_header else itertools.chain([first], rows)
+    if opts.max_rows is not None:
+        data = itertools.islice(data, opts.max_rows + 1)  # one extra to report truncation
 
-    # Determine column alignment
-    ncols = len(rows[0])
-    align = req.align or ("X" * ncols)   # tabularx: flexible columns
+    threshold = opts.long_table_rows or settings.TABLE_LONG_ROWS
+    buffered = list(itertools.islice(data, threshold + 1)) if opts.layout == "auto" else []
+    layout = opts.layout
+    if layout == "auto":
+        shown = len(buffered) if opts.max_rows is None else min(len(buffered), opts.max_rows)
+        layout = "tabularx" if shown <= threshold else "long"
+    data = itertools.chain(buffered, data)
 
-    # Build LaTeX
-    lines = []
+    if layout == "long":
+        layout = "longtable" if opts.align and "X" not in opts.align else "xltabular"
+    # Flexible X columns, except in longtable which does not support them
+    align = opts.align or ("l" if layout == "longtable" else "X") * len(indexes)
+    head = []
+    if opts.use_booktabs:
+        head.append(r"\toprule")
+    if header:
+        head += [_table_row(header, indexes, opts.max_col_width), r"\midrule" if opts.use_booktabs else r"\hline"]
 
     # The package includes are moved to a comment for user guidance
-    lines.append("% --- Required packages: tabularx, makecell, booktabs ---")
-    lines.append("")
-
-    open_env = close_env = ""
-    if req.table_env != "none":
-        open_env = r"\begin{" + req.table_env + r"}[ht]" + "\n\\centering\n"
-        close_env = "\n" + r"\end{" + req.table_env + r"}"
+    yield f"% --- Required packages: {layout}, makecell, booktabs ---"
+    yield ""
 
-    lines.append(open_env + r"\begin{tabularx}{\linewidth}{" + align + r"}")
+    if layout == "tabularx":
+        if opts.table_env != "none":
+            yield r"\begin{" + opts.table_env + r"}[ht]"
+            yield r"\centering"
+        yield r"\begin{tabularx}{\linewidth}{" + align + "}"
+        yield from head
+    else:
+        # Long tables break across pages and cannot sit inside a float:
+        # the caption goes in the table and the header repeats on each page
+        width = r"{\linewidth}" if layout == "xltabular" else ""
+        yield r"\begin{" + layout + "}" + width + "{" + align + "}"
+        if opts.caption or opts.label:
+            yield _table_caption(opts) + r" \\"
+        yield from head
+        yield r"\endfirsthead"
+        yield from head
+        yield r"\endhead"
+        if opts.use_booktabs:
+            yield r"\bottomrule"
+        yield r"\endlastfoot"
 
-    if req.use_booktabs:
-        lines.append(r"\toprule")
-
-    # Header
-    if header:
-        head_cells = [ _escape_latex(_makecell(h.strip(), req.max_col_width)) for h in header ]
-        lines.append(" & ".join(head_cells) + r" \\")
-        if req.use_booktabs:
-            lines.append(r"\midrule")
-        else:
-            lines.append(r"\hline")
+    for count, row in enumerate(data):
+        if count == opts.max_rows:
+            yield f"% Truncated to the first {opts.max_rows} rows"
+            break
+        yield _table_row(row, indexes, opts.max_col_width)
 
-    # Body
-    for row in data:
-        cells = [ _escape_latex(_makecell((c or "").strip(), req.max_col_width)) for c in row ]
-        lines.append(" & ".join(cells) + r" \\")
+    if layout == "tabularx":
+        if opts.use_booktabs:
+            yield r"\bottomrule"
+        yield r"\end{tabularx}"
+        if opts.table_env != "none":
+            if opts.caption or opts.label:
+                yield _table_caption(opts)
+            yield r"\end{" + opts.table_env + "}"
+    else:
+        yield r"\end{" + layout + "}"
 
-    if req.use_booktabs:
-        lines.append(r"\bottomrule")
+def _table_caption(opts: TableOptions) -> str:
+    parts = []
+    if opts.caption:
+        parts.append(r"\caption{" + _escape_latex(opts.caption) + "}")
+    if opts.label:
+        parts.append(r"\label{" + opts.label + "}")
+    return "".join(parts)
 
-    lines.append(r"\end{tabularx}")
+def read_csv(lines: Iterable[str], delimiter: str = ",") -> Iterator[List[str]]:
+    """Parse CSV lazily from any iterable of lines (a string's lines, a text file)."""
+    return csv.reader(lines, delimiter=delimiter)
 
-    # caption / label
-    if req.table_env != "none" and (req.caption or req.label):
-        if req.caption:
-            lines.append(r"\caption{" + _escape_latex(req.caption) + r"}")
-        if req.label:
-            lines.append(r"\label{" + req.label + r"}")
-
-    lines.append(close_env)
-
-    return "\n".join([l for l in lines if l is not None])
+def generate_table(req: GenerateTableRequest) -> str:
+    """
+    Generates a LaTeX table fragment. The required packages
+    (tabularx or longtable/xltabular, makecell, booktabs) must be included by the caller.
+    """
+    return "\n".join(iter_table(read_csv(io.StringIO(req.csv), req.delimiter), req))
 
 # ---------- PLOTS (PGFPLOTS) ----------
 def _pgfplots_preamble() -> List[str]:
@@ -100,9 +160,55 @@ def _pgfplots_preamble() -> List[str]:
         r"\pgfplotsset{compat=newest}",
     ]
 
-def generate_plot(req: GeneratePlotRequest) -> str:
+# TeX lengths in pt; \linewidth and friends as in the default article class
+_UNITS = {"pt": 1.0, "bp": 1.00375, "mm": 2.84526, "cm": 28.4526, "in": 72.27, "pc": 12.0, "em": 10.0, "ex": 4.3}
+_LINE_WIDTH_PT = 345.0
+_LENGTH = re.compile(r"^\s*([0-9]*\.?[0-9]+)?\s*(\\(?:linewidth|textwidth|columnwidth|hsize)|[a-z]{2})\s*$")
+
+def _width_pt(width: str) -> float:
+    """Approximate a TeX width such as "8cm" or "0.8\\linewidth" in pt."""
+    match = _LENGTH.match(width or "")
+    if not match:
+        return _LINE_WIDTH_PT
+    factor = float(match.group(1)) if match.group(1) else 1.0
+    unit = match.group(2)
+    if unit.startswith("\\"):
+        return factor * _LINE_WIDTH_PT
+    return factor * _UNITS.get(unit, _LINE_WIDTH_PT)
+
+def _target_points(width: str) -> int:
+    """Points worth drawing across a plot of this width (PLOT_POINTS_PER_PT per pt)."""
+    return max(16, int(_width_pt(width) * settings.PLOT_POINTS_PER_PT))
+
+def _format_points(points: Sequence[Sequence[float]], precision: Optional[int], row_end: str) -> str:
+    # One %-format call for the whole series instead of an f-string per point;
+    # without a precision, values are written exactly (shortest repr that round-trips)
+    value = "%r" if precision is None else f"%.{precision}g"
+    row = f"{value} {value}{row_end}\n"
+    return (row * len(points)) % tuple(itertools.chain.from_iterable(points))
+
+def _addplot_data(points: Sequence[Sequence[float]], req: GeneratePlotRequest, artifacts: List[str]) -> List[str]:
+    if req.data_output == "inline":
+        return ["    \\addplot table[row sep=crcr]{%", _format_points(points, req.precision, r"\\") + "    };"]
+    if req.data_output == "csv":
+        data = "x,y\n" + _format_points(points, req.precision, "").replace(" ", ",")
+        options = "[col sep=comma]"
+    else:
+        data = "x y\n" + _format_points(points, req.precision, "")
+        options = ""
+    name = store_artifact(data.encode("ascii"), "plot", req.data_output)
+    artifacts.append(name)
+    return [f"    \\addplot table{options} {{{name}}};"]
+
+def generate_plot(req: GeneratePlotRequest) -> dict:
+    """
+    pgfplots code for data series or expressions. With data_output "dat" or
+    "csv", series are written as content-addressed files (see artifact_store)
+    that the compile service makes available to \\addplot table.
+    """
     lines = _pgfplots_preamble()
     lines.append("")
+    artifacts: List[str] = []
     width = req.width or r"\linewidth"
     height = f", height={req.height}" if req.height else ""
     grid = "major" if req.grid else "none"
@@ -115,47 +221,54 @@ def generate_plot(req: GeneratePlotRequest) -> str:
     ]
     if req.title:
         opts.append(f"title={{{_escape_latex(req.title)}}}")
-    
+    if req.xlabel:
+        opts.append(f"xlabel={{{_escape_latex(req.xlabel)}}}")
+    if req.ylabel:
+        opts.append(f"ylabel={{{_escape_latex(req.ylabel)}}}")
+
+    lines.append(r"\begin{tikzpicture}")
     lines.append(r"  \begin{axis}[" + ", ".join(opts) + r"]")
 
     # Data mode
     if req.mode == "data":
         if not req.series:
-            return "% No data provided"
+            return {"latex": "% No data provided", "artifacts": []}
+        target = req.max_points or _target_points(width)
         for i, series in enumerate(req.series):
-            lines.append("    \\addplot table[row sep=crcr]{%")
-            for x, y in series:
-                lines.append(f"{x} {y}\\\\")
-            lines.append("    };")
+            if req.downsample != "none" and len(series) > target:
+                # NumPy is only loaded for series that need it
+                from app.services.downsample import downsample
+                lines.append(f"    % series {i + 1}: {len(series)} points reduced to at most {target} ({req.downsample})")
+                series = downsample(series, target, req.downsample)
+            lines.extend(_addplot_data(series, req, artifacts))
             if req.legend and i < len(req.legend):
                 lines.append(f"    \\addlegendentry{{{_escape_latex(req.legend[i])}}}")
 
     # Equation mode
     elif req.mode == "equation":
         if not req.expressions:
-            return "% No expressions provided"
+            return {"latex": "% No expressions provided", "artifacts": []}
         dom = req.domain or [-5, 5]
         for i, expr in enumerate(req.expressions):
             lines.append(fr"    \addplot[samples={req.samples},domain={dom[0]}:{dom[1]}] {{{expr}}};")
             if req.legend and i < len(req.legend):
                 lines.append(f"    \\addlegendentry{{{_escape_latex(req.legend[i])}}}")
 
-    # labels
-    if req.xlabel: lines.append(fr"    xlabel={{{_escape_latex(req.xlabel)}}}")
-    if req.ylabel: lines.append(fr"    ylabel={{{_escape_latex(req.ylabel)}}}")
-
     lines.append(r"  \end{axis}")
     lines.append(r"\end{tikzpicture}")
-    return "\n".join(lines)
+    return {"latex": "\n".join(lines), "artifacts": artifacts}
 
 # ---------- TikZ DIAGRAM ----------
-def generate_diagram(req: GenerateDiagramRequest) -> str:
-    """
-    Use Gemini to synthesize TikZ code. We strictly enforce LaTeX-only output.
-    """
-    libs = req.tikz_libs or []
-    libs_line = "".join([f"\\usetikzlibrary{{{lib}}}\n" for lib in libs])
+# Extra instructions that make concurrent candidates differ; the first is the plain prompt
+_CANDIDATE_HINTS = [
+    "",
+    "Prefer named nodes placed with the positioning library and relative placement.",
+    "Prefer explicit absolute coordinates and only core TikZ commands.",
+    "Keep the drawing minimal: as few commands and styles as possible.",
+]
+_TIKZPICTURE = re.compile(r"\\begin\{tikzpicture\}.*\\end\{tikzpicture\}", re.DOTALL)
 
+def _diagram_prompt(req: GenerateDiagramRequest, candidate: int = 0) -> str:
     system_prompt = (
         "You are a LaTeX TikZ assistant. Produce ONLY compilable LaTeX code. "
         "Do not include explanations or backticks. "
@@ -173,13 +286,81 @@ def generate_diagram(req: GenerateDiagramRequest) -> str:
         "  ...\n"
         "  \\end{tikzpicture}\n"
     )
+    hint = _CANDIDATE_HINTS[candidate % len(_CANDIDATE_HINTS)]
+    if hint:
+        user_prompt += f"- {hint}\n"
+    return system_prompt + "\n" + user_prompt
 
-    resp = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=system_prompt + "\n" + user_prompt
-    )
-    tikz = resp.text.strip()
-
+def _diagram_preamble_comment(req: GenerateDiagramRequest) -> str:
     # Minimal preamble hint (caller can prepend in their doc)
-    preamble_comment = "% Required packages:\n% \\usepackage{tikz}\n" + "".join([f"% \\usetikzlibrary{{{l}}}\n" for l in libs])
-    return preamble_comment + "\n" + tikz
+    libs = req.tikz_libs or []
+    return "% Required packages:\n% \\usepackage{tikz}\n" + "".join([f"% \\usetikzlibrary{{{l}}}\n" for l in libs])
+
+async def generate_diagram(req: GenerateDiagramRequest) -> str:
+    """
+    Use Gemini to synthesize TikZ code. We strictly enforce LaTeX-only output.
+    """
+    tikz = await gateway.generate(_diagram_prompt(req), endpoint="figures.generate_diagram")
+    return _diagram_preamble_comment(req) + "\n" + tikz.strip()
+
+async def stream_diagram(req: GenerateDiagramRequest) -> AsyncIterator[str]:
+    """
+    Streaming variant of generate_diagram: the preamble hint first, then TikZ code as it is generated.
+    """
+    yield _diagram_preamble_comment(req) + "\n"
+    async for chunk in strip_stream(
+        gateway.stream(_diagram_prompt(req), endpoint="figures.generate_diagram"), mode=None
+    ):
+        yield chunk
+
+def _diagram_test_preamble(req: GenerateDiagramRequest) -> str:
+    libs = "".join(f"\\usetikzlibrary{{{l}}}\n" for l in req.tikz_libs or [])
+    return "\\documentclass{article}\n\\usepackage{tikz}\n\\usepackage{pgfplots}\n\\pgfplotsset{compat=newest}\n" + libs
+
+async def generate_validated_diagram(req: GenerateDiagramRequest) -> dict:
+    """
+    Request req.candidates diagrams concurrently, each with a different hint,
+    and test-compile each as soon as it arrives. The first candidate that
+    compiles is returned (and cached by prompt); the remaining model calls and
+    compiles are cancelled. If none compiles, the first candidate to arrive is
+    returned with compiled=False.
+    """
+    cache = gateway.cache
+    key = make_cache_key(DEFAULT_MODEL, _diagram_prompt(req), {"validated": True, "libs": req.tikz_libs})
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, key, "figures.generate_diagram.validated")
+        if cached is not None:
+            return {"latex": cached, "compiled": True, "cached": True}
+
+    preamble = _diagram_test_preamble(req)
+
+    async def candidate(i: int):
+        # Each candidate has its own prompt; fresh output is wanted, not a cached failure
+        text = await gateway.generate(
+            _diagram_prompt(req, i), endpoint="figures.generate_diagram", use_cache=False
+        )
+        match = _TIKZPICTURE.search(text)
+        tikz = match.group(0) if match else text.strip()
+        return tikz, await compile_snippet(preamble, tikz) is not None
+
+    tasks = [asyncio.ensure_future(candidate(i)) for i in range(req.candidates)]
+    fallback, error = None, None
+    try:
+        for finished in asyncio.as_completed(tasks):
+            try:
+                tikz, compiled = await finished
+            except Exception as e:
+                error = e
+                continue
+            latex = _diagram_preamble_comment(req) + "\n" + tikz
+            if compiled:
+                if cache is not None:
+                    await asyncio.to_thread(cache.set, key, latex)
+                return {"latex": latex, "compiled": True, "cached": False}
+            fallback = fallback or latex
+    finally:
+        for task in tasks:
+            task.cancel()
+    if fallback is None:
+        raise error
+    return {"latex": fallback, "compiled": False, "cached": False}
@@ -0,0 +1,259 @@
+import re
+from dataclasses import replace
+from typing import TYPE_CHECKING, Dict, List, Set, Tuple
+
+if TYPE_CHECKING:
+    from app.services.error_service import LogError
+
+# Commands that only work with a package loaded
+COMMAND_PACKAGES: Dict[str, str] = {
+    "includegraphics": "graphicx", "graphicspath": "graphicx", "rotatebox": "graphicx",
+    "scalebox": "graphicx", "resizebox": "graphicx",
+    "textcolor": "xcolor", "color": "xcolor", "definecolor": "xcolor", "colorbox": "xcolor",
+    "url": "hyperref", "href": "hyperref", "hypersetup": "hyperref", "autoref": "hyperref",
+    "toprule": "booktabs", "midrule": "booktabs", "bottomrule": "booktabs", "cmidrule": "booktabs",
+    "mathbb": "amssymb", "mathfrak": "amssymb", "checkmark": "amssymb", "varnothing": "amssymb",
+    "text": "amsmath", "eqref": "amsmath", "operatorname": "amsmath", "DeclareMathOperator": "amsmath",
+    "boldsymbol": "amsmath", "tfrac": "amsmath", "dfrac": "amsmath", "binom": "amsmath",
+    "SI": "siunitx", "si": "siunitx", "num": "siunitx", "qty": "siunitx", "unit": "siunitx",
+    "makecell": "makecell", "multirow": "multirow",
+    "tikz": "tikz", "usetikzlibrary": "tikz", "pgfplotsset": "pgfplots",
+    "lipsum": "lipsum", "degree": "gensymb", "celsius": "gensymb",
+    "cref": "cleveref", "Cref": "cleveref",
+    "citep": "natbib", "citet": "natbib",
+    "sout": "ulem", "uline": "ulem",
+    "bm": "bm", "ce": "mhchem",
+    "State": "algpseudocode", "Require": "algpseudocode", "Ensure": "algpseudocode",
+    "lstinline": "listings", "lstset": "listings",
+    "captionof": "caption", "subcaption": "subcaption",
+    "todo": "todonotes", "enquote": "csquotes", "xspace": "xspace",
+}
+
+# Environments that only exist with a package loaded
+ENVIRONMENT_PACKAGES: Dict[str, str] = {
+    "align": "amsmath", "align*": "amsmath", "gather": "amsmath", "gather*": "amsmath",
+    "multline": "amsmath", "multline*": "amsmath", "equation*": "amsmath", "split": "amsmath",
+    "cases": "amsmath", "pmatrix": "amsmath", "bmatrix": "amsmath", "vmatrix": "amsmath",
+    "tikzpicture": "tikz", "axis": "pgfplots",
+    "algorithm": "algorithm", "algorithmic": "algpseudocode",
+    "lstlisting": "listings", "minted": "minted",
+    "tabularx": "tabularx", "longtable": "longtable", "xltabular": "xltabular",
+    "subfigure": "subcaption", "wrapfigure": "wrapfig", "multicols": "multicol",
+    "landscape": "pdflscape", "comment": "comment",
+}
+
+# Commands that are only valid in math mode
+MATH_ONLY_COMMANDS: Set[str] = {
+    "alpha", "beta", "gamma", "delta", "epsilon", "varepsilon", "zeta", "eta", "theta",
+    "iota", "kappa", "lambda", "mu", "nu", "xi", "pi", "rho", "sigma", "tau", "upsilon",
+    "phi", "varphi", "chi", "psi", "omega", "Gamma", "Delta", "Theta", "Lambda", "Xi",
+    "Pi", "Sigma", "Phi", "Psi", "Omega", "frac", "sqrt", "sum", "prod", "int", "infty",
+    "leq", "geq", "neq", "approx", "times", "cdot", "pm", "partial", "nabla", "mathbf",
+    "mathrm", "mathcal", "rightarrow", "leftarrow", "Rightarrow", "to", "in", "subset",
+}
+
+# Environments whose body is typeset in math mode
+MATH_ENVIRONMENTS = (
+    "equation", "align", "alignat", "flalign", "gather", "multline", "eqnarray",
+    "displaymath", "math", "dmath",
+)
+
+# Messages that are consequences of earlier errors, not errors to fix
+CONSEQUENTIAL_MESSAGES = ("Emergency stop", "==> Fatal error occurred", "Fatal error occurred")
+
+
+# ---- helpers ----
+def _unescaped(char: str) -> str:
+    """Regex for `char` not preceded by a backslash."""
+    return r"(?<!\\)" + re.escape(char)
+
+def _strip_comment(line: str) -> str:
+    match = re.search(_unescaped("%"), line)
+    return line[:match.start()] if match else line
+
+def _brace_balance(line: str) -> int:
+    code = _strip_comment(line)
+    return len(re.findall(_unescaped("{"), code)) - len(re.findall(_unescaped("}"), code))
+
+_MATH_ENVIRONMENT = r"\{(?:%s)\*?\}" % "|".join(MATH_ENVIRONMENTS)
+# Delimiters that open or close math spanning lines; $$ toggles
+_MATH_DELIMITER = re.compile(
+    r"(?<!\\)(?:(\\begin%s|\\\[|\\\()|(\\end%s|\\\]|\\\))|\$\$)" % (_MATH_ENVIRONMENT, _MATH_ENVIRONMENT)
+)
+# Math that opens and closes within a line
+_INLINE_MATH = re.compile(
+    r"((?<!\\)\$\$.*?(?<!\\)\$\$|(?<!\\)\$[^$]*(?<!\\)\$|(?<!\\)\\\(.*?(?<!\\)\\\)|(?<!\\)\\\[.*?(?<!\\)\\\])"
+)
+
+def _math_after(line: str, in_math: bool) -> bool:
+    """Whether math mode is still open at the end of a line that started in in_math."""
+    for match in _MATH_DELIMITER.finditer(_strip_comment(line)):
+        in_math = True if match.group(1) else False if match.group(2) else not in_math
+    return in_math
+
+def _touches_display_math(lines: List[str], i: int) -> bool:
+    """Whether part of line i is inside display math or a math environment."""
+    in_math = False
+    for line in lines[:i]:
+        in_math = _math_after(line, in_math)
+    code = _strip_comment(lines[i])
+    return in_math or _math_after(code, False) or bool(re.search(r"\\(?:begin|end)" + _MATH_ENVIRONMENT, code))
+
+def _outside_math(line: str, fix) -> str:
+    """Apply fix() to the parts of a line outside $...$, $$...$$, \\(...\\) and \\[...\\]."""
+    parts = _INLINE_MATH.split(line)
+    # split() puts the matched math at odd indexes
+    return "".join(part if k % 2 else fix(part) for k, part in enumerate(parts))
+
+
+# ---- line rules: (lines, error) -> description or None, editing lines in place ----
+def _rule_misplaced_ampersand(lines: List[str], err: "LogError"):
+    if "Misplaced alignment tab character" not in err.message:
+        return None
+    i = err.line - 1
+    fixed = re.sub(_unescaped("&"), r"\\&", lines[i])
+    if fixed == lines[i]:
+        return None
+    lines[i] = fixed
+    return f"line {err.line}: escaped '&'"
+
+def _rule_macro_parameter(lines: List[str], err: "LogError"):
+    if "macro parameter character #" not in err.message:
+        return None
+    i = err.line - 1
+    fixed = re.sub(_unescaped("#"), r"\\#", lines[i])
+    if fixed == lines[i]:
+        return None
+    lines[i] = fixed
+    return f"line {err.line}: escaped '#'"
+
+def _rule_missing_dollar(lines: List[str], err: "LogError"):
+    if "Missing $ inserted" not in err.message:
+        return None
+    i = err.line - 1
+    original = lines[i]
+    if _touches_display_math(lines, i):
+        # Subscripts there are valid; the error comes from something else
+        return None
+
+    # Underscores between word characters in text are almost always file or variable names
+    fixed = _outside_math(original, lambda s: re.sub(r"(?<=\w)(?<!\\)_(?=\w)", r"\\_", s))
+    if fixed != original:
+        lines[i] = fixed
+        return f"line {err.line}: escaped '_' in text"
+
+    # A math-only command used in text: wrap it (with its braced arguments) in $...$
+    def wrap(segment: str) -> str:
+        pattern = r"\\(%s)\b((?:\{[^{}]*\})*)" % "|".join(sorted(MATH_ONLY_COMMANDS, key=len, reverse=True))
+        return re.sub(pattern, lambda m: "$" + m.group(0) + "$", segment)
+
+    fixed = _outside_math(_strip_comment(original), wrap) + original[len(_strip_comment(original)):]
+    if fixed != original:
+        lines[i] = fixed
+        return f"line {err.line}: wrapped math command in $...$"
+    return None
+
+def _rule_unbalanced_braces(lines: List[str], err: "LogError"):
+    if not any(m in err.message for m in ("Missing } inserted", "File ended while scanning", "Extra }", "Runaway argument")):
+        return None
+    i = min(err.line, len(lines)) - 1
+    original = lines[i]
+    balance = _brace_balance(original)
+
+    # "50% of {x}" comments out the closing brace: escaping a percent after a digit rebalances the line
+    escaped = re.sub(r"(?<=\d)%", r"\\%", original)
+    if escaped != original and balance != 0 and _brace_balance(escaped) == 0:
+        lines[i] = escaped
+        return f"line {err.line}: escaped '%'"
+
+    code = _strip_comment(original)
+    comment = original[len(code):]
+    if balance > 0:
+        lines[i] = code.rstrip() + "}" * balance + comment
+        return f"line {err.line}: closed {balance} unbalanced brace(s)"
+    if balance < 0:
+        # Drop the last unmatched closing braces
+        for _ in range(-balance):
+            code = re.sub(r"(?<!\\)\}(?!.*(?<!\\)\})", "", code, count=1)
+        lines[i] = code + comment
+        return f"line {err.line}: removed {-balance} extra brace(s)"
+    return None
+
+LINE_RULES = [
+    _rule_misplaced_ampersand,
+    _rule_macro_parameter,
+    _rule_missing_dollar,
+    _rule_unbalanced_braces,
+]
+
+
+# ---- package rules: error -> package name or None ----
+def _package_for_command(err: "LogError"):
+    if "Undefined control sequence" not in err.message or not err.context:
+        return None
+    # pdflatex prints the source up to and including the offending token
+    commands = re.findall(r"\\([A-Za-z@]+)", err.context)
+    return COMMAND_PACKAGES.get(commands[-1]) if commands else None
+
+def _package_for_environment(err: "LogError"):
+    match = re.search(r"Environment (\S+) undefined", err.message)
+    return ENVIRONMENT_PACKAGES.get(match.group(1)) if match else None
+
+PACKAGE_RULES = [_package_for_command, _package_for_environment]
+
+
+def _loaded_packages(lines: List[str]) -> Set[str]:
+    packages = set()
+    for line in lines:
+        for group in re.findall(r"\\usepackage(?:\[[^\]]*\])?\{([^}]*)\}", _strip_comment(line)):
+            packages.update(p.strip() for p in group.split(","))
+    return packages
+
+
+def apply_rules(content: str, errors: List["LogError"]) -> Tuple[str, List[str], List["LogError"]]:
+    """
+    Deterministically fix common LaTeX errors.
+
+    Returns (content, applied, unresolved): the fixed content, a description
+    of every fix, and the errors no rule handled (with line numbers adjusted
+    for any lines inserted into the preamble).
+    """
+    lines = content.split("\n")
+    applied: List[str] = []
+    unresolved: List["LogError"] = []
+    package_errors: List[Tuple["LogError", str]] = []
+
+    for err in errors:
+        if any(m in err.message for m in CONSEQUENTIAL_MESSAGES):
+            continue
+
+        package = next((p for p in (rule(err) for rule in PACKAGE_RULES) if p), None)
+        if package:
+            package_errors.append((err, package))
+            continue
+
+        if err.line is not None and 1 <= err.line <= len(lines):
+            description = next((d for d in (rule(lines, err) for rule in LINE_RULES) if d), None)
+            if description:
+                applied.append(description)
+                continue
+        unresolved.append(err)
+
+    loaded = _loaded_packages(lines)
+    begin = next((i for i, line in enumerate(lines) if "\\begin{document}" in line), None)
+    new_packages: List[str] = []
+    for err, package in package_errors:
+        if package in loaded or begin is None:
+            # Already loaded (so something else is wrong) or nowhere to load it
+            unresolved.append(err)
+        elif package not in new_packages:
+            new_packages.append(package)
+
+    if new_packages:
+        lines[begin:begin] = [f"\\usepackage{{{p}}}" for p in new_packages]
+        applied.extend(f"added \\usepackage{{{p}}}" for p in new_packages)
+        unresolved = [
+            replace(e, line=e.line + len(new_packages)) if e.line and e.line > begin else e
+            for e in unresolved
+        ]
+    return "\n".join(lines), applied, unresolved
@@ -0,0 +1,406 @@
+"""
+Recursive-descent parser from LaTeX math to SymPy expressions.
+
+Covers what equations in papers mostly use: numbers, single-letter and Greek
+symbols with subscripts, + - \\cdot \\times / \\div, implicit multiplication,
+^ and _, \\frac/\\dfrac/\\tfrac (also \\frac12), \\sqrt (with index), \\binom, |x|,
+(), [], \\{\\}, \\left/\\right, common functions (with powers such as \\sin^2 x,
+inverses such as \\sin^{-1} x and bare arguments such as \\sin 2x), \\log_b,
+applied functions f(x), g(x), h(x), the constant e, \\sum and \\prod, factorials and
+\\mathrm/\\operatorname names. Plain input reads the same way: x**2, 1e-12,
+sin(x), sqrt(2), pi. Anything else raises LaTeXMathSyntaxError so the caller
+can fall back to SymPy's ANTLR-based parse_latex.
+"""
+import re
+from typing import List, Optional, Tuple
+import sympy as sp
+
+
+class LaTeXMathSyntaxError(ValueError):
+    """Raised for input the parser does not understand."""
+
+
+
+GREEK = {
+    "alpha", "beta", "gamma", "delta", "epsilon", "varepsilon", "zeta", "eta", "theta",
+    "vartheta", "iota", "kappa", "lambda", "mu", "nu", "xi", "rho", "varrho", "sigma",
+    "varsigma", "tau", "upsilon", "phi", "varphi", "chi", "psi", "omega",
+    "Gamma", "Delta", "Theta", "Lambda", "Xi", "Pi", "Sigma", "Upsilon", "Phi", "Psi", "Omega",
+    "hbar", "ell",
+}
+
+CONSTANTS = {"pi": sp.pi, "infty": sp.oo}
+
+FUNCTIONS = {
+    "sin": sp.sin, "cos": sp.cos, "tan": sp.tan, "sec": sp.sec, "csc": sp.csc, "cot": sp.cot,
+    "arcsin": sp.asin, "arccos": sp.acos, "arctan": sp.atan,
+    "sinh": sp.sinh, "cosh": sp.cosh, "tanh": sp.tanh, "coth": sp.coth,
+    "exp": sp.exp, "ln": sp.log, "log": sp.log,
+    "max": sp.Max, "min": sp.Min,
+}
+
+# \sin^{-1} x is the inverse function, not 1/sin(x)
+INVERSES = {
+    "sin": sp.asin, "cos": sp.acos, "tan": sp.atan, "sec": sp.asec, "csc": sp.acsc, "cot": sp.acot,
+    "sinh": sp.asinh, "cosh": sp.acosh, "tanh": sp.atanh, "coth": sp.acoth,
+}
+
+# Spacing and sizing commands that do not change the expression
+IGNORED = {
+    "\\,", "\\;", "\\:", "\\!", "\\ ", "\\quad", "\\qquad", "\\displaystyle", "\\textstyle",
+    "\\limits", "\\nolimits", "\\big", "\\Big", "\\bigg", "\\Bigg", "\\bigl", "\\bigr",
+    "\\Bigl", "\\Bigr", "\\biggl", "\\biggr", "\\Biggl", "\\Biggr",
+}
+
+# Letters read as functions when directly followed by "(" (f(x)); any other
+# letter, or one also used as a variable (h(h+1)), multiplies: n(n+1), a(b+c)
+FUNCTION_LETTERS = {"f", "g", "h"}
+
+# Names written without a backslash (sin(x), sqrt(2), pi) and the command they
+# stand for; they are read as one token, any other word as separate letters
+PLAIN_NAMES = {name: "\\" + name for name in [*FUNCTIONS, "sqrt", "pi"]}
+
+_TOKEN = re.compile(
+    r"\\[A-Za-z]+|\\.|(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?|\*\*"
+    r"|(?<![A-Za-z])(?:" + "|".join(sorted(PLAIN_NAMES, key=len, reverse=True)) + r")(?![A-Za-z])"
+    r"|[A-Za-z]|\S"
+)
+
+NAME_COMMANDS = {"\\mathrm", "\\mathit", "\\mathbf", "\\operatorname", "\\mathsf", "\\boldsymbol"}
+FRACTIONS = {"\\frac", "\\dfrac", "\\tfrac"}
+BINOMIALS = {"\\binom", "\\dbinom", "\\tbinom"}
+PRODUCTS = {"*", "\\cdot", "\\times"}
+DIVISIONS = {"/", "\\div"}
+OPENING = {"(": ")", "[": "]", "\\{": "\\}", "\\lbrace": "\\rbrace", "\\langle": "\\rangle"}
+
+# Powers, factorials and binomials of numbers larger than this are kept
+# unevaluated: 9^{9^{9}} or (10^9)! would take minutes to compute while parsing
+MAX_EVALUATED = 1000
+
+
+def _opaque(expr: sp.Expr) -> sp.Expr:
+    # UnevaluatedExpr, not evaluate=False: arithmetic on an unevaluated Pow still
+    # evaluates it (1/9^{9^{9}}), but it does not look inside an UnevaluatedExpr
+    return sp.UnevaluatedExpr(expr)
+
+
+def _power(base: sp.Expr, exponent: sp.Expr) -> sp.Expr:
+    if exponent.is_Rational and abs(exponent) > MAX_EVALUATED:
+        return _opaque(sp.Pow(base, exponent, evaluate=False))
+    return base ** exponent
+
+
+def _factorial(n: sp.Expr) -> sp.Expr:
+    if n.is_Number and abs(n) > MAX_EVALUATED:
+        return _opaque(sp.factorial(n, evaluate=False))
+    return sp.factorial(n)
+
+
+def _binomial(n: sp.Expr, k: sp.Expr) -> sp.Expr:
+    if n.is_Number and abs(n) > MAX_EVALUATED:
+        return _opaque(sp.binomial(n, k, evaluate=False))
+    return sp.binomial(n, k)
+
+
+def _tokenize(text: str) -> Tuple[List[str], List[bool]]:
+    """Tokens, and for each whether it directly follows the previous one (no space between)."""
+    tokens, adjacent, end = [], [], None
+    for match in _TOKEN.finditer(text):
+        if match.group() not in IGNORED:
+            tokens.append(match.group())
+            adjacent.append(match.start() == end)
+        end = match.end()
+    return tokens, adjacent
+
+
+class _Parser:
+    def __init__(self, text: str, applied_functions: bool = True, constant_e: bool = True):
+        self.tokens, self.adjacent = _tokenize(text)
+        self.applied_functions = applied_functions
+        self.constant_e = constant_e
+        # Letters used as plain symbols somewhere in the expression
+        self.variables = {
+            token for i, token in enumerate(self.tokens)
+            if len(token) == 1 and token.isalpha() and not self.calls(i + 1) and self.tokens[i + 1:i + 2] != ["_"]
+        }
+        self.pos = 0
+        self.abs_depth = 0
+
+    # ---- token helpers ----
+    def calls(self, i: int) -> bool:
+        """Whether token i is a "(" written directly after the previous token."""
+        return i < len(self.tokens) and self.tokens[i] == "(" and self.adjacent[i]
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise LaTeXMathSyntaxError("Unexpected end of expression")
+        self.pos += 1
+        return token
+
+    def expect(self, token: str):
+        found = self.next()
+        if found != token:
+            raise LaTeXMathSyntaxError(f"Expected {token!r}, found {found!r}")
+
+    def error(self, token: Optional[str]):
+        return LaTeXMathSyntaxError(f"Unsupported or unexpected token {token!r}")
+
+    # ---- grammar ----
+    def parse(self) -> sp.Expr:
+        expr = self.expression()
+        if self.peek() is not None:
+            raise self.error(self.peek())
+        return expr
+
+    def expression(self) -> sp.Expr:
+        # expression := term (("+" | "-") term)*
+        result = self.term()
+        while self.peek() in ("+", "-"):
+            sign = self.next()
+            right = self.term()
+            result = result + right if sign == "+" else result - right
+        return result
+
+    def term(self) -> sp.Expr:
+        # term := unary ((PRODUCT | DIVISION)? unary)*
+        result = self.unary()
+        while True:
+            token = self.peek()
+            if token in PRODUCTS:
+                self.next()
+                result = result * self.unary()
+            elif token in DIVISIONS:
+                self.next()
+                result = result / self.unary()
+            elif self.starts_factor(token):
+                result = result * self.postfix()
+            else:
+                return result
+
+    def unary(self) -> sp.Expr:
+        if self.peek() == "-":
+            self.next()
+            return -self.unary()
+        if self.peek() == "+":
+            self.next()
+            return self.unary()
+        return self.postfix()
+
+    def starts_factor(self, token: Optional[str]) -> bool:
+        """Whether token can start an implicitly multiplied factor."""
+        if token is None:
+            return False
+        if token == "|":
+            return self.abs_depth == 0
+        if token[0].isdigit() or token[0] == "." or token.isalpha() or token in ("(", "[", "{"):
+            return True
+        if token.startswith("\\"):
+            name = token[1:]
+            return (
+                name in GREEK or name in CONSTANTS or name in FUNCTIONS
+                or token in FRACTIONS or token in BINOMIALS or token in NAME_COMMANDS
+                or token in OPENING or token in ("\\left", "\\sqrt", "\\sum", "\\prod")
+            )
+        return False
+
+    def postfix(self) -> sp.Expr:
+        base = self.primary()
+        while True:
+            token = self.peek()
+            if token == "^":
+                self.next()
+                base = _power(base, self.script())
+            elif token == "**":
+                # Plain exponent: x**23, x**-1, 2**3**2 is 2**9
+                self.next()
+                base = _power(base, self.unary())
+            elif token == "!":
+                self.next()
+                base = _factorial(base)
+            elif token == "_" and isinstance(base, sp.Symbol):
+                self.next()
+                base = sp.Symbol(f"{base.name}_{{{self.script_text()}}}")
+            else:
+                return base
+
+    def script(self) -> sp.Expr:
+        """Argument of ^: a braced group or a single token (x^23 is x^2 * 3)."""
+        token = self.peek()
+        if token == "{":
+            return self.group()
+        if token is not None and token[0].isdigit() and len(token) > 1:
+            self.tokens[self.pos] = token[1:]
+            return sp.Integer(token[0])
+        return self.primary()
+
+    def script_text(self) -> str:
+        """Raw text of a subscript, used to name symbols such as x_{1}."""
+        if self.peek() != "{":
+            return self.next()
+        self.next()
+        depth, parts = 1, []
+        while True:
+            token = self.next()
+            depth += token == "{"
+            depth -= token == "}"
+            if depth == 0:
+                return "".join(parts)
+            parts.append(token)
+
+    def group(self) -> sp.Expr:
+        self.expect("{")
+        expr = self.expression()
+        self.expect("}")
+        return expr
+
+    def primary(self) -> sp.Expr:
+        token = self.next()
+        token = PLAIN_NAMES.get(token, token)
+
+        if token[0].isdigit() or token[0] == ".":
+            # 1.5, 1e-12: the power of ten goes through _power, so 1e999999999 stays cheap
+            mantissa, _, exponent = token.lower().partition("e")
+            number = sp.Rational(mantissa) if "." in mantissa else sp.Integer(mantissa)
+            return number * _power(sp.Integer(10), sp.Integer(exponent)) if exponent else number
+        if token.isalpha():
+            if token == "e" and self.constant_e and self.peek() != "_":
+                return sp.E
+            if (
+                self.applied_functions and token in FUNCTION_LETTERS
+                and token not in self.variables and self.calls(self.pos)
+            ):
+                # g(2x) applies g; with a space, "g (2x)" stays a product
+                return self.applied(token)
+            return sp.Symbol(token)
+        if token == "{":
+            expr = self.expression()
+            self.expect("}")
+            return expr
+        if token in OPENING:
+            expr = self.expression()
+            self.expect(OPENING[token])
+            return expr
+        if token == "|":
+            self.abs_depth += 1
+            expr = self.expression()
+            self.expect("|")
+            self.abs_depth -= 1
+            return sp.Abs(expr)
+        if token == "\\left":
+            return self.delimited()
+
+        name = token[1:] if token.startswith("\\") else None
+        if name in GREEK:
+            return sp.Symbol(name)
+        if name in CONSTANTS:
+            return CONSTANTS[name]
+        if name in FUNCTIONS:
+            return self.function(name)
+        if token in FRACTIONS:
+            if self.tokens[self.pos:self.pos + 2] == ["{", "d"]:
+                # \frac{d}{dx}, \frac{dy}{dx}: Leibniz notation, not a quotient
+                raise LaTeXMathSyntaxError("Derivatives are not supported")
+            # Arguments are groups or single tokens: \frac12, \frac ab
+            return self.script() / self.script()
+        if token in BINOMIALS:
+            return _binomial(self.script(), self.script())
+        if token == "\\sqrt":
+            if self.peek() == "[":
+                self.next()
+                index = self.expression()
+                self.expect("]")
+                return sp.root(self.script(), index)
+            return sp.sqrt(self.script())
+        if token in NAME_COMMANDS:
+            text = self.script_text()
+            if text in FUNCTIONS:
+                return self.function(text)
+            if text == "e":
+                return sp.E
+            return sp.Symbol(text)
+        if token in ("\\sum", "\\prod"):
+            return self.big_operator(sp.Sum if token == "\\sum" else sp.Product)
+        raise self.error(token)
+
+    def applied(self, name: str) -> sp.Expr:
+        # f(x), f(x, y)
+        self.expect("(")
+        arguments = [self.expression()]
+        while self.peek() == ",":
+            self.next()
+            arguments.append(self.expression())
+        self.expect(")")
+        return sp.Function(name)(*arguments)
+
+    def delimited(self) -> sp.Expr:
+        opening = self.next()
+        if opening == "|":
+            self.abs_depth += 1
+        expr = self.expression()
+        self.expect("\\right")
+        closing = self.next()
+        if opening == "|":
+            self.abs_depth -= 1
+            if closing != "|":
+                raise LaTeXMathSyntaxError(f"Expected '|', found {closing!r}")
+            return sp.Abs(expr)
+        if opening != "." and closing not in (".", OPENING.get(opening)):
+            raise LaTeXMathSyntaxError(f"Mismatched delimiters {opening!r} and {closing!r}")
+        return expr
+
+    def function(self, name: str) -> sp.Expr:
+        # \log_b x, \sin^2 x, \sin(x), \sin 2x
+        base = power = None
+        while self.peek() in ("_", "^"):
+            if self.next() == "_":
+                base = self.script()
+            else:
+                power = self.script()
+        if self.peek() in ("(", "\\left"):
+            # \sin(x)^2 is sin(x)**2: the power applies to the function
+            argument = self.primary()
+        else:
+            argument = self.postfix()
+            while self.peek() is not None and self.peek() not in ("(", "|") and self.starts_factor(self.peek()) \
+                    and not self.peek().startswith("\\") and self.peek() not in PLAIN_NAMES:
+                argument = argument * self.postfix()
+        if base is not None and name == "log":
+            result = sp.log(argument, base)
+        elif power == -1 and name in INVERSES:
+            return INVERSES[name](argument)
+        else:
+            result = FUNCTIONS[name](argument)
+        return _power(result, power) if power is not None else result
+
+    def big_operator(self, kind) -> sp.Expr:
+        # \sum_{i=1}^{n} body
+        if self.next() != "_":
+            raise LaTeXMathSyntaxError("Expected lower limit after sum/product")
+        self.expect("{")
+        variable = self.primary()
+        if self.peek() == "_" and isinstance(variable, sp.Symbol):
+            self.next()
+            variable = sp.Symbol(f"{variable.name}_{{{self.script_text()}}}")
+        if not isinstance(variable, sp.Symbol):
+            raise LaTeXMathSyntaxError("Expected index variable in sum/product")
+        self.expect("=")
+        lower = self.expression()
+        self.expect("}")
+        self.expect("^")
+        upper = self.script()
+        return kind(self.term(), (variable, lower, upper))
+
+
+def parse_latex_math(text: str, applied_functions: bool = True, constant_e: bool = True) -> sp.Expr:
+    """
+    Parse a LaTeX math expression into SymPy. Raises LaTeXMathSyntaxError.
+    With applied_functions=False, f(x) is a product like any other letter; with
+    constant_e=False, e is a symbol (the elementary charge) instead of Euler's number.
+    """
+    if not text.strip():
+        raise LaTeXMathSyntaxError("Empty expression")
+    return _Parser(text, applied_functions, constant_e).parse()
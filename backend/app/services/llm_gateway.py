@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+from typing import AsyncIterator, Dict, Optional
+from app.core.config import settings
+from app.services.cache_service import ResponseCache, make_cache_key
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+
+class LLMTimeoutError(TimeoutError):
+    """Raised when a model call (including time spent queued) exceeds its deadline."""
+
+
+# ---- Backends ----
+class GeminiBackend:
+    """
+    Calls Gemini through the SDK's native async client. The client is created on first use.
+    """
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client(api_key=self.api_key)
+        return self._client
+
+    async def generate(self, model: str, contents: str) -> str:
+        response = await self.client.aio.models.generate_content(model=model, contents=contents)
+        return response.text
+
+    async def stream(self, model: str, contents: str) -> AsyncIterator[str]:
+        response = await self.client.aio.models.generate_content_stream(model=model, contents=contents)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class StubBackend:
+    """
+    Offline backend for local development and load testing: sleeps for a fixed
+    latency and returns a deterministic response derived from the prompt.
+    """
+
+    def __init__(self, latency: float = 0.5):
+        self.latency = latency
+        self.calls = 0
+
+    async def generate(self, model: str, contents: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self._response(model, contents)
+
+    async def stream(self, model: str, contents: str) -> AsyncIterator[str]:
+        # First chunk arrives quickly, the rest is spread over the configured latency
+        self.calls += 1
+        text = self._response(model, contents)
+        chunks = [text[i:i + 16] for i in range(0, len(text), 16)]
+        await asyncio.sleep(self.latency / 10)
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(self.latency * 0.9 / len(chunks))
+
+    @staticmethod
+    def _response(model: str, contents: str) -> str:
+        digest = hashlib.sha1(contents.encode("utf-8")).hexdigest()[:12]
+        return f"[stub:{model}:{digest}] {contents[:200]}"
+
+
+# ---- Gateway ----
+class LLMGateway:
+    """
+    Single entry point for model calls from every service.
+
+    - a global semaphore caps concurrent upstream calls, and a per-endpoint
+      semaphore stops one endpoint from starving the others;
+    - every call has a deadline that includes time spent waiting for a slot;
+    - identical concurrent requests are coalesced into one upstream call;
+    - responses are served from / stored in the shared ResponseCache.
+    """
+
+    def __init__(
+        self,
+        backend,
+        cache: Optional[ResponseCache] = None,
+        max_concurrency: int = 32,
+        endpoint_concurrency: Optional[Dict[str, int]] = None,
+        default_endpoint_concurrency: int = 8,
+        timeout: float = 60.0,
+        cache_disabled_endpoints=(),
+    ):
+        self.backend = backend
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.endpoint_concurrency = endpoint_concurrency or {}
+        self.default_endpoint_concurrency = default_endpoint_concurrency
+        self.timeout = timeout
+        self.cache_disabled_endpoints = set(cache_disabled_endpoints)
+        self.coalesced = 0
+        self._loop = None
+
+    def _bind_loop(self):
+        # Semaphores and futures belong to one event loop; rebuild them if the
+        # gateway is used from a different loop (e.g. test clients, scripts).
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._global = asyncio.Semaphore(self.max_concurrency)
+            self._endpoints: Dict[str, asyncio.Semaphore] = {}
+            self._inflight: Dict[str, dict] = {}
+
+    def _endpoint_semaphore(self, endpoint: str) -> asyncio.Semaphore:
+        if endpoint not in self._endpoints:
+            limit = self.endpoint_concurrency.get(endpoint, self.default_endpoint_concurrency)
+            self._endpoints[endpoint] = asyncio.Semaphore(limit)
+        return self._endpoints[endpoint]
+
+    async def _call_upstream(self, model: str, contents: str, endpoint: str) -> str:
+        async with self._endpoint_semaphore(endpoint):
+            async with self._global:
+                return await self.backend.generate(model, contents)
+
+    async def _leader(self, key: str, model: str, contents: str, endpoint: str, cacheable: bool):
+        try:
+            text = await self._call_upstream(model, contents, endpoint)
+            if cacheable and text:
+                await asyncio.to_thread(self.cache.set, key, text)
+            return text
+        finally:
+            self._inflight.pop(key, None)
+
+    async def generate(
+        self,
+        contents: str,
+        endpoint: str,
+        model: str = DEFAULT_MODEL,
+        use_cache: bool = True,
+        timeout: Optional[float] = None,
+        params: Optional[dict] = None,
+    ) -> str:
+        """
+        Generate text for a prompt.
+
+        Args:
+            contents: The full prompt.
+            endpoint: Name of the calling endpoint (limits, metrics, cache opt-out).
+            model: Model name.
+            use_cache: Set to False to skip the response cache.
+            timeout: Deadline in seconds, defaults to the gateway timeout.
+            params: Extra parameters that distinguish otherwise identical prompts.
+        """
+        self._bind_loop()
+        key = make_cache_key(model, contents, params)
+        cacheable = (
+            use_cache
+            and self.cache is not None
+            and endpoint not in self.cache_disabled_endpoints
+        )
+        if cacheable:
+            cached = await asyncio.to_thread(self.cache.get, key, endpoint)
+            if cached is not None:
+                return cached
+
+        flight = self._inflight.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(self._leader(key, model, contents, endpoint, cacheable))
+            # Mark the exception as retrieved even if every waiter already gave up
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            flight = self._inflight[key] = {"task": task, "waiters": 0}
+        else:
+            self.coalesced += 1
+
+        flight["waiters"] += 1
+        deadline = self.timeout if timeout is None else timeout
+        try:
+            # shield: one caller hitting its deadline must not cancel a shared call
+            return await asyncio.wait_for(asyncio.shield(flight["task"]), deadline)
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"Model call for {endpoint} timed out after {deadline:g}s")
+        finally:
+            flight["waiters"] -= 1
+            if flight["waiters"] == 0 and not flight["task"].done():
+                # Nobody is waiting any more: free the slot instead of finishing the call
+                flight["task"].cancel()
+
+    async def stream(
+        self,
+        contents: str,
+        endpoint: str,
+        model: str = DEFAULT_MODEL,
+        use_cache: bool = True,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream generated text chunk by chunk as the model produces it.
+
+        A cached response is replayed as a single chunk, and a completed stream
+        is stored in the cache. Streams are never coalesced; the deadline applies
+        to the whole stream, including time spent waiting for a slot.
+        """
+        self._bind_loop()
+        key = make_cache_key(model, contents)
+        cacheable = (
+            use_cache
+            and self.cache is not None
+            and endpoint not in self.cache_disabled_endpoints
+        )
+        if cacheable:
+            cached = await asyncio.to_thread(self.cache.get, key, endpoint)
+            if cached is not None:
+                yield cached
+                return
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (self.timeout if timeout is None else timeout)
+
+        def remaining() -> float:
+            left = deadline - loop.time()
+            if left <= 0:
+                raise LLMTimeoutError(f"Model stream for {endpoint} timed out")
+            return left
+
+        semaphore = self._endpoint_semaphore(endpoint)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), remaining())
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"Model stream for {endpoint} timed out waiting for a slot")
+        try:
+            try:
+                await asyncio.wait_for(self._global.acquire(), remaining())
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError(f"Model stream for {endpoint} timed out waiting for a slot")
+            try:
+                parts = []
+                chunks = self.backend.stream(model, contents).__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), remaining())
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise LLMTimeoutError(f"Model stream for {endpoint} timed out")
+                    parts.append(chunk)
+                    yield chunk
+            finally:
+                if hasattr(chunks, "aclose"):
+                    await chunks.aclose()
+                self._global.release()
+        finally:
+            semaphore.release()
+
+        if cacheable and parts:
+            await asyncio.to_thread(self.cache.set, key, "".join(parts))
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "in_flight": len(getattr(self, "_inflight", {})),
+            "coalesced": self.coalesced,
+        }
+
+
+def _build_backend():
+    if settings.LLM_BACKEND == "stub":
+        return StubBackend(latency=settings.LLM_STUB_LATENCY_MS / 1000)
+    return GeminiBackend(api_key=settings.GEMINI_API_KEY)
+
+
+# Shared response cache for all model calls
+llm_cache = ResponseCache(
+    settings.LLM_CACHE_PATH,
+    max_memory_entries=settings.LLM_CACHE_MEMORY_ENTRIES,
+    max_disk_bytes=settings.LLM_CACHE_MAX_DISK_MB * 1024 * 1024,
+    default_ttl=settings.LLM_CACHE_TTL_SECONDS,
+)
+
+gateway = LLMGateway(
+    _build_backend(),
+    cache=llm_cache if settings.LLM_CACHE_ENABLED else None,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    endpoint_concurrency=settings.LLM_ENDPOINT_CONCURRENCY,
+    default_endpoint_concurrency=settings.LLM_DEFAULT_ENDPOINT_CONCURRENCY,
+    timeout=settings.LLM_TIMEOUT_SECONDS,
+    cache_disabled_endpoints=settings.LLM_CACHE_DISABLED_ENDPOINTS,
+)
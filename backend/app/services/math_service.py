@@ -1,114 +1,329 @@
-import sympy as sp
-from sympy.parsing.latex import parse_latex
-from sympy.parsing.sympy_parser import parse_expr
-from app.services.ai_service import client
+import asyncio
+import json
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional, Tuple
+from app.core.config import settings
+from app.core.worker_pool import WorkerPool, WorkerTimeoutError
+from app.db import crud
+from app.services.cache_service import ResponseCache
+from app.services.equation_extractor import Equation, extract_equations
+from app.services.units import DimensionError, UnitRegistry, default_registry, symbol_name
+from app.services.llm_gateway import gateway
 from app.schemas.math_schema import (
-    VerifyEquationRequest, DeriveEquationRequest, CheckUnitsRequest
+    VerifyEquationRequest, DeriveEquationRequest, CheckUnitsRequest, VerifyDocumentRequest
 )
 
+# SymPy, NumPy and the LaTeX parser take most of the API's startup time:
+# they are imported on first use instead
+if TYPE_CHECKING:
+    import sympy as sp
+
+# Simplification runs in separate processes so it can be killed when it exceeds its time budget
+math_pool = WorkerPool(settings.MATH_WORKERS)
+
+# Verification results per equation, keyed by the equation's hash
+equation_cache = ResponseCache(settings.MATH_RESULT_CACHE_PATH)
+# Part of the cache key: bump when a change to verification can change results
+EQUATION_RESULT_VERSION = 6
+
 # ---- 1. Equation Verification ----
+def _normalize(expression: str) -> str:
+    return " ".join(expression.split())
+
+def _looks_like_latex(expression: str) -> bool:
+    return any(marker in expression for marker in ("\\", "^", "{", "_"))
+
+@lru_cache(maxsize=settings.MATH_CACHE_SIZE)
+def _parse_normalized(expression: str) -> "sp.Expr":
+    from app.services.latex_math_parser import LaTeXMathSyntaxError, parse_latex_math
+
+    # Plain input (x**2, sin(x), ab) goes through the same parser as LaTeX, so
+    # adjacency and function names mean the same with or without backslashes
+    try:
+        return parse_latex_math(expression)
+    except LaTeXMathSyntaxError:
+        # The ANTLR-based parser is slow to import and call: only used for constructs
+        # the native parser does not cover (integrals, derivatives, limits, ...)
+        from sympy.parsing.latex import parse_latex
+        return parse_latex(expression)
+
+def parse_expression(expression: str) -> "sp.Expr":
+    """Parse LaTeX or plain math into a SymPy expression (memoized)."""
+    return _parse_normalized(_normalize(expression))
+
+@lru_cache(maxsize=settings.MATH_CACHE_SIZE)
+def _simplify_srepr(expr_srepr: str) -> Tuple[str, Optional[bool]]:
+    from app.services import math_tasks
+
+    # WorkerTimeoutError propagates, so lru_cache never memoizes a timeout
+    return math_pool.run(math_tasks.simplify, expr_srepr, timeout=settings.MATH_TIMEOUT_SECONDS)
+
+def simplify_expression(expr: "sp.Expr") -> Tuple[str, Optional[str], Optional[bool]]:
+    """
+    Simplify an expression in a worker process within MATH_TIMEOUT_SECONDS.
+    Returns (status, simplified, is_zero) with status "ok" or "timeout" and
+    is_zero None when undecided; results (not timeouts) are memoized by the
+    expression's structure.
+    """
+    import sympy as sp
+    try:
+        simplified, is_zero = _simplify_srepr(sp.srepr(expr))
+    except WorkerTimeoutError:
+        # Timeouts depend on load, so they are not memoized: the next request tries again
+        return "timeout", None, None
+    return "ok", simplified, is_zero
+
+# Random sample points for the numeric check, and the fewest usable ones for a verdict
+NUMERIC_SAMPLES = 64
+NUMERIC_MIN_SAMPLES = 8
+
+def numeric_equivalence(lhs: "sp.Expr", rhs: "sp.Expr", samples: int = NUMERIC_SAMPLES) -> Optional[bool]:
+    """
+    Compare both sides at random complex points (SymPy symbols are complex by default).
+
+    Returns False if any point disagrees, True if all usable points agree, or None
+    if the check is inconclusive (unsupported functions, too few finite values).
+    """
+    import numpy as np
+    import sympy as sp
+
+    if lhs.has(sp.UnevaluatedExpr) or rhs.has(sp.UnevaluatedExpr):
+        # Numbers the parser left unevaluated (9^{9^{9}}) overflow a float anyway,
+        # and lambdify would compute them as Python integers
+        return None
+    symbols = sorted(lhs.free_symbols | rhs.free_symbols, key=str)
+    rng = np.random.default_rng(0)
+    points = [
+        rng.uniform(0.5, 2.0, samples) * np.exp(1j * rng.uniform(-np.pi, np.pi, samples))
+        for _ in symbols
+    ]
+    terms = sp.Add.make_args(lhs) + sp.Add.make_args(rhs)
+    try:
+        with np.errstate(all="ignore"):
+            left, right, scale = (
+                np.broadcast_to(sp.lambdify(symbols, expr, "numpy")(*points), (samples,)).astype(complex)
+                for expr in (lhs, rhs, sp.Add(*(sp.Abs(term) for term in terms)))
+            )
+    except Exception:
+        return None
+
+    usable = np.isfinite(left) & np.isfinite(right) & np.isfinite(scale)
+    if usable.sum() < NUMERIC_MIN_SAMPLES:
+        return None
+    left, right, scale = left[usable], right[usable], scale[usable]
+    # Relative to the size of the terms, which bounds the rounding error when they cancel
+    return bool(np.all(np.abs(left - right) <= 1e-7 * np.abs(scale)))
+
 def verify_equation(request: VerifyEquationRequest):
+    """
+    Decide lhs == rhs. A numeric check at random points rejects inequivalent pairs
+    immediately; symbolic simplification only runs when the numeric check passes
+    or is inconclusive, and a passed numeric check only decides when
+    simplification is inconclusive too. "method" reports which check decided.
+    """
     try:
-        lhs = parse_latex(request.lhs) if "\\" in request.lhs else parse_expr(request.lhs)
-        rhs = parse_latex(request.rhs) if "\\" in request.rhs else parse_expr(request.rhs)
+        lhs = parse_expression(request.lhs)
+        rhs = parse_expression(request.rhs)
+
+        numeric = numeric_equivalence(lhs, rhs)
+        if numeric is False:
+            return {
+                "equivalent": False, "simplified_lhs": str(lhs), "simplified_rhs": str(rhs),
+                "status": "ok", "method": "numeric",
+            }
 
-        equivalent = sp.simplify(lhs - rhs) == 0
+        status, _, is_zero = simplify_expression(lhs - rhs)
+        if is_zero is False:
+            # Proved non-zero, e.g. a constant difference too small for the numeric check
+            return {
+                "equivalent": False, "simplified_lhs": str(lhs), "simplified_rhs": str(rhs),
+                "status": "ok", "method": "symbolic",
+            }
+        if is_zero is None:
+            # Timed out or not reduced to a decided value: a passed numeric check decides
+            return {
+                "equivalent": bool(numeric), "simplified_lhs": str(lhs), "simplified_rhs": str(rhs),
+                "status": "ok" if numeric or status == "ok" else "timeout",
+                "method": "numeric" if numeric else "symbolic",
+            }
 
+        lhs_status, simplified_lhs, _ = simplify_expression(lhs)
+        rhs_status, simplified_rhs, _ = simplify_expression(rhs)
         return {
-            "equivalent": equivalent,
-            "simplified_lhs": str(sp.simplify(lhs)),
-            "simplified_rhs": str(sp.simplify(rhs))
+            "equivalent": True,
+            "simplified_lhs": simplified_lhs if lhs_status == "ok" else str(lhs),
+            "simplified_rhs": simplified_rhs if rhs_status == "ok" else str(rhs),
+            "status": "ok",
+            "method": "symbolic",
         }
     except Exception as e:
-        return {"equivalent": False, "simplified_lhs": "error", "simplified_rhs": str(e)}
+        return {"equivalent": False, "simplified_lhs": "error", "simplified_rhs": str(e), "status": "error"}
 
 # ---- 2. Derivation Tutor ----
-def derive_equation(request: DeriveEquationRequest):
+async def derive_equation(request: DeriveEquationRequest):
     """
     Use Gemini for natural language derivation steps.
     """
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=(
+    response = await gateway.generate(
+        (
             "Break down the following math expression step by step. "
             "Return a list of derivation steps and the final result.\n\n"
             f"Expression: {request.expression}"
-        )
+        ),
+        endpoint="math.derive_equation"
     )
 
-    text = response.text.strip()
+    text = response.strip()
     steps = text.split("\n")
     return {"steps": steps[:-1], "final_result": steps[-1]}
 
 # ---- 3. Unit Consistency ----
-def check_units(request: CheckUnitsRequest):
-    """
-    Very simple dimensional check using SymPy's units system.
-    """
-    from sympy.physics import units as u
-    from sympy import Symbol
-
-    unit_map = {
-        "F": u.newton,
-        "m": u.kilogram,
-        "a": u.meter / u.second**2,
-        # You can add more mappings here for other variables
-        "E": u.joule,
-        "c": u.c,
-    }
+# Names parse_expr must not turn into SymPy objects when they are physical symbols (E, I, S, N, ...)
+_PLAIN_FUNCTIONS = {"sin", "cos", "tan", "exp", "log", "sqrt", "Abs", "pi"}
+
+def _parse_for_units(side: str) -> "sp.Expr":
+    import sympy as sp
+    from sympy.parsing.sympy_parser import implicit_multiplication, parse_expr, standard_transformations
+    from app.services.latex_math_parser import parse_latex_math
 
-    expr = request.expression.replace("^", "**")
+    side = side.strip()
+    if _looks_like_latex(side):
+        # In physics m(v_1 - v_2) is a product, not a function of the velocities,
+        # and e is the elementary charge (e^{-t/\tau} is still read as exp)
+        return parse_latex_math(side, applied_functions=False, constant_e=False)
+    names = set(re.findall(r"[A-Za-z_]\w*", side)) - _PLAIN_FUNCTIONS
+    local_dict = {name: sp.Symbol(name) for name in names}
+    local_dict["ln"] = sp.log
+    # "m a" and "2 g h" are products
+    transformations = standard_transformations + (implicit_multiplication,)
+    return parse_expr(side, local_dict=local_dict, transformations=transformations)
 
-    # Example: "F = m * a"
+def _compare_units(sides: List["sp.Expr"], registry: UnitRegistry) -> Tuple[bool, str]:
     try:
-        if "=" in expr:
-            lhs_str, rhs_str = expr.split("=")
-            lhs = parse_expr(lhs_str, local_dict=unit_map)
-            rhs = parse_expr(rhs_str, local_dict=unit_map)
-            consistent = sp.simplify(lhs - rhs) == 0
-            return {"consistent": consistent, "details": f"LHS: {lhs}, RHS: {rhs}"}
-        else:
-            return {"consistent": False, "details": "Expression must include '='"}
+        dimensions = [registry.dimension_of(side) for side in sides]
     except Exception as e:
-        return {"consistent": False, "details": str(e)}
+        return False, str(e)
+    consistent = all(d == dimensions[0] for d in dimensions)
+    if len(dimensions) == 2:
+        return consistent, f"LHS: {registry.format(dimensions[0])}, RHS: {registry.format(dimensions[1])}"
+    return consistent, " = ".join(registry.format(d) for d in dimensions)
+
+def _check_expression_units(expression: str, registry: UnitRegistry) -> dict:
+    if "=" not in expression:
+        return {"expression": expression, "consistent": False, "details": "Expression must include '='"}
+    try:
+        sides = [_parse_for_units(side) for side in expression.split("=")]
+    except Exception as e:
+        return {"expression": expression, "consistent": False, "details": str(e)}
+
+    names = {symbol_name(symbol) for side in sides for symbol in side.free_symbols}
+    unknown = registry.unknown(names)
+    if unknown:
+        # Not evidence of an inconsistency: the caller can give their units
+        return {
+            "expression": expression, "consistent": None,
+            "details": f"Unknown symbol(s) {', '.join(unknown)}: pass their units to check this equation",
+        }
+    # Ambiguous symbols (E: energy or electric field) are consistent if any reading is
+    first = None
+    for chosen, interpretation in registry.interpretations(names):
+        consistent, details = _compare_units(sides, interpretation)
+        if chosen:
+            details += " (" + ", ".join(f"{name} as {quantity}" for name, quantity in chosen.items()) + ")"
+        if consistent:
+            return {"expression": expression, "consistent": True, "details": details}
+        first = first or details
+    return {"expression": expression, "consistent": False, "details": first}
+
 def check_units(request: CheckUnitsRequest):
     """
-    Check dimensional consistency using SymPy's units system (works in SymPy <= 1.12).
+    Dimensional consistency of one or more equations ("F = m * a", "E = m c^2").
+    Symbols are looked up in the unit registry (app/data/units.json) extended
+    with request.units, and dimensions are compared as exponent vectors.
     """
-    import sympy as sp
-    from sympy.physics import units as u
-    from sympy.physics.units.systems import SI
-    from sympy.parsing.sympy_parser import parse_expr
-
-    # Map variables directly to SymPy Quantities
-    unit_map = {
-        "F": u.newton,
-        "m": u.kilogram,
-        "a": u.meter / u.second**2,
-        "E": u.joule,
-        "c": u.speed_of_light,
+    try:
+        registry = default_registry.extend(request.units)
+    except DimensionError as e:
+        return {"consistent": False, "details": str(e), "results": []}
+
+    expressions = ([request.expression] if request.expression else []) + (request.expressions or [])
+    if not expressions:
+        return {"consistent": False, "details": "No expression given", "results": []}
+    results = [_check_expression_units(e, registry) for e in expressions]
+    if len(results) == 1:
+        return {**results[0], "results": results}
+    failed = sum(r["consistent"] is False for r in results)
+    passed = sum(r["consistent"] is True for r in results)
+    return {
+        "consistent": False if failed else (True if passed == len(results) else None),
+        "details": f"{passed} of {len(results)} expressions are dimensionally consistent",
+        "results": results,
     }
 
-    expr = request.expression.replace("^", "**")
+# ---- 4. Document Verification ----
+def _verify_step(lhs: str, rhs: str) -> dict:
+    result = verify_equation(VerifyEquationRequest(lhs=lhs, rhs=rhs))
+    return {
+        "lhs": lhs,
+        "rhs": rhs,
+        "equivalent": result["equivalent"],
+        "status": result["status"],
+        "method": result.get("method"),
+        "detail": result["simplified_rhs"] if result["status"] == "error" else None,
+    }
 
-    try:
-        if "=" in expr:
-            lhs_str, rhs_str = expr.split("=")
+async def _verify_block(equation: Equation, slots: asyncio.Semaphore) -> Tuple[List[dict], bool]:
+    key = f"{EQUATION_RESULT_VERSION}:{equation.hash}"
+    cached = await asyncio.to_thread(equation_cache.get, key, "math.verify_document")
+    if cached is not None:
+        return json.loads(cached), True
 
-            lhs = parse_expr(lhs_str.strip(), local_dict=unit_map)
-            rhs = parse_expr(rhs_str.strip(), local_dict=unit_map)
+    async def verify(lhs: str, rhs: str) -> dict:
+        async with slots:
+            return await asyncio.to_thread(_verify_step, lhs, rhs)
 
-            # Compute dimensional expressions using SI system
-            lhs_dim = SI.get_dimensional_expr(lhs)
-            rhs_dim = SI.get_dimensional_expr(rhs)
+    steps = list(await asyncio.gather(*(verify(lhs, rhs) for lhs, rhs in equation.steps)))
+    # Timeouts depend on load, so only definite results are kept
+    if all(step["status"] != "timeout" for step in steps):
+        await asyncio.to_thread(equation_cache.set, key, json.dumps(steps))
+    return steps, False
 
-            consistent = sp.simplify(lhs_dim - rhs_dim) == 0
+async def verify_document(request: VerifyDocumentRequest) -> dict:
+    """
+    Extract every display equation of a document and verify each equality in
+    its chains. Steps run concurrently, at most one per math worker; results
+    are cached per equation so only changed equations are checked again.
+    """
+    content = request.content
+    if content is None:
+        if request.document_id is None or request.supabase_uid is None:
+            raise ValueError("Provide content, or document_id and supabase_uid")
+        document = await asyncio.to_thread(crud.get_document, request.document_id, request.supabase_uid)
+        if document is None:
+            raise LookupError("Document not found or access denied")
+        content = document["content"]
 
-            return {
-                "consistent": consistent,
-                "details": f"LHS: {lhs} → {lhs_dim}, RHS: {rhs} → {rhs_dim}"
-            }
-        else:
-            return {"consistent": False, "details": "Expression must include '='"}
-    except Exception as e:
-        return {"consistent": False, "details": str(e)}
+    equations = extract_equations(content)
+    slots = asyncio.Semaphore(settings.MATH_WORKERS)
+    verified = await asyncio.gather(*(_verify_block(eq, slots) for eq in equations))
+
+    results = []
+    for equation, (steps, cached) in zip(equations, verified):
+        results.append({
+            "kind": equation.kind,
+            "label": equation.label,
+            "start_line": equation.start_line,
+            "end_line": equation.end_line,
+            "start_offset": equation.start,
+            "end_offset": equation.end,
+            "steps": steps,
+            "verified": all(step["equivalent"] for step in steps),
+            "cached": cached,
+        })
+    return {
+        "equations": results,
+        "total": len(results),
+        "verified": sum(r["verified"] for r in results),
+        "cached": sum(r["cached"] for r in results),
+    }
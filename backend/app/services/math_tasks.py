@@ -0,0 +1,18 @@
+"""
+Functions executed in math worker processes (see app.core.worker_pool).
+Keep imports light: this module is imported by every worker on start.
+"""
+from typing import Optional, Tuple
+
+
+def simplify(expr_srepr: str) -> Tuple[str, Optional[bool]]:
+    """
+    Simplify an expression given as sp.srepr(); returns (simplified, is_zero).
+    is_zero is None when the result is neither 0 nor provably non-zero
+    (e.g. a symbolic expression simplify could not reduce).
+    """
+    import sympy as sp
+    simplified = sp.simplify(sp.sympify(expr_srepr))
+    if simplified == 0:
+        return str(simplified), True
+    return str(simplified), False if simplified.is_zero is False else None
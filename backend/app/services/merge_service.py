@@ -0,0 +1,125 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+from app.services.diff_engine import matching_blocks
+
+
+@dataclass
+class MergeChunk:
+    """
+    One region of a three-way merge. For "conflict" chunks, base/a/b hold the
+    competing versions; for all other kinds, lines holds the merged result.
+    """
+    kind: str   # "unchanged", "a", "b", "same", "refined" (token-level merge) or "conflict"
+    lines: List[str] = field(default_factory=list)
+    base: List[str] = field(default_factory=list)
+    a: List[str] = field(default_factory=list)
+    b: List[str] = field(default_factory=list)
+
+
+def _matching_blocks(base: Sequence[str], other: Sequence[str]) -> List[Tuple[int, int, int]]:
+    return matching_blocks(base, other, "histogram")
+
+
+def _sync_regions(base: Sequence[str], a: Sequence[str], b: Sequence[str]):
+    """
+    Regions of base that are unchanged in both a and b, as
+    (base_start, base_end, a_start, a_end, b_start, b_end), ending with an
+    empty sentinel region at the end of all three sequences.
+    """
+    amatches = _matching_blocks(base, a)
+    bmatches = _matching_blocks(base, b)
+    regions = []
+    ia = ib = 0
+    while ia < len(amatches) and ib < len(bmatches):
+        abase, amatch, alen = amatches[ia]
+        bbase, bmatch, blen = bmatches[ib]
+        start = max(abase, bbase)
+        end = min(abase + alen, bbase + blen)
+        if start < end:
+            asub = amatch + (start - abase)
+            bsub = bmatch + (start - bbase)
+            regions.append((start, end, asub, asub + end - start, bsub, bsub + end - start))
+        if abase + alen < bbase + blen:
+            ia += 1
+        else:
+            ib += 1
+    regions.append((len(base), len(base), len(a), len(a), len(b), len(b)))
+    return regions
+
+
+def diff3(base: Sequence[str], a: Sequence[str], b: Sequence[str]) -> List[MergeChunk]:
+    """
+    Three-way merge of two edited versions against their common base.
+    Non-overlapping edits are taken from whichever side made them; overlapping
+    edits that differ become "conflict" chunks.
+    """
+    chunks: List[MergeChunk] = []
+    iz = ia = ib = 0
+    for zmatch, zend, amatch, aend, bmatch, bend in _sync_regions(base, a, b):
+        base_part, a_part, b_part = list(base[iz:zmatch]), list(a[ia:amatch]), list(b[ib:bmatch])
+        if a_part or b_part:
+            if a_part == b_part:
+                chunks.append(MergeChunk("same", lines=a_part))
+            elif a_part == base_part:
+                chunks.append(MergeChunk("b", lines=b_part))
+            elif b_part == base_part:
+                chunks.append(MergeChunk("a", lines=a_part))
+            else:
+                chunks.append(MergeChunk("conflict", base=base_part, a=a_part, b=b_part))
+        if zend > zmatch:
+            chunks.append(MergeChunk("unchanged", lines=list(base[zmatch:zend])))
+        iz, ia, ib = zend, aend, bend
+    return chunks
+
+
+def _tokens(text: str) -> List[str]:
+    # Whitespace runs, words, LaTeX control sequences and single symbols
+    return re.findall(r"\s+|\\[A-Za-z@]+\*?|\w+|[^\w\s]", text)
+
+
+def refine_conflict(chunk: MergeChunk) -> Optional[List[str]]:
+    """
+    Retry a line-level conflict at token level: edits to different words of
+    the same lines merge cleanly. Returns the merged lines, or None if the
+    tokens still conflict.
+    """
+    if not chunk.base:
+        return None
+    merged = diff3(_tokens("".join(chunk.base)), _tokens("".join(chunk.a)), _tokens("".join(chunk.b)))
+    if any(c.kind == "conflict" for c in merged):
+        return None
+    return "".join(t for c in merged for t in c.lines).splitlines(keepends=True)
+
+
+def merge_lines(base_text: str, a_text: str, b_text: str) -> List[MergeChunk]:
+    """
+    Line-level diff3 of three texts, with conflicting hunks refined at token
+    level. Lines keep their line endings so the result joins back losslessly.
+    """
+    chunks = diff3(
+        base_text.splitlines(keepends=True),
+        a_text.splitlines(keepends=True),
+        b_text.splitlines(keepends=True),
+    )
+    for i, chunk in enumerate(chunks):
+        if chunk.kind == "conflict":
+            refined = refine_conflict(chunk)
+            if refined is not None:
+                chunks[i] = MergeChunk("refined", lines=refined)
+    return chunks
+
+
+def _ensure_newline(lines: List[str]) -> List[str]:
+    if lines and not lines[-1].endswith("\n"):
+        return lines[:-1] + [lines[-1] + "\n"]
+    return lines
+
+
+def conflict_markers(chunk: MergeChunk) -> List[str]:
+    """Render a conflict chunk with standard conflict markers."""
+    return (
+        ["<<<<<<< VERSION A\n"] + _ensure_newline(chunk.a)
+        + ["=======\n"] + _ensure_newline(chunk.b)
+        + [">>>>>>> VERSION B\n"]
+    )
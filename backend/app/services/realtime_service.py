@@ -0,0 +1,325 @@
+import asyncio
+import logging
+import uuid
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.db import crud
+
+logger = logging.getLogger(__name__)
+
+# An operation is {"type": "insert", "pos": int, "text": str} or
+# {"type": "delete", "pos": int, "length": int}, with character offsets.
+# Clients send lists of operations that apply one after another.
+Op = dict
+
+
+# ---- Operations ----
+def parse_ops(raw) -> List[Op]:
+    """Validate operations received from a client. Raises ValueError."""
+    if not isinstance(raw, list) or not raw:
+        raise ValueError("ops must be a non-empty list")
+    ops = []
+    for op in raw:
+        if not isinstance(op, dict) or not isinstance(op.get("pos"), int) or op["pos"] < 0:
+            raise ValueError(f"Invalid operation: {op}")
+        if op.get("type") == "insert" and isinstance(op.get("text"), str):
+            if op["text"]:
+                ops.append({"type": "insert", "pos": op["pos"], "text": op["text"]})
+        elif op.get("type") == "delete" and isinstance(op.get("length"), int) and op["length"] >= 0:
+            if op["length"]:
+                ops.append({"type": "delete", "pos": op["pos"], "length": op["length"]})
+        else:
+            raise ValueError(f"Invalid operation: {op}")
+    return ops
+
+
+def apply_ops(content: str, ops: List[Op]) -> str:
+    """Apply operations in order. Raises ValueError if one is out of range."""
+    for op in ops:
+        pos = op["pos"]
+        if op["type"] == "insert":
+            if pos > len(content):
+                raise ValueError(f"Insert position {pos} is past the end of the document")
+            content = content[:pos] + op["text"] + content[pos:]
+        else:
+            if pos + op["length"] > len(content):
+                raise ValueError(f"Delete range {pos}+{op['length']} is past the end of the document")
+            content = content[:pos] + content[pos + op["length"]:]
+    return content
+
+
+def _transform_one(op: Op, other: Op, op_wins_ties: bool) -> List[Op]:
+    """Rewrite a single op so it applies after `other`; may split a delete in two."""
+    if other["type"] == "insert":
+        p, n = other["pos"], len(other["text"])
+        if op["type"] == "insert":
+            if p < op["pos"] or (p == op["pos"] and not op_wins_ties):
+                return [{**op, "pos": op["pos"] + n}]
+            return [op]
+        start, end = op["pos"], op["pos"] + op["length"]
+        if p <= start:
+            return [{**op, "pos": start + n}]
+        if p < end:
+            # The insert landed inside the deleted range: keep it, delete around it
+            return [
+                {"type": "delete", "pos": p + n, "length": end - p},
+                {"type": "delete", "pos": start, "length": p - start},
+            ]
+        return [op]
+
+    q, m = other["pos"], other["length"]
+
+    def shift(x: int) -> int:
+        return x if x <= q else (q if x < q + m else x - m)
+
+    if op["type"] == "insert":
+        return [{**op, "pos": shift(op["pos"])}]
+    start, end = shift(op["pos"]), shift(op["pos"] + op["length"])
+    return [{**op, "pos": start, "length": end - start}] if end > start else []
+
+
+def transform(ops: List[Op], against: List[Op], ops_win_ties: bool = False) -> Tuple[List[Op], List[Op]]:
+    """
+    Transform two concurrent operation lists made against the same text.
+
+    Returns (ops', against'): ops' applies after `against` and against' applies
+    after `ops`, and both orders produce the same text. Ties between inserts at
+    the same position go to `against` unless ops_win_ties is set.
+    """
+    if not ops or not against:
+        return ops, against
+    if len(ops) == 1 and len(against) == 1:
+        return (
+            _transform_one(ops[0], against[0], ops_win_ties),
+            _transform_one(against[0], ops[0], not ops_win_ties),
+        )
+    if len(ops) > 1:
+        head, against = transform(ops[:1], against, ops_win_ties)
+        tail, against = transform(ops[1:], against, ops_win_ties)
+        return head + tail, against
+    ops, head = transform(ops, against[:1], ops_win_ties)
+    ops, tail = transform(ops, against[1:], ops_win_ties)
+    return ops, head + tail
+
+
+# ---- Broker ----
+class InProcessBroker:
+    """
+    Publish/subscribe within one process. A multi-node deployment can swap in a
+    broker with the same interface (e.g. backed by Redis pub/sub).
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Callable[[dict], None]]] = {}
+
+    def subscribe(self, channel: str, callback: Callable[[dict], None]) -> Callable[[], None]:
+        """Register a callback for a channel; returns a function that unsubscribes it."""
+        self._subscribers.setdefault(channel, set()).add(callback)
+
+        def unsubscribe():
+            callbacks = self._subscribers.get(channel)
+            if callbacks is not None:
+                callbacks.discard(callback)
+                if not callbacks:
+                    del self._subscribers[channel]
+
+        return unsubscribe
+
+    async def publish(self, channel: str, message: dict):
+        for callback in list(self._subscribers.get(channel, ())):
+            callback(message)
+
+
+# ---- Sessions ----
+class DocumentSession:
+    """
+    In-memory state of a document being edited live. `revision` counts the
+    operations applied since the session was loaded; `history` keeps the most
+    recent ones so edits made against an older revision can be transformed.
+    """
+
+    def __init__(self, doc_id: int, supabase_uid: str, content: str, version: int):
+        self.doc_id = doc_id
+        self.supabase_uid = supabase_uid
+        self.content = content
+        self.version = version  # stored version the next flush is based on
+        self.conflict = False   # set when the document was changed outside the session
+        self.revision = 0
+        self.history: List[List[Op]] = []
+        self.clients: Set[str] = set()
+        self.unsaved_ops = 0
+        self.lock = asyncio.Lock()
+        self.flush_lock = asyncio.Lock()
+        self.flusher: Optional[asyncio.Task] = None
+
+    @property
+    def channel(self) -> str:
+        return f"document:{self.doc_id}"
+
+    @property
+    def oldest_revision(self) -> int:
+        return self.revision - len(self.history)
+
+
+class StaleRevisionError(Exception):
+    """Raised when an edit is based on a revision older than the kept history."""
+
+
+def _load_document(doc_id: int, supabase_uid: str) -> Optional[Tuple[str, int]]:
+    document = crud.get_document(doc_id, supabase_uid)
+    return (document["content"], document["version"]) if document else None
+
+
+def _save_document(doc_id: int, supabase_uid: str, content: str, expected_version: int) -> int:
+    """Store content over expected_version and return the new version. Raises VersionConflictError."""
+    crud.update_document(doc_id, supabase_uid, None, content, expected_version, checkpoint=False)
+    # update_document leaves the document (and its version) untouched for empty content
+    return expected_version + 1 if content else expected_version
+
+
+class RealtimeManager:
+    """
+    Holds hot documents in memory, applies and fans out edits, and persists
+    each document in batches: after `flush_ops` operations or every
+    `flush_seconds`, and when the last client leaves.
+    """
+
+    def __init__(
+        self,
+        broker=None,
+        flush_ops: int = 50,
+        flush_seconds: float = 2.0,
+        history_limit: int = 1000,
+        load: Callable[[int, str], Optional[Tuple[str, int]]] = _load_document,
+        save: Callable[[int, str, str, int], int] = _save_document,
+    ):
+        self.broker = broker or InProcessBroker()
+        self.flush_ops = flush_ops
+        self.flush_seconds = flush_seconds
+        self.history_limit = history_limit
+        self.load = load
+        self.save = save
+        self.sessions: Dict[int, DocumentSession] = {}
+        self.flushes = 0
+        self._join_lock: Optional[asyncio.Lock] = None
+
+    async def join(self, doc_id: int, supabase_uid: str) -> Tuple[Optional[DocumentSession], str]:
+        """
+        Attach a client to a document, loading it on first use.
+        Returns (session, client_id), or (None, "") if the document is not found.
+        """
+        if self._join_lock is None:
+            self._join_lock = asyncio.Lock()
+        async with self._join_lock:
+            session = self.sessions.get(doc_id)
+            if session is None:
+                document = await asyncio.to_thread(self.load, doc_id, supabase_uid)
+                if document is None:
+                    return None, ""
+                session = self.sessions[doc_id] = DocumentSession(doc_id, supabase_uid, *document)
+                session.flusher = asyncio.create_task(self._flush_periodically(session))
+            elif session.supabase_uid != supabase_uid:
+                return None, ""
+            client_id = uuid.uuid4().hex
+            session.clients.add(client_id)
+            return session, client_id
+
+    async def leave(self, session: DocumentSession, client_id: str):
+        async with self._join_lock:
+            session.clients.discard(client_id)
+            if session.clients:
+                return
+            if session.flusher:
+                session.flusher.cancel()
+            # Persist before dropping the session: a join waiting on the lock
+            # must load the final content, not what was stored before the flush
+            await self.flush(session)
+            self.sessions.pop(session.doc_id, None)
+
+    async def apply(self, session: DocumentSession, client_id: str, base_revision: int, ops: List[Op]) -> int:
+        """
+        Apply a client's ops made against base_revision, broadcast the transformed
+        ops to the other clients and return the new revision.
+        """
+        async with session.lock:
+            if base_revision > session.revision or base_revision < session.oldest_revision:
+                raise StaleRevisionError(
+                    f"Revision {base_revision} is outside the available history "
+                    f"({session.oldest_revision}-{session.revision})"
+                )
+            # Concurrent ops already applied on the server take precedence on ties
+            for applied in session.history[base_revision - session.oldest_revision:]:
+                ops, _ = transform(ops, applied)
+            session.content = apply_ops(session.content, ops)
+            session.revision += 1
+            session.history.append(ops)
+            del session.history[:-self.history_limit]
+            session.unsaved_ops += 1
+            revision = session.revision
+            # Published under the lock so a broker that yields cannot reorder revisions
+            await self.broker.publish(
+                session.channel, {"type": "op", "revision": revision, "ops": ops, "client_id": client_id}
+            )
+
+        if session.unsaved_ops >= self.flush_ops:
+            await self.flush(session)
+        return revision
+
+    async def flush(self, session: DocumentSession):
+        """
+        Write the current content to the database if there are unsaved ops.
+        The write is conditional on the version the session is based on, so
+        an update made elsewhere (e.g. a REST PUT) is never overwritten; the
+        session then stops saving and tells its clients.
+        """
+        async with session.flush_lock:
+            if not session.unsaved_ops or session.conflict:
+                return
+            content, pending = session.content, session.unsaved_ops
+            try:
+                session.version = await asyncio.to_thread(
+                    self.save, session.doc_id, session.supabase_uid, content, session.version
+                )
+            except crud.VersionConflictError as e:
+                session.conflict = True
+                logger.warning("Document %s changed outside its live session; live edits are not saved", session.doc_id)
+                await self.broker.publish(session.channel, {
+                    "type": "error",
+                    "detail": f"{e}; live edits are no longer saved, reload the document",
+                    "client_id": "",
+                })
+                return
+            except Exception:
+                logger.exception("Failed to persist document %s", session.doc_id)
+                return
+            session.unsaved_ops -= pending
+            self.flushes += 1
+
+    async def _flush_periodically(self, session: DocumentSession):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            # Shielded: cancelling this task must not abandon a save in progress,
+            # which keeps flush_lock until the write has finished
+            await asyncio.shield(self.flush(session))
+
+    async def shutdown(self):
+        """Persist every open document (called when the application stops)."""
+        for session in list(self.sessions.values()):
+            if session.flusher:
+                session.flusher.cancel()
+            await self.flush(session)
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self.sessions),
+            "clients": sum(len(s.clients) for s in self.sessions.values()),
+            "unsaved_ops": sum(s.unsaved_ops for s in self.sessions.values()),
+            "flushes": self.flushes,
+        }
+
+
+realtime = RealtimeManager(
+    flush_ops=settings.REALTIME_FLUSH_OPS,
+    flush_seconds=settings.REALTIME_FLUSH_SECONDS,
+    history_limit=settings.REALTIME_HISTORY_LIMIT,
+)
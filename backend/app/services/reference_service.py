@@ -1,38 +1,137 @@
-import requests
+import asyncio
 import re
-from app.schemas.reference_schema import FetchBibtexRequest, CheckBibtexRequest
+from typing import Optional, Tuple
+from app.core.config import settings
+from app.schemas.reference_schema import FetchBibtexRequest, FetchBibtexBatchRequest, CheckBibtexRequest
+from app.services.cache_service import ResponseCache
 
-CROSSREF_API = "https://api.crossref.org/works/"
-ARXIV_API = "http://export.arxiv.org/api/query?id_list="
+# Identifier → BibTeX, shared by all requests; misses are cached too (as "")
+bibtex_cache = ResponseCache(settings.BIBTEX_CACHE_PATH, default_ttl=settings.BIBTEX_CACHE_TTL_SECONDS)
 
-def fetch_bibtex(request: FetchBibtexRequest) -> str:
-    """
-    Fetch BibTeX entry from DOI or arXiv ID.
-    """
-    identifier = request.identifier.strip()
+_ARXIV_ID = re.compile(r"^(?:\d{4}\.\d{4,5}|[a-z-]+(?:\.[A-Z]{2})?/\d{7})(?:v\d+)?$")
+
+class BibtexNotFoundError(LookupError):
+    """Raised when the DOI or arXiv ID does not exist."""
 
-    # DOI handling
+def parse_identifier(identifier: str) -> Tuple[str, str]:
+    """Split a DOI or arXiv ID (with optional doi:/arxiv:/URL prefix) into (kind, id)."""
+    identifier = identifier.strip()
+    lowered = identifier.lower()
+    for prefix in ("https://doi.org/", "http://doi.org/", "doi:"):
+        if lowered.startswith(prefix):
+            identifier, lowered = identifier[len(prefix):], lowered[len(prefix):]
     if identifier.startswith("10."):
-        url = f"https://doi.org/{identifier}"
-        headers = {"Accept": "application/x-bibtex"}
-        r = requests.get(url, headers=headers, timeout=10)
-        if r.status_code == 200:
-            return r.text.strip()
-        else:
-            raise ValueError(f"DOI not found: {identifier}")
-
-    # arXiv handling
-    elif identifier.lower().startswith("arxiv:") or re.match(r"^\d{4}\.\d{4,5}$", identifier):
-        arxiv_id = identifier.replace("arxiv:", "")
-        url = f"http://arxiv.org/bibtex/{arxiv_id}"
-        r = requests.get(url, timeout=10)
-        if r.status_code == 200:
-            return r.text.strip()
-        else:
-            raise ValueError(f"arXiv ID not found: {identifier}")
+        return "doi", lowered  # DOIs are case-insensitive
+    if lowered.startswith("arxiv:"):
+        identifier = identifier[len("arxiv:"):]
+    if _ARXIV_ID.match(identifier):
+        return "arxiv", identifier
+    raise ValueError("Identifier must be a DOI (10.xxxx) or arXiv ID")
+
+# ---- HTTP client ----
+# One pooled client per event loop, created on first use (httpx is slow to import)
+_http = {"loop": None, "client": None}
+
+async def _http_client():
+    import httpx
 
+    loop = asyncio.get_running_loop()
+    if _http["loop"] is not loop:
+        previous = _http["client"]
+        _http["loop"] = loop
+        _http["client"] = httpx.AsyncClient(
+            # Concurrent batches share the pool: waiting for a connection is bounded too
+            timeout=httpx.Timeout(settings.BIBTEX_TIMEOUT_SECONDS, pool=settings.BIBTEX_POOL_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=settings.BIBTEX_CONCURRENCY),
+            follow_redirects=True,
+        )
+        if previous is not None:
+            # Release the previous loop's connections; if that loop is already
+            # closed its transports cannot be closed cleanly and are left to GC
+            try:
+                await previous.aclose()
+            except Exception:
+                pass
+    return _http["client"]
+
+async def close_http_client():
+    client, _http["client"], _http["loop"] = _http["client"], None, None
+    if client is not None:
+        await client.aclose()
+
+async def _download(kind: str, ident: str) -> Optional[str]:
+    """BibTeX text, or None if the identifier does not exist. Other failures raise."""
+    client = await _http_client()
+    if kind == "doi":
+        response = await client.get(
+            settings.BIBTEX_DOI_URL + ident, headers={"Accept": "application/x-bibtex"}
+        )
     else:
-        raise ValueError("Identifier must be a DOI (10.xxxx) or arXiv ID")
+        response = await client.get(settings.BIBTEX_ARXIV_URL + ident)
+    if response.status_code == 404:
+        return None
+    if response.status_code >= 400:
+        raise RuntimeError(f"{kind} lookup for {ident} failed with HTTP {response.status_code}")
+    text = response.text.strip()
+    # doi.org answers unknown content types with an HTML landing page
+    return text if text.startswith("@") else None
+
+async def fetch_bibtex(request: FetchBibtexRequest) -> Tuple[str, bool]:
+    """
+    Fetch the BibTeX entry of a DOI or arXiv ID; returns (bibtex, cached).
+    Results are cached for BIBTEX_CACHE_TTL_SECONDS and unknown identifiers
+    for BIBTEX_NEGATIVE_TTL_SECONDS; network errors are not cached.
+    Raises ValueError for malformed identifiers and BibtexNotFoundError.
+    """
+    kind, ident = parse_identifier(request.identifier)
+    key = f"{kind}:{ident}"
+    cached = await asyncio.to_thread(bibtex_cache.get, key, kind)
+    if cached is not None:
+        if not cached:
+            raise BibtexNotFoundError(f"{'DOI' if kind == 'doi' else 'arXiv ID'} not found: {ident}")
+        return cached, True
+
+    bibtex = await _download(kind, ident)
+    if bibtex is None:
+        await asyncio.to_thread(bibtex_cache.set, key, "", settings.BIBTEX_NEGATIVE_TTL_SECONDS)
+        raise BibtexNotFoundError(f"{'DOI' if kind == 'doi' else 'arXiv ID'} not found: {ident}")
+    await asyncio.to_thread(bibtex_cache.set, key, bibtex)
+    return bibtex, False
+
+async def fetch_bibtex_batch(request: FetchBibtexBatchRequest) -> dict:
+    """
+    Fetch many identifiers concurrently, at most BIBTEX_CONCURRENCY at a time.
+    Results keep the request order; failures are reported per identifier.
+    """
+    slots = asyncio.Semaphore(settings.BIBTEX_CONCURRENCY)
+
+    async def fetch_one(identifier: str) -> dict:
+        async with slots:
+            try:
+                bibtex, cached = await fetch_bibtex(FetchBibtexRequest(identifier=identifier))
+                return {"identifier": identifier, "bibtex": bibtex, "cached": cached, "error": None}
+            except Exception as e:
+                detail = str(e) or type(e).__name__
+                return {"identifier": identifier, "bibtex": None, "cached": False, "error": detail}
+
+    def normalized(identifier: str) -> str:
+        try:
+            return ":".join(parse_identifier(identifier))
+        except ValueError:
+            return identifier
+
+    # Identifiers naming the same entry (e.g. "doi:10.1/X" and "10.1/x") are fetched once
+    keys = [normalized(i) for i in request.identifiers]
+    first = {}
+    for identifier, key in zip(request.identifiers, keys):
+        first.setdefault(key, identifier)
+    fetched = dict(zip(first, await asyncio.gather(*(fetch_one(i) for i in first.values()))))
+    results = [{**fetched[key], "identifier": identifier} for identifier, key in zip(request.identifiers, keys)]
+    return {
+        "results": results,
+        "found": sum(r["bibtex"] is not None for r in results),
+        "cached": sum(r["cached"] for r in results),
+    }
 
 def check_bibtex(request: CheckBibtexRequest) -> dict:
     """
@@ -0,0 +1,166 @@
+import itertools
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    import sympy as sp
+
+UNITS_FILE = Path(__file__).resolve().parent.parent / "data" / "units.json"
+
+# A dimension is a tuple of integer exponents over the registry's base dimensions
+Dimension = Tuple[int, ...]
+
+# A quantity name, several quantity names, or base exponents
+SymbolSpec = Union[str, List[str], Mapping[str, int]]
+
+
+@lru_cache(maxsize=None)
+def _transcendental() -> tuple:
+    """Functions whose argument must be dimensionless and whose value is dimensionless."""
+    import sympy as sp
+    return (
+        sp.sin, sp.cos, sp.tan, sp.sec, sp.csc, sp.cot, sp.asin, sp.acos, sp.atan,
+        sp.sinh, sp.cosh, sp.tanh, sp.exp, sp.log,
+    )
+
+
+class DimensionError(ValueError):
+    """Raised for dimensionally inconsistent or unknown parts of an expression."""
+
+
+def symbol_name(symbol: "sp.Symbol") -> str:
+    # Subscripted LaTeX names arrive as "k_{B}"
+    return symbol.name.replace("{", "").replace("}", "")
+
+
+class UnitRegistry:
+    """
+    Maps symbol names to dimensions. Quantities (e.g. "force") name a dimension,
+    symbols (e.g. "F") refer to a quantity or give exponents directly. A symbol
+    with several common meanings lists its quantities (E: energy or electric
+    field); dimension_of uses the first, interpretations() yields each.
+    """
+
+    def __init__(self, base, quantities: Mapping[str, Mapping[str, int]], symbols: Mapping[str, SymbolSpec]):
+        self.base = tuple(base)
+        self.quantities: Dict[str, Dimension] = {
+            name: self.vector(exponents) for name, exponents in quantities.items()
+        }
+        self.symbols: Dict[str, Dimension] = {}
+        self.meanings: Dict[str, Tuple[str, ...]] = {}
+        self._add_symbols(symbols)
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path] = UNITS_FILE) -> "UnitRegistry":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["base"], data["quantities"], data["symbols"])
+
+    def vector(self, exponents: Mapping[str, int]) -> Dimension:
+        unknown = set(exponents) - set(self.base)
+        if unknown:
+            raise DimensionError(f"Unknown base dimension(s): {', '.join(sorted(unknown))}")
+        return tuple(int(exponents.get(b, 0)) for b in self.base)
+
+    def _add_symbols(self, symbols: Mapping[str, SymbolSpec]):
+        for name, spec in symbols.items():
+            self.meanings.pop(name, None)
+            if isinstance(spec, (str, list)):
+                names = [spec] if isinstance(spec, str) else spec
+                for quantity in names:
+                    if quantity not in self.quantities:
+                        raise DimensionError(f"Unknown quantity '{quantity}' for symbol '{name}'")
+                self.symbols[name] = self.quantities[names[0]]
+                if len(names) > 1:
+                    self.meanings[name] = tuple(names)
+            else:
+                self.symbols[name] = self.vector(spec)
+
+    def extend(self, symbols: Optional[Mapping[str, SymbolSpec]]) -> "UnitRegistry":
+        """Return a copy with extra or overridden symbols (e.g. from one request)."""
+        if not symbols:
+            return self
+        registry = UnitRegistry.__new__(UnitRegistry)
+        registry.base, registry.quantities = self.base, self.quantities
+        registry.symbols = dict(self.symbols)
+        registry.meanings = dict(self.meanings)
+        registry._add_symbols(symbols)
+        return registry
+
+    def unknown(self, names: Iterable[str]) -> List[str]:
+        return sorted(set(names) - set(self.symbols))
+
+    def interpretations(self, names: Iterable[str]) -> Iterator[Tuple[Dict[str, str], "UnitRegistry"]]:
+        """
+        (chosen meanings, registry) for every combination of meanings of the
+        ambiguous symbols among names; a single unchanged registry if there are none.
+        """
+        ambiguous = sorted(set(names) & set(self.meanings))
+        for choice in itertools.product(*(self.meanings[name] for name in ambiguous)):
+            chosen = dict(zip(ambiguous, choice))
+            yield chosen, self.extend(chosen)
+
+    @property
+    def dimensionless(self) -> Dimension:
+        return (0,) * len(self.base)
+
+    def format(self, dimension: Dimension) -> str:
+        parts = [b if e == 1 else f"{b}^{e}" for b, e in zip(self.base, dimension) if e]
+        return "·".join(parts) or "dimensionless"
+
+    def dimension_of(self, expr: "sp.Expr") -> Dimension:
+        """
+        Dimension of an expression as exponent-vector arithmetic. Raises
+        DimensionError for unknown symbols or inconsistent sums/arguments.
+        """
+        import sympy as sp
+        if expr.is_Number or expr in (sp.pi, sp.E, sp.I):
+            return self.dimensionless
+        if expr.is_Symbol:
+            name = symbol_name(expr)
+            if name not in self.symbols:
+                raise DimensionError(f"Unknown symbol '{name}'")
+            return self.symbols[name]
+        if expr.is_Add:
+            dimensions = [self.dimension_of(term) for term in expr.args]
+            for term, dimension in zip(expr.args[1:], dimensions[1:]):
+                if dimension != dimensions[0]:
+                    raise DimensionError(
+                        f"Cannot add {self.format(dimensions[0])} ({expr.args[0]}) "
+                        f"and {self.format(dimension)} ({term})"
+                    )
+            return dimensions[0]
+        if expr.is_Mul:
+            total = self.dimensionless
+            for factor in expr.args:
+                total = tuple(a + b for a, b in zip(total, self.dimension_of(factor)))
+            return total
+        if expr.is_Pow:
+            base, exponent = expr.args
+            if base.is_Symbol and base.name == "e" and not exponent.is_Number:
+                # e^{-t/\tau}: the exponential, even where e alone is the elementary charge
+                return self.dimension_of(sp.exp(exponent))
+            dimension = self.dimension_of(base)
+            if not any(dimension):
+                if any(self.dimension_of(exponent)):
+                    raise DimensionError(f"Exponent {exponent} must be dimensionless")
+                return dimension
+            if not exponent.is_Rational:
+                raise DimensionError(f"Exponent {exponent} of a dimensional quantity must be a number")
+            scaled = [e * exponent for e in dimension]
+            if not all(s.is_Integer for s in scaled):
+                raise DimensionError(f"({self.format(dimension)})^{exponent} has a fractional dimension")
+            return tuple(int(s) for s in scaled)
+        if isinstance(expr, sp.Abs):
+            return self.dimension_of(expr.args[0])
+        if isinstance(expr, _transcendental()):
+            for argument in expr.args:
+                if any(self.dimension_of(argument)):
+                    raise DimensionError(f"Argument of {expr.func.__name__} must be dimensionless, got {self.format(self.dimension_of(argument))}")
+            return self.dimensionless
+        raise DimensionError(f"Unsupported expression for dimensional analysis: {expr}")
+
+
+default_registry = UnitRegistry.from_file()
@@ -0,0 +1,57 @@
+"""
+Benchmark the native LaTeX math parser against SymPy's ANTLR-based parse_latex.
+
+Run from the backend directory:  python -m benchmarks.latex_parser
+(parse_latex needs antlr4-python3-runtime==4.11; without it only the native parser is timed.)
+"""
+import time
+import sympy as sp
+from app.services.latex_math_parser import parse_latex_math
+
+EXPRESSIONS = [
+    r"\frac{1}{2} m v^2",
+    r"\sin^2 x + \cos^2 x",
+    r"\left(a+b\right)^2 - 2ab",
+    r"\sqrt{x^2 + y^2}",
+    r"\frac{n(n+1)}{2}",
+    r"e^{-\frac{(x-\mu)^2}{2\sigma^2}}",
+    r"\log_2 8 + \ln x",
+    r"\sum_{i=1}^{n} i^2",
+    r"\binom{n}{k} p^k (1-p)^{n-k}",
+    r"|x - y| + \alpha_1 \beta_{12}",
+]
+ROUNDS = 200
+
+
+def _time(parse) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for expression in EXPRESSIONS:
+            parse(expression)
+    return (time.perf_counter() - start) / (ROUNDS * len(EXPRESSIONS))
+
+
+def main():
+    native = _time(parse_latex_math)
+    print(f"native parser:  {native * 1e6:8.1f} us/expression")
+
+    try:
+        start = time.perf_counter()
+        from sympy.parsing.latex import parse_latex
+        parse_latex("x")
+        print(f"parse_latex import + first call: {(time.perf_counter() - start) * 1e3:.0f} ms")
+        antlr = _time(parse_latex)
+    except ImportError as e:
+        print(f"parse_latex unavailable ({e})")
+        return
+    print(f"parse_latex:    {antlr * 1e6:8.1f} us/expression")
+    print(f"speed-up:       {antlr / native:8.1f}x")
+
+    # parse_latex builds unevaluated expressions, so compare mathematically
+    for expression in EXPRESSIONS:
+        if sp.simplify(parse_latex_math(expression) - parse_latex(expression).doit()) != 0:
+            print(f"results differ for {expression}: {parse_latex_math(expression)} vs {parse_latex(expression)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+FenceStripper must give the same result as the regex cleaners it replaced,
+however the model output is split into streamed chunks.
+
+Run from backend/: python -m pytest tests
+"""
+import itertools
+import random
+import re
+
+import pytest
+
+from app.services.ai_service import FenceStripper
+
+# The one-shot cleaners FenceStripper replaced (process_gemini_output and clean_code_blocks)
+REFERENCE = {
+    "line": lambda text: re.sub(r"```[\s\S]*?\n|```", "", text, flags=re.MULTILINE).strip(),
+    "word": lambda text: re.sub(r"```(?:\w+)?\s*|```", "", text).strip(),
+    None: lambda text: text.strip(),
+}
+
+SAMPLES = [
+    "```latex\n\\section{Intro}\n```",
+    "```\n\\alpha + \\beta\n```\n",
+    "  ```python\nprint(1)\n```  \n",
+    "``` x = 1\nrest",
+    "```no newline after fence",
+    "text ```inline``` text",
+    "```latex```",
+    "````\nfour backticks",
+    "`` two `` and ` one `",
+    "```a```b\nc",
+    "```\t \nafter whitespace",
+    "```latex   \n\n  body  \n\n```\n\n",
+    "before\n```json\n{\"a\": 1}\n```\nafter",
+    "```latex_2 body",
+    "\n\n   \n",
+    "",
+]
+
+
+def _stream(mode, chunks):
+    stripper = FenceStripper(mode)
+    return "".join(stripper.feed(chunk) for chunk in chunks) + stripper.finish()
+
+
+def _splits(text, cuts):
+    """All ways of cutting text into cuts + 1 chunks (empty chunks included)."""
+    for points in itertools.combinations_with_replacement(range(len(text) + 1), cuts):
+        bounds = (0,) + points + (len(text),)
+        yield [text[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+@pytest.mark.parametrize("mode", list(REFERENCE))
+@pytest.mark.parametrize("text", SAMPLES)
+def test_matches_regex_for_every_two_and_three_chunk_split(mode, text):
+    expected = REFERENCE[mode](text)
+    for cuts in (1, 2):
+        for chunks in _splits(text, cuts):
+            assert _stream(mode, chunks) == expected, chunks
+
+
+@pytest.mark.parametrize("mode", ["line", "word"])
+def test_fence_split_across_chunks(mode):
+    chunks = ["``", "`python\n", "x = 1\n", "`", "``"]
+    assert _stream(mode, chunks) == REFERENCE[mode]("".join(chunks))
+
+
+@pytest.mark.parametrize("mode", ["line", "word"])
+def test_fence_without_language_followed_by_text(mode):
+    text = "``` first line\nsecond line\n```"
+    assert _stream(mode, [text]) == REFERENCE[mode](text)
+    assert _stream(mode, list(text)) == REFERENCE[mode](text)
+
+
+@pytest.mark.parametrize("mode", list(REFERENCE))
+def test_matches_regex_for_random_text_and_splits(mode):
+    rng = random.Random(1234)
+    tokens = ["`", "``", "```", "latex", "a", "_", " ", "\t", "\n", "x\n", "é"]
+    for _ in range(2000):
+        text = "".join(rng.choice(tokens) for _ in range(rng.randint(0, 16)))
+        points = sorted(rng.randint(0, len(text)) for _ in range(rng.randint(0, 6)))
+        bounds = [0] + points + [len(text)]
+        chunks = [text[a:b] for a, b in zip(bounds, bounds[1:])]
+        assert _stream(mode, chunks) == REFERENCE[mode](text), chunks
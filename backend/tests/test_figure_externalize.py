@@ -0,0 +1,79 @@
+"""
+Externalized figures must not move the lines of the document: pdflatex
+reports errors as "l.<line>" of the compiled source, and users look that
+line up in the source they wrote.
+
+Run from backend/: python -m pytest tests
+"""
+import re
+
+import pytest
+
+from app.services import compile_service
+
+DOCUMENT = r"""\documentclass{article}
+\usepackage{tikz}
+\begin{document}
+Before the figure.
+\begin{center}
+\begin{tikzpicture}
+  \draw (0,0) -- (1,1);
+  \node at (0,1) {a};
+\end{tikzpicture} after
+\end{center}
+Inline \begin{tikzpicture}\draw (0,0) circle (1);\end{tikzpicture} picture.
+
+\begin{tikzpicture}
+  \fill (0,0) circle (2pt);
+\end{tikzpicture}
+\undefinedmacro
+\end{document}
+"""
+
+
+@pytest.fixture
+def externalized(monkeypatch):
+    monkeypatch.setattr(compile_service, "render_figure", lambda preamble, picture: "/cache/figure-0123.pdf")
+    return compile_service.externalize_figures(DOCUMENT)
+
+
+def _line_of(text: str, needle: str) -> int:
+    return text[:text.index(needle)].count("\n") + 1
+
+
+def test_pictures_are_replaced(externalized):
+    assert "tikzpicture" not in externalized.split("\\begin{document}")[1]
+    assert externalized.count("\\includegraphics{figure-0123.pdf}") == 3
+    assert "\\usepackage{graphicx}" in externalized
+
+
+def test_log_line_maps_back_to_the_source(externalized):
+    # As in "! Undefined control sequence. l.17 \undefinedmacro"
+    compiled_line = _line_of(externalized, "\\undefinedmacro")
+    log = f"! Undefined control sequence.\nl.{compiled_line} \\undefinedmacro"
+    line = int(re.search(r"^l\.(\d+)", log, re.MULTILINE).group(1))
+    assert DOCUMENT.splitlines()[line - 1] == "\\undefinedmacro"
+    for needle in ("\\begin{document}", "Before the figure.", "after\n\\end{center}", "picture.", "\\end{document}"):
+        assert _line_of(externalized, needle) == _line_of(DOCUMENT, needle)
+
+
+def test_no_paragraph_breaks_are_added(externalized):
+    assert externalized.count("\n\n") == DOCUMENT.count("\n\n")
+
+
+def test_failed_builds_are_not_retried_until_they_expire(monkeypatch, tmp_path):
+    builds = []
+    monkeypatch.setattr(compile_service.settings, "FIGURE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(compile_service, "_build_figure", lambda preamble, picture, key: builds.append(key) or False)
+    monkeypatch.setattr(compile_service, "_failed_figures", {})
+    picture = r"\begin{tikzpicture}\undefined\end{tikzpicture}"
+
+    assert compile_service.render_figure("", picture) is None
+    assert compile_service.render_figure("", picture) is None
+    assert len(builds) == 1
+
+    monkeypatch.setattr(compile_service.settings, "FIGURE_FAILURE_TTL_SECONDS", 0)
+    compile_service._failed_figures.clear()
+    compile_service.render_figure("", picture)
+    compile_service.render_figure("", picture)
+    assert len(builds) == 3
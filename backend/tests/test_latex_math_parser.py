@@ -0,0 +1,98 @@
+"""
+The native LaTeX math parser must read products, functions and constants the
+way they are written in papers.
+
+Run from backend/: python -m pytest tests
+"""
+import time
+
+import pytest
+import sympy as sp
+
+from app.services.latex_math_parser import parse_latex_math
+
+
+def _equivalent(lhs: str, rhs: str) -> bool:
+    difference = parse_latex_math(lhs) - parse_latex_math(rhs)
+    return sp.simplify(difference.doit()) == 0
+
+
+@pytest.mark.parametrize("lhs, rhs", [
+    (r"\sum_{i=1}^{n} i", r"\frac{n(n+1)}{2}"),
+    (r"x(x+1)", r"x^2+x"),
+    (r"2a(b+c)", r"2ab+2ac"),
+    (r"h(h+1)", r"h^2+h"),
+    (r"e^{\ln x}", r"x"),
+    (r"\sin(\sin^{-1} x)", r"x"),
+    (r"\frac12 x", r"x/2"),
+])
+def test_identities(lhs, rhs):
+    assert _equivalent(lhs, rhs)
+
+
+@pytest.mark.parametrize("lhs, rhs", [
+    (r"g(2x)", r"2g(x)"),
+    (r"f(x+y)", r"f(x) + f(y)"),
+])
+def test_function_applications_are_not_products(lhs, rhs):
+    assert not _equivalent(lhs, rhs)
+
+
+def test_adjacency():
+    x, g = sp.Symbol("x"), sp.Function("g")
+    assert parse_latex_math("g(2x)") == g(2 * x)
+    # Only f, g and h directly followed by "(" are functions
+    assert parse_latex_math("g (2x)") == 2 * sp.Symbol("g") * x
+    assert parse_latex_math("n(n+1)") == sp.Symbol("n") * (sp.Symbol("n") + 1)
+    assert parse_latex_math("f(x)", applied_functions=False) == sp.Symbol("f") * x
+
+
+def test_inverse_functions_and_constants():
+    x = sp.Symbol("x")
+    assert parse_latex_math(r"\sin^{-1} x") == sp.asin(x)
+    assert parse_latex_math(r"\cos^2 x") == sp.cos(x) ** 2
+    assert parse_latex_math("e") == sp.E
+    assert parse_latex_math("e_1") == sp.Symbol("e_{1}")
+
+
+def test_single_token_fraction_arguments():
+    a, b = sp.symbols("a b")
+    assert parse_latex_math(r"\frac12") == sp.Rational(1, 2)
+    assert parse_latex_math(r"\frac ab") == a / b
+    assert parse_latex_math(r"\binom52") == 10
+
+
+@pytest.mark.parametrize("text", [r"9^{9^{9}}", r"\frac{1}{9^{9^{9}}} - 1", r"(10^{9})!", r"\binom{10^{9}}{10^{5}}"])
+def test_huge_numbers_are_not_computed(text):
+    start = time.monotonic()
+    expr = parse_latex_math(text)
+    str(expr)
+    assert time.monotonic() - start < 1
+    assert expr.has(sp.UnevaluatedExpr)
+
+
+def test_small_powers_are_evaluated():
+    assert parse_latex_math("2^{10}") == 1024
+    assert parse_latex_math("5!") == 120
+
+
+@pytest.mark.parametrize("plain, latex", [
+    ("ab", r"a \cdot b"),
+    ("ab+ac", r"a(b+c)"),
+    ("x(x+1)", r"x^2+x"),
+    ("sin(x)**2 + cos(x)**2", "1"),
+    ("2**3**2", "512"),
+    ("x**-1", r"\frac{1}{x}"),
+    ("sqrt(4) pi", r"2\pi"),
+    ("1.5e-3", r"\frac{3}{2000}"),
+])
+def test_plain_input_reads_like_latex(plain, latex):
+    assert _equivalent(plain, latex)
+
+
+def test_plain_function_names_are_single_tokens():
+    x = sp.Symbol("x")
+    assert parse_latex_math("sin x cos x") == sp.sin(x) * sp.cos(x)
+    assert parse_latex_math("x_{max}") == sp.Symbol("x_{max}")
+    # Other words are products of letters
+    assert parse_latex_math("sine") == sp.Mul(*sp.symbols("s i n"), sp.E)
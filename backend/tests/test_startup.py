@@ -0,0 +1,53 @@
+"""
+Startup budget for the API process: importing app.main must stay fast and must
+not pull in the heavy dependencies that are loaded on first use.
+
+Run from backend/: python -m pytest tests
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Seconds; generous enough for slow CI machines, far below the eager-import cost
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "1.0"))
+
+LAZY_MODULES = ("sympy", "numpy", "supabase", "requests", "httpx", "google.genai", "app.services.latex_math_parser")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def _import_app() -> dict:
+    env = {
+        "SUPABASE_URL": "http://localhost",
+        "SUPABASE_ANON_KEY": "test",
+        "GOOGLE_CLIENT_ID": "test",
+        "GOOGLE_CLIENT_SECRET": "test",
+        **os.environ,
+        "PYTHONPATH": str(BACKEND_DIR),
+    }
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def test_heavy_dependencies_are_not_imported_at_startup():
+    modules = set(_import_app()["modules"])
+    assert [name for name in LAZY_MODULES if name in modules] == []
+
+
+def test_import_time_budget():
+    # Best of three, so a busy machine does not fail the test
+    seconds = min(_import_app()["seconds"] for _ in range(3))
+    assert seconds < IMPORT_BUDGET_SECONDS, f"import app.main took {seconds:.2f}s"
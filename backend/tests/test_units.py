@@ -0,0 +1,44 @@
+"""
+Dimensional analysis must accept the standard formulas of mechanics and
+electromagnetism, and must not call an equation inconsistent only because
+one of its symbols is unknown.
+
+Run from backend/: python -m pytest tests
+"""
+import pytest
+
+from app.schemas.math_schema import CheckUnitsRequest
+from app.services.math_service import check_units
+
+
+@pytest.mark.parametrize("expression", [
+    "F = m a",
+    "E = m c^2",
+    "V = I R",
+    "F = q E",
+    "F = e E",
+    "E = h f",
+    "U = m g h",
+    "Q = C V",
+    r"F = \frac{e^2}{4 \pi \epsilon_0 r^2}",
+    r"I = I_0 e^{-t/\tau}",
+])
+def test_consistent(expression):
+    result = check_units(CheckUnitsRequest(expression=expression, units={"tau": "time", "I_0": "current"}))
+    assert result["consistent"] is True, result["details"]
+
+
+def test_inconsistent():
+    result = check_units(CheckUnitsRequest(expression="F = m v"))
+    assert result["consistent"] is False
+
+
+def test_unknown_symbols_are_undecided():
+    result = check_units(CheckUnitsRequest(expressions=["F = m a", "F = w"]))
+    assert result["consistent"] is None
+    assert "w" in result["results"][1]["details"]
+
+
+def test_request_units_override_ambiguous_symbols():
+    result = check_units(CheckUnitsRequest(expression="V = I R", units={"V": "volume"}))
+    assert result["consistent"] is False
@@ -108,7 +108,8 @@ export const AIAssistant: React.FC<AIAssistantProps> = ({ onInsertCode }) => {
     
     try {
       const response = await apiService.checkUnits(unitsExpression);
-      const resultText = `Units Consistent: ${response.consistent ? 'Yes' : 'No'}\nDetails: ${response.details}`;
+      const verdict = response.consistent === null ? 'Unknown' : response.consistent ? 'Yes' : 'No';
+      const resultText = `Units Consistent: ${verdict}\nDetails: ${response.details}`;
       setResult(resultText);
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Failed to check units');
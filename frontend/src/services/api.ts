@@ -169,8 +169,8 @@ class ApiService {
     });
   }
 
-  async checkUnits(expression: string): Promise<{ consistent: boolean; details: string }> {
-    return this.request<{ consistent: boolean; details: string }>('/math/check-units', {
+  async checkUnits(expression: string): Promise<{ consistent: boolean | null; details: string }> {
+    return this.request<{ consistent: boolean | null; details: string }>('/math/check-units', {
       method: 'POST',
       body: JSON.stringify({ expression }),
     });
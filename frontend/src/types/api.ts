@@ -2,6 +2,7 @@ export interface Document {
   id: number;
   title: string;
   content: string;
+  version?: number;
 }
 
 export interface DocumentInput {
@@ -66,6 +67,8 @@ export interface VerifyEquationResponse {
   equivalent: boolean;
   simplified_lhs: string;
   simplified_rhs: string;
+  status?: 'ok' | 'timeout' | 'error';
+  method?: 'numeric' | 'symbolic' | null;
 }
 
 export interface DeriveEquationRequest {